@@ -0,0 +1,106 @@
+"""
+Measures latency and MongoDB round trips of the admin appointment details view
+(services.admin_dashboard_full.get_appointment_details_by_id):
+
+- sequential: appointment, user, sub-service, one find_one per required doc, uploaded docs
+- current: two concurrent phases (asyncio.gather) with a single $lookup for required docs
+
+Usage (from backend/):
+    python -m benchmarks.appointment_details --required-docs 8 --repeat 50
+"""
+import argparse
+import asyncio
+from datetime import datetime
+
+from bson import ObjectId
+
+import services.admin_dashboard_full as admin_dashboard_full
+import services.loaders as loaders
+from benchmarks.common import CommandCounter, get_bench_db, time_async, report
+
+COLLECTIONS = ("AppoinmentNew", "users", "sub_services", "required_documents", "uploaded_documents")
+
+
+async def seed(db, required_docs: int) -> str:
+    """Creates one appointment with a user, a sub-service, its required docs and an upload per doc."""
+    user = await db.users.insert_one({"first_name": "Bench", "last_name": "User", "nic": "000000000V"})
+    doc_ids = (await db.required_documents.insert_many([
+        {"doc_name": f"Document {i}", "description": "Synthetic required document"} for i in range(required_docs)
+    ])).inserted_ids
+    sub_service = await db.sub_services.insert_one({
+        "service_name": "Bench Service", "payment_amount": 100.0, "required_docs": doc_ids, "steps": []
+    })
+    appointment = await db.AppoinmentNew.insert_one({
+        "user_id": str(user.inserted_id),
+        "sub_service_id": sub_service.inserted_id,
+        "sub_service_steps": [],
+        "created_at": datetime.now(),
+        "is_fully_completed": False,
+        "payment_status": False,
+        "appointment_confirmed": True
+    })
+    await db.uploaded_documents.insert_many([
+        {
+            "booking_id": str(appointment.inserted_id),
+            "required_doc_id": str(doc_id),
+            "file_name": f"doc_{i}.pdf",
+            "file_path": f"uploads/doc_{i}.pdf",
+            "doc_status": "pending",
+            "uploaded_at": datetime.now()
+        }
+        for i, doc_id in enumerate(doc_ids)
+    ])
+    return str(appointment.inserted_id)
+
+
+async def sequential_details(db, appointment_id: str) -> dict:
+    """The previous implementation: every read awaited one after another."""
+    appointment = await db.AppoinmentNew.find_one({"_id": ObjectId(appointment_id)})
+    user = await db.users.find_one({"_id": ObjectId(appointment["user_id"])})
+    sub_service = await db.sub_services.find_one({"_id": appointment["sub_service_id"]})
+    required_documents = []
+    for doc_id in sub_service["required_docs"]:
+        doc = await db.required_documents.find_one({"_id": doc_id})
+        if doc:
+            required_documents.append(doc)
+    uploaded_documents = [doc async for doc in db.uploaded_documents.find({"booking_id": appointment_id})]
+    return {"appointment": appointment, "user": user, "required": required_documents, "uploaded": uploaded_documents}
+
+
+async def measure(label: str, fn, counter: CommandCounter, repeat: int) -> None:
+    counter.reset()
+    await fn()
+    round_trips = counter.count
+    report(f"{label} [{round_trips} round trips]", await time_async(fn, repeat))
+
+
+async def main(required_docs: int, repeat: int) -> None:
+    counter = CommandCounter()
+    db = get_bench_db(event_listeners=[counter])
+    for name in COLLECTIONS:
+        await db[name].drop()
+
+    # Point the service module at the benchmark database
+    admin_dashboard_full.collection_apointment = db.AppoinmentNew
+    loaders.collection_users = db.users
+    admin_dashboard_full.collection_sub_services = db.sub_services
+    admin_dashboard_full.collection_required_documents = db.required_documents
+    admin_dashboard_full.collection_uploaded_documents = db.uploaded_documents
+
+    try:
+        appointment_id = await seed(db, required_docs)
+        print(f"Appointment with {required_docs} required documents seeded into {db.name}")
+
+        await measure("sequential", lambda: sequential_details(db, appointment_id), counter, repeat)
+        await measure("gather + $lookup", lambda: admin_dashboard_full.get_appointment_details_by_id(appointment_id), counter, repeat)
+    finally:
+        for name in COLLECTIONS:
+            await db[name].drop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--required-docs", type=int, default=8, help="Required documents on the sub-service")
+    parser.add_argument("--repeat", type=int, default=50, help="Timed runs per implementation")
+    args = parser.parse_args()
+    asyncio.run(main(args.required_docs, args.repeat))
@@ -0,0 +1,92 @@
+"""
+Chat message persistence throughput (messages/second) with concurrent senders:
+
+- insert_one: every send_message awaits its own insert (previous behaviour)
+- buffered:   MessageWriteBehind, senders only queue; timed until everything is stored
+- durable:    MessageWriteBehind, every sender waits for its batch to commit
+
+Usage (from backend/):
+    python -m benchmarks.chat_writes --messages 20000 --senders 200
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+from benchmarks.common import get_bench_db
+from services.chat_persistence import MessageWriteBehind
+
+COLLECTION_NAME = "messages"
+
+
+def make_message(sender: int, i: int) -> dict:
+    return {
+        "sender_id": f"user{sender}",
+        "receiver_id": "admin",
+        "content": f"Synthetic message {i} from sender {sender}",
+        "timestamp": datetime.now().isoformat(),
+        "message_type": "text"
+    }
+
+
+async def run_senders(messages: int, senders: int, send) -> None:
+    """Splits `messages` over `senders` concurrent tasks, each sending one message at a time."""
+    per_sender = messages // senders
+
+    async def sender(index: int):
+        for i in range(per_sender):
+            await send(make_message(index, i))
+
+    await asyncio.gather(*(sender(index) for index in range(senders)))
+
+
+async def measure(label: str, collection, messages: int, senders: int, run) -> None:
+    await collection.delete_many({})
+    started = time.perf_counter()
+    await run()
+    elapsed = time.perf_counter() - started
+    stored = await collection.count_documents({})
+    print(f"{label:<12} {stored / elapsed:10.0f} msg/s  ({stored} messages in {elapsed:.2f} s)")
+
+
+async def main(messages: int, senders: int) -> None:
+    db = get_bench_db()
+    collection = db[COLLECTION_NAME]
+    await collection.drop()
+    print(f"{messages} messages from {senders} concurrent senders into {db.name}.{COLLECTION_NAME}")
+
+    async def insert_one():
+        await run_senders(messages, senders, collection.insert_one)
+
+    async def buffered():
+        writer = MessageWriteBehind(lambda: collection)
+
+        async def send(message):
+            await writer.submit(message)
+
+        await run_senders(messages, senders, send)
+        await writer.stop()
+
+    async def durable():
+        writer = MessageWriteBehind(lambda: collection)
+
+        async def send(message):
+            await (await writer.submit(message))
+
+        await run_senders(messages, senders, send)
+        await writer.stop()
+
+    try:
+        await measure("insert_one", collection, messages, senders, insert_one)
+        await measure("buffered", collection, messages, senders, buffered)
+        await measure("durable", collection, messages, senders, durable)
+    finally:
+        await collection.drop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000, help="Total messages to store per run")
+    parser.add_argument("--senders", type=int, default=200, help="Concurrent senders")
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.senders))
@@ -0,0 +1,55 @@
+import os
+import time
+from statistics import mean, median
+from typing import Awaitable, Callable, List
+
+import motor.motor_asyncio
+from dotenv import load_dotenv
+from pymongo import monitoring
+
+load_dotenv()
+
+BENCH_DB_NAME = os.getenv("BENCH_DB_NAME", "SmartGov_bench")
+
+
+def get_bench_db(event_listeners=None):
+    """Returns a handle to the throwaway benchmark database."""
+    client = motor.motor_asyncio.AsyncIOMotorClient(
+        os.getenv("MONGO_URI", "mongodb://localhost:27017"),
+        event_listeners=event_listeners or []
+    )
+    return client[BENCH_DB_NAME]
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts the commands (round trips) the driver sends, e.g. find, aggregate, getMore."""
+
+    def __init__(self):
+        self.count = 0
+
+    def reset(self) -> None:
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+async def time_async(fn: Callable[[], Awaitable], repeat: int) -> List[float]:
+    """Runs `fn` `repeat` times and returns the wall-clock duration of each run in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def report(label: str, timings: List[float]) -> None:
+    """Prints a one-line summary for a set of timings."""
+    print(f"{label:<32} mean={mean(timings):8.2f} ms  median={median(timings):8.2f} ms  min={min(timings):8.2f} ms")
@@ -0,0 +1,89 @@
+"""
+Document accuracy-scoring throughput (documents/second) on synthetic scans:
+
+- inline:        score_document called one after another in this process
+                 (what scoring on the request path would cost the event loop)
+- pool (N procs): the ProcessPoolExecutor used by services.document_scoring,
+                 for N = 1, 2, 4, ... up to the CPU count; also reported per core
+
+No database is needed: the images are written to a temporary directory.
+
+Usage (from backend/):
+    python -m benchmarks.document_scoring --documents 200 --width 2480 --height 3508
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from services.document_images import score_document
+
+
+def make_scan(path: str, width: int, height: int, seed: int) -> None:
+    """A page-sized grayscale 'scan': paper noise, lines of text and an optional blur."""
+    rng = np.random.default_rng(seed)
+    page = rng.normal(235, 8, (height, width)).clip(0, 255).astype(np.uint8)
+    for line in range(40, height - 40, max(60, height // 40)):
+        text = "".join(chr(rng.integers(65, 91)) for _ in range(30))
+        cv2.putText(page, text, (40, line), cv2.FONT_HERSHEY_SIMPLEX, width / 1600, 20, 2)
+    if seed % 3 == 0:
+        page = cv2.GaussianBlur(page, (9, 9), 0)
+    cv2.imwrite(path, page)
+
+
+def pool_sizes(cpus: int):
+    size = 1
+    while size < cpus:
+        yield size
+        size *= 2
+    yield cpus
+
+
+async def score_in_pool(paths, processes: int) -> float:
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        # Warm the worker processes (imports) before timing
+        await asyncio.gather(*(loop.run_in_executor(executor, score_document, paths[0]) for _ in range(processes)))
+        started = time.perf_counter()
+        await asyncio.gather(*(loop.run_in_executor(executor, score_document, path) for path in paths))
+        return time.perf_counter() - started
+
+
+def report(label: str, documents: int, elapsed: float, processes: int) -> None:
+    rate = documents / elapsed
+    print(f"{label:<16} {rate:8.1f} docs/s  {rate / processes:8.1f} docs/s/core  ({elapsed:.2f} s)")
+
+
+async def main(documents: int, width: int, height: int, distinct: int) -> None:
+    cpus = os.cpu_count() or 1
+    with tempfile.TemporaryDirectory() as directory:
+        scans = []
+        for seed in range(min(distinct, documents)):
+            path = os.path.join(directory, f"scan_{seed}.png")
+            make_scan(path, width, height, seed)
+            scans.append(path)
+        paths = [scans[i % len(scans)] for i in range(documents)]
+        print(f"{documents} documents ({len(scans)} distinct {width}x{height} scans), {cpus} CPUs")
+
+        started = time.perf_counter()
+        for path in paths:
+            score_document(path)
+        report("inline", documents, time.perf_counter() - started, 1)
+
+        for processes in pool_sizes(cpus):
+            report(f"pool ({processes} procs)", documents, await score_in_pool(paths, processes), processes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=200, help="Documents to score per run")
+    parser.add_argument("--width", type=int, default=2480, help="Scan width in pixels (A4 at 300 dpi: 2480)")
+    parser.add_argument("--height", type=int, default=3508, help="Scan height in pixels (A4 at 300 dpi: 3508)")
+    parser.add_argument("--distinct", type=int, default=12, help="Distinct scans to generate (reused round-robin)")
+    args = parser.parse_args()
+    asyncio.run(main(args.documents, args.width, args.height, args.distinct))
@@ -0,0 +1,102 @@
+"""
+Compares the two ways of building the weekly appointment counts:
+
+- legacy: ship every matching appointment_date to Python and count with weekday()
+- pipeline: let MongoDB $group by weekday and return at most seven rows
+
+Usage (from backend/):
+    python -m benchmarks.weekly_counts --appointments 50000 --repeat 20
+"""
+import argparse
+import asyncio
+import random
+from datetime import date, datetime, timedelta
+
+from bson import ObjectId
+
+from benchmarks.common import get_bench_db, time_async, report
+from services.insights import _weekly_day_count_pipeline
+
+COLLECTION_NAME = "AppoinmentNew"
+
+
+async def seed(collection, sub_service_id: ObjectId, monday: date, count: int) -> None:
+    """Inserts `count` synthetic appointments spread over the week, plus noise for other services."""
+    docs = []
+    for i in range(count):
+        day = monday + timedelta(days=random.randint(0, 6))
+        docs.append({
+            "user_id": str(ObjectId()),
+            # Roughly one in five appointments belongs to some other sub_service
+            "sub_service_id": sub_service_id if i % 5 else ObjectId(),
+            "appointment_date": datetime.combine(day, datetime.min.time()) + timedelta(minutes=random.randint(0, 1439)),
+            "sub_service_steps": [{"step_id": s, "step_name": f"Step {s}", "status": False, "completed_by": None} for s in range(1, 5)],
+            "is_fully_completed": False,
+            "payment_status": bool(i % 2),
+            "created_at": datetime.now()
+        })
+        if len(docs) == 5000:
+            await collection.insert_many(docs)
+            docs = []
+    if docs:
+        await collection.insert_many(docs)
+    await collection.create_index([("sub_service_id", 1), ("appointment_date", 1)])
+
+
+async def legacy_counts(collection, sub_service_id: ObjectId, start_date: datetime, end_date: datetime) -> dict:
+    """The pre-aggregation implementation: fetch all dates and count in Python."""
+    cursor = collection.aggregate([
+        {"$match": {"sub_service_id": sub_service_id, "appointment_date": {"$gte": start_date, "$lte": end_date}}},
+        {"$project": {"appointment_date": 1}}
+    ])
+    appointments = await cursor.to_list(length=None)
+    day_count_map = {i: 0 for i in range(7)}
+    for appointment in appointments:
+        appointment_date = appointment.get("appointment_date")
+        if isinstance(appointment_date, datetime):
+            day_count_map[appointment_date.weekday()] += 1
+    return day_count_map
+
+
+async def pipeline_counts(collection, sub_service_id: ObjectId, start_date: datetime, end_date: datetime) -> dict:
+    """The current implementation: $group by weekday on the server."""
+    day_count_map = {i: 0 for i in range(7)}
+    async for row in collection.aggregate(_weekly_day_count_pipeline(sub_service_id, start_date, end_date)):
+        day_count_map[int(row["_id"])] = row["count"]
+    return day_count_map
+
+
+async def main(appointments: int, repeat: int) -> None:
+    db = get_bench_db()
+    collection = db[COLLECTION_NAME]
+    await collection.drop()
+
+    sub_service_id = ObjectId()
+    monday = date.today() - timedelta(days=date.today().weekday())
+    start_date = datetime.combine(monday, datetime.min.time())
+    end_date = datetime.combine(monday + timedelta(days=6), datetime.max.time())
+
+    print(f"Seeding {appointments} synthetic appointments into {db.name}.{COLLECTION_NAME} ...")
+    await seed(collection, sub_service_id, monday, appointments)
+
+    try:
+        legacy = await legacy_counts(collection, sub_service_id, start_date, end_date)
+        current = await pipeline_counts(collection, sub_service_id, start_date, end_date)
+        if legacy != current:
+            raise SystemExit(f"Result mismatch: legacy={legacy} pipeline={current}")
+        print(f"Both paths agree: {sum(current.values())} appointments in the week")
+
+        report("legacy (python loop)", await time_async(
+            lambda: legacy_counts(collection, sub_service_id, start_date, end_date), repeat))
+        report("pipeline ($group)", await time_async(
+            lambda: pipeline_counts(collection, sub_service_id, start_date, end_date), repeat))
+    finally:
+        await collection.drop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--appointments", type=int, default=50000, help="Number of synthetic appointments to seed")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed runs per implementation")
+    args = parser.parse_args()
+    asyncio.run(main(args.appointments, args.repeat))
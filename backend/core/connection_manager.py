@@ -1,23 +1,172 @@
+import asyncio
+import logging
+import os
+import time
 from fastapi import WebSocket
-from typing import Dict
+from typing import Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Outbound messages buffered per socket before the overflow policy applies
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "100"))
+# "drop_oldest" | "drop_newest" (keep the queue, lose a message) or "close" (disconnect the slow socket)
+WS_OVERFLOW_POLICY = os.getenv("WS_OVERFLOW_POLICY", "drop_oldest")
+# A single send that takes longer than this closes the socket
+WS_SEND_TIMEOUT_SECONDS = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "10"))
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "close")
+
+# Close code for sockets that cannot keep up ("try again later")
+WS_CLOSE_TRY_AGAIN_LATER = 1013
+
+
+class Connection:
+    """
+    One WebSocket with its own bounded outbound queue and writer task.
+
+    Senders only enqueue, so a slow receiver never blocks them; the writer
+    drains the queue in order and records send latency (time from enqueue to
+    sent) and the deepest the queue has been.
+    """
+
+    __slots__ = ("websocket", "queue", "writer", "sent", "dropped", "max_depth",
+                 "total_latency", "last_latency", "closed")
+
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.writer: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.total_latency = 0.0
+        self.last_latency = 0.0
+        self.closed = False
+
+    def metrics(self) -> dict:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "max_queue_depth": self.max_depth,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "last_send_latency_ms": round(self.last_latency * 1000, 2),
+            "avg_send_latency_ms": round(self.total_latency / self.sent * 1000, 2) if self.sent else 0.0,
+        }
+
 
 class ConnectionManager:
-    def __init__(self):
-        # Stores active connections: {"client_id": websocket_object}
-        self.active_connections: Dict[str, WebSocket] = {}
+    def __init__(self, queue_size: int = WS_SEND_QUEUE_SIZE, overflow_policy: str = WS_OVERFLOW_POLICY,
+                 send_timeout: float = WS_SEND_TIMEOUT_SECONDS):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unsupported WS_OVERFLOW_POLICY: {overflow_policy}")
+        # Stores active connections: {"client_id": {Connection, ...}}
+        # A client_id may be connected from several tabs or devices at once
+        self.active_connections: Dict[str, Set[Connection]] = {}
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        self.send_timeout = send_timeout
+        self.closed_slow = 0
 
     async def connect(self, websocket: WebSocket, client_id: str):
         await websocket.accept()
-        self.active_connections[client_id] = websocket
+        connection = Connection(websocket, self.queue_size)
+        connection.writer = asyncio.create_task(self._write(client_id, connection))
+        self.active_connections.setdefault(client_id, set()).add(connection)
 
-    def disconnect(self, client_id: str):
-        if client_id in self.active_connections:
+    def disconnect(self, client_id: str, websocket: WebSocket = None):
+        """Forgets one socket of client_id, or all of them when websocket is not given."""
+        connections = self.active_connections.get(client_id)
+        if connections is None:
+            return
+        for connection in list(connections):
+            if websocket is None or connection.websocket is websocket:
+                connections.discard(connection)
+                connection.closed = True
+                if connection.writer is not None and connection.writer is not asyncio.current_task():
+                    connection.writer.cancel()
+        if not connections:
             del self.active_connections[client_id]
 
-    async def send_personal_message(self, message: str, client_id: str):
-        if client_id in self.active_connections:
-            websocket = self.active_connections[client_id]
-            await websocket.send_text(message)
+    def is_connected(self, client_id: str) -> bool:
+        return client_id in self.active_connections
+
+    async def send_personal_message(self, message: str, client_id: str) -> int:
+        """
+        Queues message on every socket of client_id without waiting for the sends;
+        each socket's writer task delivers it. A full queue is handled by the
+        overflow policy.
+
+        Returns:
+            int: number of sockets the message was queued for
+        """
+        queued = 0
+        for connection in list(self.active_connections.get(client_id, ())):
+            if self._enqueue(client_id, connection, message):
+                queued += 1
+        return queued
+
+    def _enqueue(self, client_id: str, connection: Connection, message: str) -> bool:
+        item = (message, time.monotonic())
+        if connection.queue.full():
+            if self.overflow_policy == "close":
+                self._close_slow(client_id, connection)
+                return False
+            connection.dropped += 1
+            if self.overflow_policy == "drop_newest":
+                return False
+            connection.queue.get_nowait()
+        connection.queue.put_nowait(item)
+        connection.max_depth = max(connection.max_depth, connection.queue.qsize())
+        return True
+
+    def _close_slow(self, client_id: str, connection: Connection) -> None:
+        """Disconnects a socket that cannot keep up; its client can reconnect and reload history."""
+        if connection.closed:
+            return
+        self.closed_slow += 1
+        logger.warning(f"Closing slow WebSocket of {client_id} "
+                       f"(queue {connection.queue.qsize()}/{self.queue_size})")
+        self.disconnect(client_id, connection.websocket)
+        asyncio.ensure_future(self._close(connection.websocket))
+
+    @staticmethod
+    async def _close(websocket: WebSocket) -> None:
+        try:
+            await websocket.close(code=WS_CLOSE_TRY_AGAIN_LATER)
+        except Exception:
+            pass
+
+    async def _write(self, client_id: str, connection: Connection) -> None:
+        while True:
+            message, enqueued_at = await connection.queue.get()
+            try:
+                await asyncio.wait_for(connection.websocket.send_text(message), self.send_timeout)
+            except asyncio.TimeoutError:
+                self._close_slow(client_id, connection)
+                return
+            except Exception as e:
+                # The socket is gone; the receive loop will see the disconnect too
+                if not connection.closed:
+                    logger.warning(f"WebSocket send to {client_id} failed: {e!r}")
+                    self.disconnect(client_id, connection.websocket)
+                return
+            latency = time.monotonic() - enqueued_at
+            connection.sent += 1
+            connection.last_latency = latency
+            connection.total_latency += latency
+
+    def metrics(self) -> Dict[str, object]:
+        """Queue depth and send latency of every connected socket, by client_id."""
+        connections: Dict[str, List[dict]] = {
+            client_id: [connection.metrics() for connection in client_connections]
+            for client_id, client_connections in self.active_connections.items()
+        }
+        return {
+            "overflow_policy": self.overflow_policy,
+            "queue_size": self.queue_size,
+            "closed_slow": self.closed_slow,
+            "connections": connections,
+        }
 
 # Create a single, shared instance of the manager
-manager = ConnectionManager()
\ No newline at end of file
+manager = ConnectionManager()
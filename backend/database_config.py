@@ -25,6 +25,11 @@ collection_users = db["users"]
 collection_uploaded_documents = db["uploaded_documents"]
 collection_sub_services = db["sub_services"] 
 collection_ratings = db["ratings"]
+collection_appointment_daily_rollups = db["appointment_daily_rollups"]
+collection_conversations = db["conversations"]
+collection_document_jobs = db["document_jobs"]
+collection_document_blobs = db["document_blobs"]
+collection_migrations = db["migrations"]
 
 # JWT Configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-this-in-production")
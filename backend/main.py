@@ -3,11 +3,21 @@ from fastapi import FastAPI
 from starlette.applications import Starlette
 from fastapi.middleware.cors import CORSMiddleware
 
-from database_config import connect_to_mongo, close_mongo_connection, collection_users, db
+from database_config import connect_to_mongo, close_mongo_connection
 from routes.routes import api_router
 
 from routes import chat_web_socket as chat_web_socket_routes
 from services import chat_web_socket
+from services.appointment_rollups import ensure_daily_rollups
+from services.chat_timestamps import ensure_message_timestamps
+from services.conversations import ensure_conversations
+from services.service_catalog import service_catalog
+from services.loaders import RequestLoadersMiddleware
+from services.db_indexes import ensure_indexes
+from services.chat_logging import chat_log
+from services.blob_store import document_store
+from services.document_scoring import document_scoring
+from services.document_previews import document_previews
 
 # Create FastAPI app
 fastapi_app = FastAPI(
@@ -29,6 +39,9 @@ fastapi_app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-request batching/memoising loaders for users, sub-services and required documents
+fastapi_app.add_middleware(RequestLoadersMiddleware)
+
 # Mount Socket.IO under FastAPI so FastAPI startup/shutdown events run reliably
 # Build a root Starlette app and mount socket.io separately to avoid double CORS headers
 root_app = Starlette()
@@ -62,19 +75,67 @@ async def on_startup():
     # Connect to Mongo and ensure indexes that our services expect
     await connect_to_mongo()
     try:
-        if collection_users is not None:
-            # Ensure async index creation (Motor) to avoid sync PyMongo calls in import time
-            await collection_users.create_index("email", unique=True)
-            await collection_users.create_index("nic", unique=True)
-        if db is not None:
-            admins = db["admins"]
-            await admins.create_index("email", unique=True)
-            await admins.create_index("admin_id", unique=True)
+        # Create every index in services.db_indexes.INDEX_REGISTRY (no-op for existing ones)
+        await ensure_indexes()
     except Exception as e:
         # Log and continue; app can still run without indexes in dev
         print(f"Index creation warning: {e}")
 
+    try:
+        # Backfill the insights daily rollups on first start; insights fall back to raw scans until then
+        await ensure_daily_rollups()
+    except Exception as e:
+        print(f"Appointment rollup bootstrap warning: {e}")
+
+    try:
+        # Backfill blob reference counts for documents uploaded before they were kept
+        await document_store.ensure_references()
+    except Exception as e:
+        print(f"Document blob reference backfill warning: {e}")
+
+    try:
+        # Rewrite chat message timestamps stored as client strings as UTC dates (history is ordered on them)
+        await ensure_message_timestamps()
+    except Exception as e:
+        print(f"Chat timestamp backfill warning: {e}")
+
+    try:
+        # Backfill the chat conversation index (last message, unread counters) on first start
+        await ensure_conversations()
+    except Exception as e:
+        print(f"Conversation backfill warning: {e}")
+
+    try:
+        # Warm the catalog snapshot so the first landing-page load does not pay for it
+        await service_catalog.get_snapshot()
+    except Exception as e:
+        print(f"Service catalog warm-up warning: {e}")
+    service_catalog.start_background_refresh()
+    try:
+        await service_catalog.start_invalidation_listener()
+    except Exception as e:
+        print(f"Service catalog relay warning: {e}")
+    chat_log.start()
+    chat_web_socket.presence.start_keepalive()
+    chat_web_socket.presence_sweeper.start()
+    chat_web_socket.message_writer.start()
+    try:
+        await chat_web_socket.chat_bus.start()
+    except Exception as e:
+        print(f"Chat relay warning: {e}")
+    document_scoring.start()
+    document_previews.start()
+
 @fastapi_app.on_event("shutdown")
 async def on_shutdown():
+    await service_catalog.stop_background_refresh()
+    await chat_web_socket.chat_bus.stop()
+    await chat_web_socket.message_writer.stop()
+    await document_scoring.stop()
+    await document_previews.stop()
+    await chat_web_socket.presence_sweeper.stop()
+    await chat_web_socket.typing_coalescer.stop()
+    await chat_web_socket.presence.stop_keepalive()
     await close_mongo_connection()
+    chat_log.stop()
 
@@ -5,6 +5,14 @@ from schemas.admin import AdminLogin, AdminRegister, AdminResponse, AdminToken
 from models import AdminInDB
 from services.admin_auth_service import admin_auth_service
 from dependencies.admin_auth import get_current_admin
+from services.db_indexes import explain_query_shapes
+from services.chat_logging import chat_log
+from services import chat_web_socket
+from core.connection_manager import manager
+from services.blob_store import document_store
+from services.document_scoring import document_scoring
+from services.document_previews import document_previews
+from schemas.chat_schemas import ChatLoggingSettings
 
 router = APIRouter(prefix="/admin", tags=["Admin Authentication"])
 
@@ -53,3 +61,38 @@ async def verify_admin_token(current_admin: AdminInDB = Depends(get_current_admi
             "email": current_admin.email
         }
     }
+
+@router.get("/diagnostics/indexes")
+async def index_diagnostics(current_admin: AdminInDB = Depends(get_current_admin)):
+    """Explain every registered query shape and flag the ones that fall back to a collection scan"""
+    shapes = await explain_query_shapes()
+    return {
+        "collection_scans": sum(1 for shape in shapes if shape["collection_scan"]),
+        "query_shapes": shapes
+    }
+
+@router.get("/diagnostics/chat")
+async def chat_diagnostics(current_admin: AdminInDB = Depends(get_current_admin)):
+    """Chat event counters since startup, typing-indicator suppression counts, /ws send queues and the current chat logging settings"""
+    return {
+        **chat_log.snapshot(),
+        "typing": chat_web_socket.typing_coalescer.stats,
+        "websocket_queues": manager.metrics()
+    }
+
+@router.put("/diagnostics/chat/logging")
+async def update_chat_logging(settings: ChatLoggingSettings, current_admin: AdminInDB = Depends(get_current_admin)):
+    """Change chat log levels and the sampling rate without a restart"""
+    try:
+        return chat_log.configure(**settings.model_dump())
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+
+@router.get("/diagnostics/documents")
+async def document_store_diagnostics(current_admin: AdminInDB = Depends(get_current_admin)):
+    """Uploaded documents: deduplication (distinct blobs, references, bytes stored vs. uploaded) and the accuracy-scoring queue and the preview cache"""
+    return {
+        **await document_store.stats(),
+        "scoring": await document_scoring.queue_stats(),
+        "previews": document_previews.usage()
+    }
@@ -1,7 +1,12 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
+from typing import Optional
+from bson import ObjectId
 
 # Import the service function and the response schema
-from services.admin_dashboard_full import get_appointments_by_sub_service_full, get_appointment_details_by_id, get_appointment_step_details, approve_uploaded_document
+from services.admin_dashboard_full import (
+    get_appointments_by_sub_service_full, get_appointment_details_by_id, get_appointment_step_details, approve_uploaded_document,
+    MAX_APPOINTMENTS_PAGE_SIZE
+)
 from schemas.admin_dashboard_full import AppointmentsFullResponse, AppointmentDetailsResponse, AppointmentStepDetailsResponse, DocumentApprovalResponse
 
 # Create a new router for the admin dashboard full
@@ -11,21 +16,30 @@ router = APIRouter(
 )
 
 @router.get("/appointments_by_subservice/{sub_service_id}", response_model=AppointmentsFullResponse)
-async def get_appointments_by_sub_service_full_route(sub_service_id: str):
+async def get_appointments_by_sub_service_full_route(
+    sub_service_id: str,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_APPOINTMENTS_PAGE_SIZE, description="Page size; omit to get every appointment"),
+    after: Optional[str] = Query(None, description="next_cursor from the previous page")
+):
     """
     Gets full appointment details for a specific sub_service_id where appointment_confirmed is true.
     Includes user names by joining with the users collection.
+    With a limit, results are paginated by _id: pass the returned next_cursor as `after` to get the next page.
+    Without one, every appointment is returned and next_cursor is None.
     
     Args:
         sub_service_id (str): The sub service ID to get appointments for
+        limit (int, optional): Maximum number of appointments in this page
+        after (str, optional): Cursor returned by the previous page
         
     Returns:
         AppointmentsFullResponse: List of appointments with full details including appointment_id, 
-        predicted_duration, all dates, and user name
+        predicted_duration, all dates, and user name, plus the cursor for the next page
     """
-    appointments = await get_appointments_by_sub_service_full(sub_service_id=sub_service_id)
+    if after is not None and not ObjectId.is_valid(after):
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
     
-    return {"appointments": appointments}
+    return await get_appointments_by_sub_service_full(sub_service_id=sub_service_id, limit=limit, after=after)
 
 @router.get("/appointment_details/{appointment_id}", response_model=AppointmentDetailsResponse)
 async def get_appointment_details_by_id_route(appointment_id: str):
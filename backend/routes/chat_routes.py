@@ -14,7 +14,8 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
             data = await websocket.receive_text()
             message_data = json.loads(data)
 
-            # You must call the service function with 'await'
+            # Stores the message and delivers it to the receiver on both
+            # this endpoint and Socket.IO (see services.chat_bus)
             await save_message(
                 sender_id=client_id,
                 receiver_id=message_data["receiver_id"],
@@ -23,11 +24,11 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
                 service_id=message_data["service_id"],
                 message_text=message_data["message_text"]
             )
-
-            await manager.send_personal_message(data, message_data["receiver_id"])
     except WebSocketDisconnect:
-        manager.disconnect(client_id)
         print(f"Client #{client_id} has disconnected.")
+    finally:
+        # Also on malformed frames or a failed save, so the connection and its writer task are released
+        manager.disconnect(client_id, websocket)
 
 
 
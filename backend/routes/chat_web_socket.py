@@ -1,10 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional
 # Corrected: Use absolute imports and import the module itself
 import database_config
 from dependencies.auth import get_current_user
 from dependencies.admin_auth import get_current_admin
 from models import user, AdminInDB, UserInDB
 from services import chat_web_socket
+from services import conversations
+from services.conversations import get_unread_counts
 # --- API Router Setup ---
 router = APIRouter(
     prefix="/chat",
@@ -20,7 +23,7 @@ async def websocket_status():
     """Check WebSocket server status and active connections."""
     try:
         # Get active connections count
-        active_count = len(chat_web_socket.active_connections)
+        active_count = await chat_web_socket.presence.count()
         
         return {
             "status": "running",
@@ -43,7 +46,10 @@ async def websocket_status():
 async def get_chat_history(
     user_id: str,
     current_admin: AdminInDB = Depends(get_current_admin),
-    direction: str = Query("both", description="Filter messages: inbound (user->admin), outbound (admin->user), or both")
+    direction: str = Query("both", description="Filter messages: inbound (user->admin), outbound (admin->user), or both"),
+    limit: int = Query(chat_web_socket.DEFAULT_CHAT_HISTORY_LIMIT, ge=1, le=chat_web_socket.MAX_CHAT_HISTORY_LIMIT, description="Messages per page"),
+    before: Optional[str] = Query(None, description="Cursor from a previous page's 'before' to load older messages"),
+    after: Optional[str] = Query(None, description="Cursor from a previous page's 'after' to load newer messages")
 ):
     """API route to fetch the chat history for a specific user. Admin access only.
 
@@ -51,6 +57,9 @@ async def get_chat_history(
     - inbound: messages sent by the user to admin
     - outbound: messages sent by admin to the user
     - both: all messages either direction (default)
+
+    Returns the newest `limit` messages (oldest first) with cursors for the
+    neighbouring pages.
     """
     db = database_config.db
     collection = db["messages"]
@@ -63,19 +72,44 @@ async def get_chat_history(
     else:
         query = {"$or": [{"sender_id": user_id}, {"receiver_id": user_id}]}
 
-    messages = []
-    async for message in collection.find(query).sort("timestamp", 1):
-        message["_id"] = str(message["_id"]) if "_id" in message else None
-        messages.append(message)
-    return messages
+    try:
+        return await chat_web_socket.get_chat_history_page(collection, query, limit=limit, before=before, after=after)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
 
 
 @router.get("/history/self")
-async def get_my_chat_history(current_user: UserInDB = Depends(get_current_user)):
-    """API route for a user to fetch their own chat history."""
+async def get_my_chat_history(
+    current_user: UserInDB = Depends(get_current_user),
+    limit: int = Query(chat_web_socket.DEFAULT_CHAT_HISTORY_LIMIT, ge=1, le=chat_web_socket.MAX_CHAT_HISTORY_LIMIT, description="Messages per page"),
+    before: Optional[str] = Query(None, description="Cursor from a previous page's 'before' to load older messages"),
+    after: Optional[str] = Query(None, description="Cursor from a previous page's 'after' to load newer messages")
+):
+    """API route for a user to fetch their own chat history, one page at a time."""
     # Prefer NIC as canonical identifier
     user_id = current_user.nic
-    return await chat_web_socket.get_chat_history_service(user_id, database_config.db)
+    try:
+        return await chat_web_socket.get_chat_history_service(user_id, database_config.db, limit=limit, before=before, after=after)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+
+@router.get("/unread/self")
+async def get_my_unread_counts(current_user: UserInDB = Depends(get_current_user)):
+    """API route for a user's unread badges: {peer_id: unread messages}, read from the conversation index."""
+    return await get_unread_counts(current_user.nic)
+
+@router.get("/inbox")
+async def get_chat_inbox(
+    current_admin: AdminInDB = Depends(get_current_admin),
+    limit: int = Query(conversations.DEFAULT_INBOX_LIMIT, ge=1, le=conversations.MAX_INBOX_LIMIT, description="Conversations per page"),
+    before: Optional[str] = Query(None, description="Cursor from a previous page's 'before' to load older conversations")
+):
+    """API route for the admin chat list: conversations by last message time, with preview,
+    unread count and a minimal user profile. Admin access only."""
+    try:
+        return await conversations.get_inbox_page(["admin", str(current_admin.admin_id)], limit=limit, before=before)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
 
 @router.get("/users")
 async def get_chat_users(current_admin: AdminInDB = Depends(get_current_admin)):
@@ -91,6 +125,7 @@ async def test_websocket():
         "available_endpoints": [
             "/api/chat/status",
             "/api/chat/history/self",
+            "/api/chat/inbox",
             "/api/chat/users",
             "/websocket/health"
         ],
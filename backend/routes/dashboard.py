@@ -1,29 +1,47 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from motor.motor_asyncio import AsyncIOMotorClient
 from typing import List
 
 # Import your schemas and database functions
 from schemas.dashboard import main_service_info_response, sub_service_info_response, sub_service_detail_response
 from services import dashboard
-from database_config import db 
+from services.service_catalog import CachedPayload
+from database_config import db
 
 router = APIRouter(
     prefix="/dashboard_services", # Add a prefix for all routes in this file
     tags=["Dashboard Services"]     # Group these endpoints in the API docs
 )
 
+# Browsers may reuse a response for a minute, then revalidate with If-None-Match
+CATALOG_CACHE_CONTROL = "public, max-age=60"
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Checks an If-None-Match header (list, weak validators or *) against an ETag."""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+def _cached_json_response(request: Request, payload: CachedPayload) -> Response:
+    """Returns the pre-serialised body, or 304 Not Modified when the client already has it."""
+    headers = {"ETag": payload.etag, "Cache-Control": CATALOG_CACHE_CONTROL}
+    if _etag_matches(request.headers.get("if-none-match", ""), payload.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=payload.body, media_type="application/json", headers=headers)
+
 # Get all main services for the dashboard
 @router.get("/", response_model=List[main_service_info_response])
-async def get_main_services_list(database: AsyncIOMotorClient = Depends(lambda: db)):
+async def get_main_services_list(request: Request, database: AsyncIOMotorClient = Depends(lambda: db)):
     """
     Provides a list of all main services in the landing page.
     """
-    services = await dashboard.get_all_main_services(database)
-    return services
+    payload = await dashboard.get_main_services_payload()
+    return _cached_json_response(request, payload)
 
-#  Get list of sub-services for a main service 
+#  Get list of sub-services for a main service
 @router.get("/{main_service_id}/subservices", response_model=List[sub_service_info_response])
-async def get_sub_service_list(main_service_id: str, database: AsyncIOMotorClient = Depends(lambda: db)):
+async def get_sub_service_list(main_service_id: str, request: Request, database: AsyncIOMotorClient = Depends(lambda: db)):
     """
     Provides a list of all sub-services available under a specific main service.
     """
@@ -33,27 +51,27 @@ async def get_sub_service_list(main_service_id: str, database: AsyncIOMotorClien
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid main service ID format"
         )
-    
-    sub_services = await dashboard.get_sub_services_for_main_service(database, main_service_id)
-    if sub_services is None:
+
+    payload = await dashboard.get_sub_services_payload(main_service_id)
+    if payload is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Main service with ID {main_service_id} not found or has no sub-services."
         )
-    return sub_services
+    return _cached_json_response(request, payload)
 
 
-# Get details for a specific sub-service 
+# Get details for a specific sub-service
 @router.get("/{main_service_id}/subservices/{sub_service_id}", response_model=sub_service_detail_response)
-async def get_sub_service_detail(main_service_id: str, sub_service_id: str, database: AsyncIOMotorClient = Depends(lambda: db)):
+async def get_sub_service_detail(main_service_id: str, sub_service_id: str, request: Request, database: AsyncIOMotorClient = Depends(lambda: db)):
     """
     Retrieves the full details for a single sub-service, including required
     documents and payment amount.
     """
-    details = await dashboard.get_sub_service_details(database, main_service_id, sub_service_id)
-    if details is None:
+    payload = await dashboard.get_sub_service_details_payload(main_service_id, sub_service_id)
+    if payload is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Sub-service with ID {sub_service_id} not found under main service {main_service_id}."
         )
-    return details
+    return _cached_json_response(request, payload)
@@ -0,0 +1,128 @@
+import mimetypes
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional, Union
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import FileResponse
+
+from dependencies.admin_auth import get_current_admin
+from dependencies.auth import get_current_user, oauth2_scheme
+from models import AdminInDB, UserInDB
+from services.document import get_uploaded_document, user_owns_document
+from services.document_images import UnsupportedDocument
+from services.document_previews import PREVIEW_SIZES, document_previews
+from utils.auth import decode_access_token
+
+router = APIRouter(prefix="/documents", tags=["Documents"])
+
+# Derivatives are named after the content hash, so a URL's bytes never change
+PREVIEW_CACHE_CONTROL = "private, max-age=86400, immutable"
+# Originals are revalidated on every view (access is re-checked) but only re-sent when changed
+DOWNLOAD_CACHE_CONTROL = "private, no-cache"
+
+
+async def _current_requester(token: str = Depends(oauth2_scheme)) -> Union[AdminInDB, UserInDB]:
+    """The admin or user the bearer token belongs to."""
+    token_data = decode_access_token(token)
+    if token_data is not None and token_data.get("role") == "admin":
+        return await get_current_admin(token)
+    return await get_current_user(token)
+
+
+async def _authorized_document(document_id: str, requester: Union[AdminInDB, UserInDB]) -> dict:
+    """The document if the requester is an admin or owns its appointment; 404 otherwise."""
+    document = await get_uploaded_document(document_id)
+    if document is None or (isinstance(requester, UserInDB) and not await user_owns_document(document, requester)):
+        # Same answer for someone else's document as for an unknown id, so ids cannot be probed
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
+    return document
+
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    """True if the client's copy (If-None-Match, else If-Modified-Since) is current."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def file_response(request: Request, path: str, etag: str, media_type: str, cache_control: str,
+                  filename: Optional[str] = None, disposition: str = "inline") -> Response:
+    """
+    Serves a file from disk: 304 when the client's copy is current, otherwise a
+    FileResponse (sent by the server with sendfile/pathsend where available,
+    with Range and If-Range handled by Starlette).
+    """
+    try:
+        stat_result = os.stat(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found on disk")
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+    }
+    if _not_modified(request, etag, stat_result.st_mtime):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return FileResponse(path, media_type=media_type, filename=filename, headers=headers,
+                        stat_result=stat_result, content_disposition_type=disposition)
+
+
+@router.get("/{document_id}/preview")
+async def get_document_preview(
+    document_id: str,
+    request: Request,
+    size: str = Query("thumb", description=f"One of: {', '.join(PREVIEW_SIZES)}"),
+    requester: Union[AdminInDB, UserInDB] = Depends(_current_requester)
+):
+    """Downscaled WebP/JPEG thumbnail or preview (first page for PDFs) of an uploaded document, for admins or its owner"""
+    document = await _authorized_document(document_id, requester)
+    try:
+        path, media_type = await document_previews.get(document, size)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except UnsupportedDocument as e:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=str(e))
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document file not found on disk")
+    etag = f'"{document["sha256"]}-{size}-{document_previews.image_format}"'
+    return file_response(request, path, etag, media_type, PREVIEW_CACHE_CONTROL)
+
+
+@router.get("/{document_id}/file")
+async def download_document(
+    document_id: str,
+    request: Request,
+    download: bool = Query(False, description="Send as an attachment instead of inline"),
+    requester: Union[AdminInDB, UserInDB] = Depends(_current_requester)
+):
+    """
+    An uploaded document as stored, for admins or the owner of its appointment.
+
+    The file is sent by the server (sendfile/pathsend where available), with
+    Range requests, and 304 for If-None-Match (ETag is the content hash) or
+    If-Modified-Since.
+    """
+    document = await _authorized_document(document_id, requester)
+
+    path = document.get("file_path")
+    if not path:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found on disk")
+    filename = document.get("file_name") or os.path.basename(path)
+    media_type = document.get("content_type") or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    if document.get("sha256"):
+        etag = f'"{document["sha256"]}"'
+    else:
+        # Uploaded before hashes were stored
+        etag = f'"{document["_id"]}-{document.get("file_size", 0)}"'
+    return file_response(request, path, etag, media_type, DOWNLOAD_CACHE_CONTROL, filename=filename,
+                         disposition="attachment" if download else "inline")
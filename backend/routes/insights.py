@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from schemas.insights import (
     InsightQuery, InsightDetail, MainServiceQuery, WeeklyInsightQuery, WeeklyMainServiceQuery,
     WeeklyCountQuery, WeeklyMainServiceCountQuery, WeeklyCountResponse
@@ -11,6 +11,9 @@ from services.insights import (
     get_weekly_appointment_counts,
     get_weekly_appointment_counts_main_service
 )
+from services.service_catalog import service_catalog
+from dependencies.admin_auth import get_current_admin
+from models import AdminInDB
 from datetime import date
 
 router = APIRouter(prefix="/insights", tags=["insights"])
@@ -87,10 +90,18 @@ async def get_weekly_counts_mainservice(query: WeeklyMainServiceCountQuery):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-
-
-
-
-
-
-
+@router.post("/catalog-cache/invalidate")
+async def invalidate_catalog_cache(current_admin: AdminInDB = Depends(get_current_admin)):
+    """
+    POST endpoint to drop the cached catalog snapshot (membership index, dashboard responses and
+    their ETags) on every worker after catalog changes. Admin access only.
+    """
+    try:
+        await service_catalog.invalidate_everywhere()
+    except Exception as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Catalog cache invalidated on this worker only; other workers refresh within "
+                   f"{int(service_catalog.ttl_seconds)} s: {str(e)}"
+        )
+    return {"message": "Service catalog cache invalidated"}
@@ -12,6 +12,7 @@ from .admin import router as admin_router  # Commented out due to missing depend
 from .dashboard import router as dashboard_router
 from .appoinment import router as appointment_router
 from .document import router as document_router
+from .document_files import router as document_files_router
 
 # Analytics & Insights
 from .insights import router as insights_router
@@ -50,6 +51,7 @@ api_router.include_router(admin_router)  # Commented out due to missing dependen
 api_router.include_router(dashboard_router)
 api_router.include_router(appointment_router)
 api_router.include_router(document_router)
+api_router.include_router(document_files_router)
 
 # Analytics & Insights
 api_router.include_router(insights_router)
@@ -10,7 +10,7 @@ router = APIRouter(tags=["WebSocket"])
 async def get_websocket_connections():
     """Get all active WebSocket connections."""
     try:
-        connections = chat_web_socket.active_connections
+        connections = await chat_web_socket.presence.all()
         return {
             "status": "success",
             "active_connections": len(connections),
@@ -23,19 +23,14 @@ async def get_websocket_connections():
 async def get_websocket_rooms():
     """Get all WebSocket rooms and their members."""
     try:
-        # Get rooms from the socket.io manager
-        sio = chat_web_socket.sio
-        admin_room = sio.manager.get_participants(sio.namespace, "admin_room")
-        user_room = sio.manager.get_participants(sio.namespace, "user_room")
-        general_room = sio.manager.get_participants(sio.namespace, "general_room")
+        # Get rooms from the shared presence store (covers sockets on every worker)
+        rooms = {}
+        for room in ("admin_room", "user_room", "general_room"):
+            rooms[room] = [member["sid"] for member in await chat_web_socket.presence.room_members(room)]
         
         return {
             "status": "success",
-            "rooms": {
-                "admin_room": list(admin_room),
-                "user_room": list(user_room),
-                "general_room": list(general_room)
-            }
+            "rooms": rooms
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting rooms: {str(e)}")
@@ -29,6 +29,7 @@ class AppointmentFull(BaseModel):
 
 class AppointmentsFullResponse(BaseModel):
     appointments: List[AppointmentFull]
+    next_cursor: Optional[str] = None  # Pass as `after` to fetch the next page; None on the last page
 
 class RequiredDocument(BaseModel):
     doc_id: str = Field(alias="_id")
@@ -45,6 +46,9 @@ class UploadedDocument(BaseModel):
     user_id: str
     file_name: str
     file_path: str
+    download_url: Optional[str] = None
+    thumbnail_url: Optional[str] = None
+    preview_url: Optional[str] = None
     accuracy: Optional[float] = None
     doc_status: str
     uploaded_at: datetime
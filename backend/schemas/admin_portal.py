@@ -102,6 +102,8 @@ class DocumentItem(BaseModel):
     name: str                     # From required_documents
     description: Optional[str]    # From required_documents
     view_link: Optional[str]      # Uploaded document link
+    download_url: Optional[str] = None   # Original file (GET /documents/{id}/file)
+    thumbnail_url: Optional[str] = None  # Downscaled preview (GET /documents/{id}/preview)
     accuracy: Optional[float]     # Accuracy %, None if not uploaded
     status: Optional[str]         # e.g., "Uploaded", "Pending"
 
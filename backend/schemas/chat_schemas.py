@@ -1,4 +1,6 @@
-from pydantic import BaseModel
+from typing import Optional
+
+from pydantic import BaseModel, Field
 
 
 class ChatMessage(BaseModel):
@@ -8,4 +10,10 @@ class ChatMessage(BaseModel):
     service_id: str
 
 class MarkAsReadPayload(BaseModel):
-    sender_id: str
\ No newline at end of file
+    sender_id: str
+
+
+class ChatLoggingSettings(BaseModel):
+    level: Optional[str] = Field(None, description="Chat event log level, e.g. DEBUG, INFO, WARNING")
+    socketio_level: Optional[str] = Field(None, description="Level of the Socket.IO/Engine.IO internal loggers")
+    sample_rate: Optional[float] = Field(None, ge=0, le=1, description="Share of high-volume events that are logged")
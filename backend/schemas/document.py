@@ -15,7 +15,10 @@ class UploadDocumentResponse(BaseModel):
 
 class DocumentUpload(BaseModel):
     document_id: str
-    file_path: str
+    file_path: str  # Download route (GET /documents/{id}/file); the storage path is internal
+    download_url: Optional[str] = None
+    thumbnail_url: Optional[str] = None
+    preview_url: Optional[str] = None
     status: str
     timestamp: datetime
 
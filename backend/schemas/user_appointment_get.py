@@ -18,7 +18,10 @@ class uploaded_document_response(BaseModel):
     required_doc_id: Optional[str] = None  # Can be null/None
     user_id: Optional[str] = None  # Can be null/None
     file_name: Optional[str] = None
-    file_path: Optional[str] = None
+    file_path: Optional[str] = None  # Download route (GET /documents/{id}/file)
+    download_url: Optional[str] = None
+    thumbnail_url: Optional[str] = None
+    preview_url: Optional[str] = None
     accuracy: Optional[float] = None
     doc_status: str
     uploaded_at: Optional[datetime] = None
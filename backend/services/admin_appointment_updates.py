@@ -7,6 +7,7 @@ from schemas.admin_appointment_updates import (
     appointment_steps_update_request,
     appointment_completion_update_request
 )
+from services.appointment_rollups import update_appointment
 
 async def update_appointment_steps(
     db: AsyncIOMotorClient, 
@@ -48,18 +49,17 @@ async def update_appointment_steps(
         
         # Only update if there were actual changes
         if steps_modified:
-            # Update the appointment in the database
-            result = await db.AppoinmentNew.update_one(
-                {"_id": ObjectId(update_request.appointment_id)},
+            # Update the appointment in the database (and the insights daily rollups with it)
+            previous = await update_appointment(
+                ObjectId(update_request.appointment_id),
                 {
-                    "$set": {
-                        "sub_service_steps": current_steps,
-                        "updated_at": datetime.utcnow()
-                    }
-                }
+                    "sub_service_steps": current_steps,
+                    "updated_at": datetime.utcnow()
+                },
+                collection=db.AppoinmentNew
             )
             
-            if result.matched_count == 0:
+            if previous is None:
                 raise ValueError("Appointment not found during update")
             
             return {
@@ -112,13 +112,12 @@ async def update_appointment_completion(
         if update_request.is_fully_completed:
             update_data["completed_at"] = datetime.utcnow()
         
-        # Update the appointment in the database
-        result = await db.AppoinmentNew.update_one(
-            {"_id": ObjectId(update_request.appointment_id)},
-            {"$set": update_data}
+        # Update the appointment in the database (and the insights daily rollups with it)
+        previous = await update_appointment(
+            ObjectId(update_request.appointment_id), update_data, collection=db.AppoinmentNew
         )
         
-        if result.matched_count == 0:
+        if previous is None:
             raise ValueError("Appointment not found during update")
         
         return {
@@ -1,66 +1,165 @@
-from database_config import collection_apointment, collection_users, collection_sub_services, collection_required_documents, collection_uploaded_documents
+from database_config import collection_apointment, collection_sub_services, collection_required_documents, collection_uploaded_documents
+from services.loaders import get_loaders
+from services.document import download_url
+from services.document_previews import preview_url
 from typing import List, Optional, Dict, Any
 from bson import ObjectId
+import asyncio
 
-async def get_appointments_by_sub_service_full(sub_service_id: str):
+# Largest page of the admin appointment list (paging is opt-in: without a limit every appointment is returned)
+MAX_APPOINTMENTS_PAGE_SIZE = 500
+
+def _normalize_appointment_steps(appointment: dict) -> None:
+    """
+    Ensures every entry in sub_service_steps has the fields the response schema requires.
+    """
+    if "sub_service_steps" in appointment and isinstance(appointment["sub_service_steps"], list):
+        for step in appointment["sub_service_steps"]:
+            if not isinstance(step, dict):
+                continue
+            step.setdefault("step_id", 0)
+            step.setdefault("step_name", "Unknown Step")
+            step.setdefault("status", False)
+            step.setdefault("completed_by", None)
+
+async def _get_user_names(user_ids) -> Dict[str, str]:
+    """
+    Resolves appointment user_ids (string form of the user's _id) to display names with a single $in query
+    (through the request's user_names loader: only the name fields, and users already fetched in this request are not fetched again).
+    
+    Returns:
+        dict: user_id string -> "first_name last_name" for every user that was found
+    """
+    object_ids = {ObjectId(user_id) for user_id in user_ids if ObjectId.is_valid(str(user_id))}
+    if not object_ids:
+        return {}
+    
+    user_names = {}
+    for user_doc in await get_loaders().user_names.load_many(object_ids):
+        if not user_doc:
+            continue
+        first_name = user_doc.get("first_name", "")
+        last_name = user_doc.get("last_name", "")
+        user_names[str(user_doc["_id"])] = f"{first_name} {last_name}".strip()
+    return user_names
+
+async def get_appointments_by_sub_service_full(sub_service_id: str, limit: Optional[int] = None, after: Optional[str] = None):
     """
-    Retrieves full appointment details for a specific sub_service_id from MongoDB where appointment_confirmed is true.
-    Includes user names by joining with the users collection.
+    Retrieves one page of full appointment details for a specific sub_service_id from MongoDB where appointment_confirmed is true.
+    Includes user names, fetched for the whole page with one batched query on the users collection.
     
     Args:
         sub_service_id (str): The sub service ID to search for (MongoDB ObjectId as string)
+        limit (int, optional): Maximum number of appointments to return (capped at MAX_APPOINTMENTS_PAGE_SIZE);
+            None returns every matching appointment in one response
+        after (str, optional): The last _id of the previous page; omit for the first page
         
     Returns:
-        list: List of appointment documents with user names, or empty list if no appointments found
+        dict: {"appointments": [...], "next_cursor": str or None}; next_cursor is the _id to pass as
+        `after` to get the following page, or None on the last page
     """
     try:
-        # Convert string to ObjectId and search by sub_service_id and appointment_confirmed = true
-        cursor = collection_apointment.find({
+        if limit is not None:
+            limit = max(1, min(limit, MAX_APPOINTMENTS_PAGE_SIZE))
+        
+        # Search by sub_service_id and appointment_confirmed = true, continuing after the cursor
+        query = {
             "sub_service_id": ObjectId(sub_service_id),
             "appointment_confirmed": True
-        })
+        }
+        if after:
+            query["_id"] = {"$gt": ObjectId(after)}
+        
+        if limit is None:
+            appointments = await collection_apointment.find(query).sort("_id", 1).to_list(None)
+            has_more = False
+        else:
+            # Fetch one extra document to know whether another page exists
+            appointments = await collection_apointment.find(query).sort("_id", 1).limit(limit + 1).to_list(limit + 1)
+            has_more = len(appointments) > limit
+            appointments = appointments[:limit]
         
-        appointments = []
-        async for appointment in cursor:
+        # One round trip for all user names on this page instead of one per appointment
+        user_names = await _get_user_names(appointment["user_id"] for appointment in appointments if "user_id" in appointment)
+        
+        for appointment in appointments:
             # Convert ObjectId to string for JSON serialization
             appointment["_id"] = str(appointment["_id"])  # This will be mapped to appointment_id in the schema
             if "sub_service_id" in appointment:
                 appointment["sub_service_id"] = str(appointment["sub_service_id"])
             
             # Ensure sub_service_steps is properly structured
-            if "sub_service_steps" in appointment and isinstance(appointment["sub_service_steps"], list):
-                # Validate each step has required fields
-                for step in appointment["sub_service_steps"]:
-                    if not isinstance(step, dict):
-                        step = {}
-                    # Ensure all required fields exist
-                    step.setdefault("step_id", 0)
-                    step.setdefault("step_name", "Unknown Step")
-                    step.setdefault("status", False)
-                    step.setdefault("completed_by", None)
-            
-            # Get user details from users collection using user_id (which references user's _id)
-            user_name = "Unknown User"
-            if "user_id" in appointment:
-                try:
-                    # user_id in appointment references the user's _id (ObjectId)
-                    user_doc = await collection_users.find_one({"_id": ObjectId(appointment["user_id"])})
-                    if user_doc:
-                        first_name = user_doc.get("first_name", "")
-                        last_name = user_doc.get("last_name", "")
-                        user_name = f"{first_name} {last_name}".strip()
-                except Exception as e:
-                    print(f"Error fetching user details for user_id {appointment['user_id']}: {e}")
-                    user_name = "Unknown User"
+            _normalize_appointment_steps(appointment)
             
             # Add user_name to appointment data
-            appointment["user_name"] = user_name
-            appointments.append(appointment)
+            appointment["user_name"] = user_names.get(str(appointment.get("user_id")), "Unknown User")
         
-        return appointments
+        return {
+            "appointments": appointments,
+            "next_cursor": appointments[-1]["_id"] if has_more else None
+        }
             
     except Exception as e:
         print(f"Error retrieving appointments: {e}")
+        return {"appointments": [], "next_cursor": None}
+
+async def _get_user_name(user_id) -> str:
+    """
+    Looks up the display name for an appointment's user_id (string form of the user's _id).
+    """
+    if user_id is None:
+        return "Unknown User"
+    try:
+        user_doc = await get_loaders().user_names.load(ObjectId(user_id))
+        if user_doc:
+            first_name = user_doc.get("first_name", "")
+            last_name = user_doc.get("last_name", "")
+            return f"{first_name} {last_name}".strip()
+    except Exception as e:
+        print(f"Error fetching user details for user_id {user_id}: {e}")
+    return "Unknown User"
+
+async def _get_required_documents_for_sub_service(sub_service_id) -> List[Dict[str, Any]]:
+    """
+    Fetches a sub-service's required documents in one round trip ($lookup into required_documents),
+    returned in the order they are listed on the sub-service.
+    """
+    if sub_service_id is None:
+        return []
+    try:
+        result = await collection_sub_services.aggregate([
+            {"$match": {"_id": ObjectId(sub_service_id)}},
+            {"$lookup": {
+                "from": collection_required_documents.name,
+                "localField": "required_docs",
+                "foreignField": "_id",
+                "as": "required_docs_full"
+            }},
+            {"$project": {"_id": 0, "required_docs": 1, "required_docs_full": 1}}
+        ]).to_list(1)
+    except Exception as e:
+        print(f"Error fetching sub-service details: {e}")
+        return []
+    
+    if not result:
+        return []
+    
+    docs_by_id = {doc["_id"]: doc for doc in result[0].get("required_docs_full", [])}
+    required_documents = []
+    for doc_id in result[0].get("required_docs", []):
+        doc_details = docs_by_id.get(doc_id)
+        if doc_details:
+            required_documents.append({**doc_details, "_id": str(doc_details["_id"])})
+    return required_documents
+
+async def _get_uploaded_documents_by_booking(appointment_id: str) -> List[Dict[str, Any]]:
+    """
+    Fetches the raw uploaded document records for an appointment (booking_id is the appointment _id as string).
+    """
+    try:
+        return await collection_uploaded_documents.find({"booking_id": appointment_id}).to_list(None)
+    except Exception as e:
+        print(f"Error fetching uploaded documents: {e}")
         return []
 
 async def get_appointment_details_by_id(appointment_id: str):
@@ -68,6 +167,10 @@ async def get_appointment_details_by_id(appointment_id: str):
     Retrieves complete appointment details for a specific appointment_id.
     Includes user name, required document details, and all uploaded document details.
     
+    Independent reads run concurrently: the appointment and its uploaded documents are fetched
+    together, then the user name and the sub-service's required documents (one $lookup) are
+    fetched together. That is two sequential waits instead of 4 + N.
+    
     Args:
         appointment_id (str): The appointment ID to search for (MongoDB ObjectId as string)
         
@@ -76,8 +179,11 @@ async def get_appointment_details_by_id(appointment_id: str):
         or None if appointment not found
     """
     try:
-        # Get appointment details
-        appointment = await collection_apointment.find_one({"_id": ObjectId(appointment_id)})
+        # Uploaded documents only need the id from the request, so fetch them alongside the appointment
+        appointment, raw_uploaded_documents = await asyncio.gather(
+            collection_apointment.find_one({"_id": ObjectId(appointment_id)}),
+            _get_uploaded_documents_by_booking(appointment_id)
+        )
         
         if not appointment:
             return None
@@ -88,71 +194,36 @@ async def get_appointment_details_by_id(appointment_id: str):
             appointment["sub_service_id"] = str(appointment["sub_service_id"])
         
         # Ensure sub_service_steps is properly structured
-        if "sub_service_steps" in appointment and isinstance(appointment["sub_service_steps"], list):
-            for step in appointment["sub_service_steps"]:
-                if not isinstance(step, dict):
-                    step = {}
-                step.setdefault("step_id", 0)
-                step.setdefault("step_name", "Unknown Step")
-                step.setdefault("status", False)
-                step.setdefault("completed_by", None)
+        _normalize_appointment_steps(appointment)
         
-        # Get user details from users collection
-        user_name = "Unknown User"
-        if "user_id" in appointment:
-            try:
-                user_doc = await collection_users.find_one({"_id": ObjectId(appointment["user_id"])})
-                if user_doc:
-                    first_name = user_doc.get("first_name", "")
-                    last_name = user_doc.get("last_name", "")
-                    user_name = f"{first_name} {last_name}".strip()
-            except Exception as e:
-                print(f"Error fetching user details for user_id {appointment['user_id']}: {e}")
-                user_name = "Unknown User"
+        # User name and required documents depend only on the appointment, not on each other
+        user_name, required_documents = await asyncio.gather(
+            _get_user_name(appointment.get("user_id")),
+            _get_required_documents_for_sub_service(appointment.get("sub_service_id"))
+        )
         
         # Add user_name to appointment data
         appointment["user_name"] = user_name
         
-        # Get sub-service details to get required documents
-        required_documents = []
-        if "sub_service_id" in appointment:
-            try:
-                sub_service = await collection_sub_services.find_one({"_id": ObjectId(appointment["sub_service_id"])})
-                if sub_service and "required_docs" in sub_service:
-                    # Get required document details
-                    for doc_id in sub_service["required_docs"]:
-                        try:
-                            # doc_id in sub_service.required_docs is ObjectId, use it to find in required_documents collection
-                            doc_details = await collection_required_documents.find_one({"_id": doc_id})
-                            if doc_details:
-                                doc_details["_id"] = str(doc_details["_id"])
-                                required_documents.append(doc_details)
-                        except Exception as e:
-                            print(f"Error fetching required document {doc_id}: {e}")
-            except Exception as e:
-                print(f"Error fetching sub-service details: {e}")
-        
-        # Get uploaded documents for this appointment
-        uploaded_documents = []
-        try:
-            # Use booking_id (which is the appointment_id as string) to find uploaded documents
-            cursor = collection_uploaded_documents.find({"booking_id": appointment_id})
-            async for uploaded_doc in cursor:
-                # Map database fields to schema fields
-                mapped_doc = {
-                    "_id": str(uploaded_doc["_id"]),
-                    "appointment_id": uploaded_doc.get("booking_id", ""),  # Map booking_id to appointment_id
-                    "user_id": appointment.get("user_id", ""),  # Use user_id from appointment
-                    "required_doc_id": str(uploaded_doc.get("required_doc_id", "")),
-                    "file_name": uploaded_doc.get("file_name", ""),
-                    "file_path": uploaded_doc.get("file_path", ""),
-                    "accuracy": uploaded_doc.get("accuracy"),
-                    "doc_status": uploaded_doc.get("doc_status", "pending"),
-                    "uploaded_at": uploaded_doc.get("uploaded_at")
-                }
-                uploaded_documents.append(mapped_doc)
-        except Exception as e:
-            print(f"Error fetching uploaded documents: {e}")
+        # Map database fields to schema fields
+        uploaded_documents = [
+            {
+                "_id": str(uploaded_doc["_id"]),
+                "appointment_id": uploaded_doc.get("booking_id", ""),  # Map booking_id to appointment_id
+                "user_id": appointment.get("user_id", ""),  # Use user_id from appointment
+                "required_doc_id": str(uploaded_doc.get("required_doc_id", "")),
+                "file_name": uploaded_doc.get("file_name", ""),
+                # The stored path is internal (a content-addressed blob without name or extension); clients get the download route
+                "file_path": download_url(uploaded_doc["_id"]),
+                "download_url": download_url(uploaded_doc["_id"]),
+                "thumbnail_url": preview_url(uploaded_doc["_id"], "thumb"),
+                "preview_url": preview_url(uploaded_doc["_id"], "preview"),
+                "accuracy": uploaded_doc.get("accuracy"),
+                "doc_status": uploaded_doc.get("doc_status", "pending"),
+                "uploaded_at": uploaded_doc.get("uploaded_at")
+            }
+            for uploaded_doc in raw_uploaded_documents
+        ]
         
         return {
             "appointment": appointment,
@@ -194,7 +265,7 @@ async def get_appointment_step_details(appointment_id: str):
         # Get sub-service details
         sub_service = None
         if sub_service_id_str:
-            sub_service = await collection_sub_services.find_one({"_id": ObjectId(sub_service_id_str)})
+            sub_service = await get_loaders().sub_services.load(ObjectId(sub_service_id_str))
         
         if not sub_service:
             return None
@@ -5,7 +5,11 @@ from schemas.admin_portal import (
     SubServiceDocument, SubServiceStep, get_selected_appoinment_details_with_pdf_states_request,
     get_selected_appoinment_details_with_pdf_states_response, DocumentItem
 )
-from database_config import collection_apointment, collection_users, collection_uploaded_documents, collection_required_documents, collection_sub_services
+from database_config import collection_apointment, collection_uploaded_documents
+from services.loaders import get_loaders
+from services.user_identity import resolve_user
+from services.document import download_url
+from services.document_previews import preview_url
 from datetime import datetime, time
 from typing import List
 from bson import ObjectId
@@ -192,10 +196,10 @@ async def get_detailed_appointment(query: view_detailed_appointment_request) ->
             appointment_object_id
         )
         
-        # Get sub-service name
+        # Get sub-service name (already loaded for the required documents above)
         sub_service_name = None
         if appointment_doc.get("sub_service_id"):
-            sub_service_doc = await collection_sub_services.find_one({"_id": appointment_doc.get("sub_service_id")})
+            sub_service_doc = await get_loaders().sub_services.load(appointment_doc.get("sub_service_id"))
             if sub_service_doc:
                 sub_service_name = sub_service_doc.get("service_name")
         
@@ -237,6 +241,10 @@ async def _get_user_information(user_id) -> dict:
     """
     Enhanced user lookup with multiple strategies.
     
+    The legacy user_id field, the user's _id and a zero-padded numeric _id are
+    all tried in a single $or query; resolved (and unknown) identities are
+    cached, see services.user_identity.
+    
     Args:
         user_id: User identifier from appointment document
         
@@ -247,49 +255,13 @@ async def _get_user_information(user_id) -> dict:
         logger.warning("No user_id provided in appointment")
         return {}
     
-    user_info = None
-    
-    # Strategy 1: Direct user_id match (for integer user_ids)
     try:
-        user_info = await collection_users.find_one({"user_id": user_id})
+        user_info = await resolve_user(user_id)
         if user_info:
-            logger.info(f"Found user by direct user_id: {user_id}")
+            logger.info(f"Found user for user_id: {user_id}")
             return user_info
     except Exception as e:
-        logger.warning(f"Error in direct user lookup: {e}")
-    
-    # Strategy 2: Try as ObjectId (for string user_ids that are ObjectIds)
-    try:
-        if isinstance(user_id, str) and len(user_id) == 24:
-            user_object_id = ObjectId(user_id)
-            user_info = await collection_users.find_one({"_id": user_object_id})
-            if user_info:
-                logger.info(f"Found user by ObjectId: {user_id}")
-                return user_info
-    except Exception as e:
-        logger.warning(f"Error in ObjectId user lookup: {e}")
-    
-    # Strategy 3: Try as string user_id (for string user_ids)
-    try:
-        if isinstance(user_id, str):
-            user_info = await collection_users.find_one({"user_id": user_id})
-            if user_info:
-                logger.info(f"Found user by string user_id: {user_id}")
-                return user_info
-    except Exception as e:
-        logger.warning(f"Error in string user lookup: {e}")
-    
-    # Strategy 4: Try to find by _id if user_id is numeric (fallback)
-    try:
-        if isinstance(user_id, int):
-            # Try to find user by _id if user_id might be a reference to _id
-            # This is a fallback strategy
-            user_info = await collection_users.find_one({"_id": ObjectId(str(user_id).zfill(24))})
-            if user_info:
-                logger.info(f"Found user by _id fallback: {user_id}")
-                return user_info
-    except Exception as e:
-        logger.warning(f"Error in _id fallback lookup: {e}")
+        logger.warning(f"Error in user lookup: {e}")
     
     logger.warning(f"Could not find user with user_id: {user_id} (type: {type(user_id)})")
     return {}
@@ -396,8 +368,10 @@ async def _get_required_documents_with_status(sub_service_id, appointment_object
         list: List of required documents with upload status
     """
     try:
+        loaders = get_loaders()
+        
         # Get the sub-service document to find required documents
-        sub_service_doc = await collection_sub_services.find_one({"_id": sub_service_id})
+        sub_service_doc = await loaders.sub_services.load(sub_service_id)
         
         if not sub_service_doc:
             logger.warning(f"Sub-service not found: {sub_service_id}")
@@ -418,20 +392,15 @@ async def _get_required_documents_with_status(sub_service_id, appointment_object
             if required_doc_id:
                 uploaded_docs_map[str(required_doc_id)] = doc
         
+        # Handle both ObjectId and string formats
+        required_doc_ids = [_to_required_doc_id(required_doc_ref) for required_doc_ref in required_docs]
+        
+        # Get the required document details from required_documents collection (one batched query)
+        required_doc_details = await loaders.required_documents.load_many(required_doc_ids)
+        
         # Build the result list
         result = []
-        for required_doc_ref in required_docs:
-            # Handle both ObjectId and string formats
-            if isinstance(required_doc_ref, dict) and "$oid" in required_doc_ref:
-                required_doc_id = ObjectId(required_doc_ref["$oid"])
-            elif isinstance(required_doc_ref, ObjectId):
-                required_doc_id = required_doc_ref
-            else:
-                required_doc_id = ObjectId(required_doc_ref)
-            
-            # Get the required document details from required_documents collection
-            required_doc = await collection_required_documents.find_one({"_id": required_doc_id})
-            
+        for required_doc_id, required_doc in zip(required_doc_ids, required_doc_details):
             if required_doc:
                 # Create RequiredDocument object
                 doc_info = RequiredDocument(
@@ -460,6 +429,23 @@ async def _get_required_documents_with_status(sub_service_id, appointment_object
         logger.error(f"Error getting required documents with status: {e}")
         return []
 
+def _to_required_doc_id(doc_ref) -> ObjectId:
+    """
+    Convert a required_docs entry (ObjectId, string or {"$oid": ...}) to an ObjectId.
+    
+    Args:
+        doc_ref: Required document reference from a sub-service
+        
+    Returns:
+        ObjectId: The referenced required document id
+    """
+    if isinstance(doc_ref, dict) and "$oid" in doc_ref:
+        return ObjectId(doc_ref["$oid"])
+    elif isinstance(doc_ref, ObjectId):
+        return doc_ref
+    else:
+        return ObjectId(doc_ref)
+
 def _determine_payment_status(appointment_doc: dict) -> bool:
     """
     Determine payment status based on appointment data.
@@ -508,7 +494,7 @@ async def get_subservice_details(query: get_subservice_details_request) -> get_s
         logger.info(f"Fetching sub-service details for ID: {query.subservice_id}")
         
         # Find the sub-service document
-        subservice_doc = await collection_sub_services.find_one({"_id": subservice_object_id})
+        subservice_doc = await get_loaders().sub_services.load(subservice_object_id)
         
         if not subservice_doc:
             logger.error(f"Sub-service not found with id: {query.subservice_id}")
@@ -557,19 +543,14 @@ async def _get_required_documents_details(required_docs_refs: list) -> List[SubS
         List[SubServiceDocument]: List of required documents with details
     """
     try:
+        # Handle both ObjectId and string formats
+        doc_ids = [_to_required_doc_id(doc_ref) for doc_ref in required_docs_refs]
+        
+        # Get the required document details from required_documents collection (one batched query)
+        required_doc_details = await get_loaders().required_documents.load_many(doc_ids)
+        
         result = []
-        for doc_ref in required_docs_refs:
-            # Handle both ObjectId and string formats
-            if isinstance(doc_ref, dict) and "$oid" in doc_ref:
-                doc_id = ObjectId(doc_ref["$oid"])
-            elif isinstance(doc_ref, ObjectId):
-                doc_id = doc_ref
-            else:
-                doc_id = ObjectId(doc_ref)
-            
-            # Get the required document details from required_documents collection
-            required_doc = await collection_required_documents.find_one({"_id": doc_id})
-            
+        for doc_id, required_doc in zip(doc_ids, required_doc_details):
             if required_doc:
                 doc_info = SubServiceDocument(
                     doc_id=str(doc_id),
@@ -703,15 +684,21 @@ async def _get_uploaded_documents_with_states(appointment_object_id: ObjectId) -
         result = []
         
         # Get uploaded documents for this appointment
-        async for uploaded_doc in collection_uploaded_documents.find({"appointment_id": appointment_object_id}):
+        uploaded_docs = await collection_uploaded_documents.find({"appointment_id": appointment_object_id}).to_list(None)
+        
+        # Get the required document details for all uploads in one batched query
+        required_docs = await get_loaders().required_documents.load_many(
+            uploaded_doc.get("required_doc_id") for uploaded_doc in uploaded_docs if uploaded_doc.get("required_doc_id")
+        )
+        required_docs_by_id = {}
+        for required_doc in required_docs:
+            if required_doc:
+                required_docs_by_id[required_doc["_id"]] = required_doc
+        
+        for uploaded_doc in uploaded_docs:
             try:
-                # Get the required document details
                 required_doc_id = uploaded_doc.get("required_doc_id")
-                required_doc = None
-                
-                if required_doc_id:
-                    # Try to find the required document by ID
-                    required_doc = await collection_required_documents.find_one({"_id": required_doc_id})
+                required_doc = required_docs_by_id.get(required_doc_id) if required_doc_id else None
                 
                 # Create DocumentItem
                 doc_item = DocumentItem(
@@ -719,7 +706,9 @@ async def _get_uploaded_documents_with_states(appointment_object_id: ObjectId) -
                     required_doc_id=required_doc_id,  # Integer required_doc_id
                     name=required_doc.get("doc_name", "Unknown Document") if required_doc else "Unknown Document",
                     description=required_doc.get("description", "") if required_doc else "",
-                    view_link=uploaded_doc.get("file_path"),  # File path as view link
+                    view_link=download_url(uploaded_doc.get("_id")),  # Download route (serves the original name and type)
+                    download_url=download_url(uploaded_doc.get("_id")),
+                    thumbnail_url=preview_url(uploaded_doc.get("_id"), "thumb"),
                     accuracy=uploaded_doc.get("accuracy"),
                     status=uploaded_doc.get("doc_status", "Unknown")
                 )
@@ -3,6 +3,8 @@ from bson import ObjectId
 from fastapi import HTTPException
 from database_config import collection_apointment, collection_sub_services
 from schemas.appoinment import AppointmentAdd, EmptyAppointmentCreate, AppointmentUpdate
+from services.appointment_rollups import record_appointment_change, update_appointment
+from services.loaders import get_loaders
 from datetime import datetime
 
 async def get_appointments_by_user_service(user_id: str):
@@ -56,7 +58,7 @@ async def create_empty_appointment_service(data: EmptyAppointmentCreate):
         raise HTTPException(status_code=400, detail=f"Invalid sub_service_id format: {str(e)}")
 
     # Verify that the sub-service exists
-    sub_service = await collection_sub_services.find_one({"_id": sub_service_object_id})
+    sub_service = await get_loaders().sub_services.load(sub_service_object_id)
     if not sub_service:
         raise HTTPException(status_code=404, detail=f"Sub-service not found with id: {data.sub_service_id}")
 
@@ -121,13 +123,8 @@ async def update_appointment_service(appointment_id: str, data: AppointmentUpdat
     if not update_data:
         raise HTTPException(status_code=400, detail="No valid fields to update")
 
-    # Update the appointment
-    result = await collection_apointment.update_one(
-        {"_id": appointment_object_id},
-        {"$set": update_data}
-    )
-
-    if result.modified_count == 0:
+    # Update the appointment (and the insights daily rollups with it)
+    if await update_appointment(appointment_object_id, update_data) is None:
         raise HTTPException(status_code=500, detail="Failed to update appointment")
 
     return {
@@ -151,19 +148,14 @@ async def confirm_appointment_service(appointment_id: str):
     if not existing_appointment:
         raise HTTPException(status_code=404, detail=f"Appointment not found with id: {appointment_id}")
 
-    # Update only the appointment_confirmed field to True
-    result = await collection_apointment.update_one(
-        {"_id": appointment_object_id},
-        {"$set": {"appointment_confirmed": True}}
-    )
-
-    if result.modified_count == 0:
+    # Update only the appointment_confirmed field to True (and the insights daily rollups with it)
+    if await update_appointment(appointment_object_id, {"appointment_confirmed": True}) is None:
         raise HTTPException(status_code=500, detail="Failed to confirm appointment")
 
     # Prepare response details
     sub_service_name = None
     if existing_appointment.get("sub_service_id"):
-        sub_doc = await collection_sub_services.find_one({"_id": existing_appointment["sub_service_id"]})
+        sub_doc = await get_loaders().sub_services.load(existing_appointment["sub_service_id"])
         if sub_doc:
             sub_service_name = sub_doc.get("service_name")
 
@@ -192,7 +184,7 @@ async def create_appointment_service(data: AppointmentAdd):
     print(f"Looking for: {object_id}")
     
     # Find sub_service by _id
-    sub_service = await collection_sub_services.find_one({"_id": object_id})
+    sub_service = await get_loaders().sub_services.load(object_id)
     
     if not sub_service:
         raise HTTPException(status_code=404, detail=f"Sub-service not found with id: {data.sub_service_id}")
@@ -221,6 +213,10 @@ async def create_appointment_service(data: AppointmentAdd):
     }
 
     result = await collection_apointment.insert_one(appointment_dict)
+
+    # Count the new appointment in the insights daily rollups
+    await record_appointment_change(None, appointment_dict)
+
     return {
         "message": "Appointment created successfully", 
         "appointment_id": str(result.inserted_id),
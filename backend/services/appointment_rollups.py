@@ -0,0 +1,255 @@
+from database_config import collection_apointment, collection_appointment_daily_rollups, collection_migrations
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Marker in the migrations collection: claimed by the one worker that backfills, "done" once it has
+BACKFILL_MARKER = "appointment_daily_rollups"
+# A claim older than this is taken to be abandoned (its worker died mid-backfill) and is taken over
+BACKFILL_LEASE_SECONDS = int(os.getenv("ROLLUP_BACKFILL_LEASE_SECONDS", "1800"))
+# How often workers that did not claim the backfill check whether it has finished
+BACKFILL_POLL_SECONDS = 5
+
+# Counters kept on every (sub_service_id, date) rollup document
+ROLLUP_COUNTERS = (
+    "appointment_count",
+    "confirmed_count",
+    "completed_count",
+    "paid_count",
+    "steps_completed",
+    "steps_total",
+)
+
+# Set once the rollup collection is known to reflect AppoinmentNew (see ensure_daily_rollups)
+_rollups_ready = False
+_backfill_waiter: Optional[asyncio.Task] = None
+
+
+def rollups_ready() -> bool:
+    """True when readers can trust the rollup collection instead of scanning AppoinmentNew."""
+    return _rollups_ready
+
+
+def rollup_day(value) -> Optional[datetime]:
+    """
+    Normalise an appointment_date to the midnight (UTC, naive) datetime used as the rollup key.
+    Returns None for appointments that have no date yet.
+    """
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return datetime.combine(value.date(), datetime.min.time())
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    return None
+
+
+def _rollup_contribution(appointment: Optional[dict]) -> Optional[Tuple[Tuple[ObjectId, datetime], Dict[str, int]]]:
+    """
+    Work out which rollup document an appointment counts towards and by how much.
+    Appointments without a sub_service_id or appointment_date do not contribute.
+    """
+    if not appointment:
+        return None
+
+    sub_service_id = appointment.get("sub_service_id")
+    day = rollup_day(appointment.get("appointment_date"))
+    if sub_service_id is None or day is None:
+        return None
+    if not isinstance(sub_service_id, ObjectId):
+        sub_service_id = ObjectId(str(sub_service_id))
+
+    steps = [step for step in appointment.get("sub_service_steps") or [] if isinstance(step, dict)]
+    counters = {
+        "appointment_count": 1,
+        "confirmed_count": 1 if appointment.get("appointment_confirmed") else 0,
+        "completed_count": 1 if appointment.get("is_fully_completed") else 0,
+        "paid_count": 1 if appointment.get("payment_status") else 0,
+        "steps_completed": sum(1 for step in steps if step.get("status")),
+        "steps_total": len(steps),
+    }
+    return (sub_service_id, day), counters
+
+
+async def record_appointment_change(before: Optional[dict], after: Optional[dict]) -> None:
+    """
+    Apply the difference between two versions of an appointment to the daily rollups.
+
+    Pass before=None for a newly created appointment and after=None for a deleted one.
+    When the appointment moves to another day or sub_service the old bucket is
+    decremented and the new one incremented. Failures are logged, never raised,
+    so a rollup problem cannot fail the appointment write itself.
+    """
+    try:
+        deltas: Dict[Tuple[ObjectId, datetime], Dict[str, int]] = {}
+
+        for contribution, sign in ((_rollup_contribution(before), -1), (_rollup_contribution(after), 1)):
+            if contribution is None:
+                continue
+            key, counters = contribution
+            bucket = deltas.setdefault(key, {name: 0 for name in ROLLUP_COUNTERS})
+            for name, value in counters.items():
+                bucket[name] += sign * value
+
+        for (sub_service_id, day), bucket in deltas.items():
+            increments = {name: value for name, value in bucket.items() if value}
+            if not increments:
+                continue
+            await collection_appointment_daily_rollups.update_one(
+                {"sub_service_id": sub_service_id, "date": day},
+                {"$inc": increments, "$set": {"updated_at": datetime.utcnow()}},
+                upsert=True
+            )
+    except Exception as e:
+        logger.error(f"Failed to update appointment daily rollups: {e}")
+
+
+async def update_appointment(appointment_id: ObjectId, fields: dict, collection=None) -> Optional[dict]:
+    """
+    $set fields on an appointment and apply the change to the daily rollups.
+
+    The delta is taken from the version this update actually replaced
+    (find_one_and_update returns it atomically), so concurrent updates of one
+    appointment each count their own change exactly once.
+
+    Returns:
+        The appointment as it was before the update, or None if it does not exist
+    """
+    collection = collection if collection is not None else collection_apointment
+    before = await collection.find_one_and_update(
+        {"_id": appointment_id}, {"$set": fields}, return_document=ReturnDocument.BEFORE
+    )
+    if before is not None:
+        await record_appointment_change(before, {**before, **fields})
+    return before
+
+
+async def get_daily_rollups(sub_service_id: ObjectId, start_day: date, end_day: date) -> Dict[date, dict]:
+    """
+    Read the rollup documents for a sub_service between two dates (inclusive).
+    A week is at most seven small documents; missing days simply have no entry.
+    """
+    cursor = collection_appointment_daily_rollups.find(
+        {
+            "sub_service_id": sub_service_id,
+            "date": {
+                "$gte": datetime.combine(start_day, datetime.min.time()),
+                "$lte": datetime.combine(end_day, datetime.min.time())
+            }
+        },
+        {"_id": 0, "date": 1, **{name: 1 for name in ROLLUP_COUNTERS}}
+    )
+    return {doc["date"].date(): doc async for doc in cursor}
+
+
+def _rebuild_pipeline(match: dict) -> List[dict]:
+    """Aggregation that recomputes rollups straight from AppoinmentNew."""
+    return [
+        {"$match": {**match, "sub_service_id": {"$ne": None}, "appointment_date": {"$type": "date"}}},
+        {"$group": {
+            "_id": {
+                "sub_service_id": "$sub_service_id",
+                "date": {"$dateTrunc": {"date": "$appointment_date", "unit": "day"}}
+            },
+            "appointment_count": {"$sum": 1},
+            "confirmed_count": {"$sum": {"$cond": [{"$eq": ["$appointment_confirmed", True]}, 1, 0]}},
+            "completed_count": {"$sum": {"$cond": [{"$eq": ["$is_fully_completed", True]}, 1, 0]}},
+            "paid_count": {"$sum": {"$cond": [{"$eq": ["$payment_status", True]}, 1, 0]}},
+            "steps_completed": {"$sum": {"$size": {"$filter": {
+                "input": {"$ifNull": ["$sub_service_steps", []]},
+                "as": "step",
+                "cond": {"$eq": ["$$step.status", True]}
+            }}}},
+            "steps_total": {"$sum": {"$size": {"$ifNull": ["$sub_service_steps", []]}}}
+        }},
+        {"$project": {
+            "_id": 0,
+            "sub_service_id": "$_id.sub_service_id",
+            "date": "$_id.date",
+            **{name: 1 for name in ROLLUP_COUNTERS},
+            "updated_at": "$$NOW"
+        }},
+        {"$merge": {
+            "into": collection_appointment_daily_rollups.name,
+            "on": ["sub_service_id", "date"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert"
+        }}
+    ]
+
+
+async def rebuild_daily_rollups(sub_service_id: Optional[ObjectId] = None) -> None:
+    """
+    Recompute the rollups from scratch, for one sub_service or for everything.
+    Used to backfill on first start and to repair drift after manual data fixes.
+    """
+    match = {"sub_service_id": sub_service_id} if sub_service_id is not None else {}
+    await collection_appointment_daily_rollups.delete_many(match)
+    await collection_apointment.aggregate(_rebuild_pipeline(match)).to_list(None)
+
+
+async def _backfill_once() -> bool:
+    """
+    Backfills the rollups unless another worker has claimed that; True once they are complete.
+
+    The claim is an upsert of the marker that only matches an abandoned claim,
+    so of several workers starting together exactly one inserts it and the
+    others get a DuplicateKeyError.
+    """
+    now = datetime.utcnow()
+    try:
+        abandoned = await collection_migrations.find_one_and_update(
+            {"_id": BACKFILL_MARKER, "status": "running",
+             "claimed_at": {"$lt": now - timedelta(seconds=BACKFILL_LEASE_SECONDS)}},
+            {"$set": {"claimed_at": now}},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+    except DuplicateKeyError:
+        marker = await collection_migrations.find_one({"_id": BACKFILL_MARKER}, {"status": 1})
+        return marker is not None and marker.get("status") == "done"
+
+    # An abandoned claim may have left a partial backfill behind
+    if abandoned is not None or await collection_appointment_daily_rollups.estimated_document_count() == 0:
+        logger.info("Backfilling appointment_daily_rollups from AppoinmentNew")
+        await rebuild_daily_rollups()
+    await collection_migrations.update_one(
+        {"_id": BACKFILL_MARKER}, {"$set": {"status": "done", "finished_at": datetime.utcnow()}}
+    )
+    return True
+
+
+async def _wait_for_backfill() -> None:
+    global _rollups_ready
+    while True:
+        await asyncio.sleep(BACKFILL_POLL_SECONDS)
+        try:
+            if await _backfill_once():
+                _rollups_ready = True
+                return
+        except Exception as e:
+            logger.warning(f"Checking the appointment rollup backfill failed: {e}")
+
+
+async def ensure_daily_rollups() -> None:
+    """
+    Called on startup: create the rollup key index and backfill the collection
+    the first time it is used. With several workers only the one that claims
+    the backfill marker runs it; the others keep checking the marker in the
+    background. Readers fall back to scanning AppoinmentNew until it is done.
+    """
+    global _rollups_ready, _backfill_waiter
+    await collection_appointment_daily_rollups.create_index(
+        [("sub_service_id", 1), ("date", 1)], unique=True
+    )
+    if await _backfill_once():
+        _rollups_ready = True
+    elif _backfill_waiter is None:
+        _backfill_waiter = asyncio.create_task(_wait_for_backfill())
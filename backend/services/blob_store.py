@@ -0,0 +1,169 @@
+import asyncio
+import os
+from typing import Dict, Tuple
+from uuid import uuid4
+
+import aiofiles.os
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from database_config import collection_document_blobs, collection_uploaded_documents
+
+# Root of the content-addressed store; blobs live at <root>/<aa>/<bb>/<sha256>
+DOCUMENT_BLOB_DIR = os.getenv("DOCUMENT_BLOB_DIR", os.path.join("uploads", "blobs"))
+# How long put() waits between attempts while another instance is deleting the same blob
+BLOB_DELETE_RETRY_SECONDS = 0.05
+
+
+class ContentAddressedStore:
+    """
+    Stores each distinct file once, under its SHA-256, sharded by the first two
+    byte pairs of the hash so no directory grows too large.
+
+    Each blob has a reference count in document_blobs ({_id: sha256, refs}).
+    put() takes a reference before it looks at the disk and release() drops
+    one; the blob is deleted only when the count reaches zero. Deleting first
+    marks the count document, and put() never takes a reference on a marked
+    one (its upsert collides on _id and retries), so a blob cannot be removed
+    under an upload that has just deduplicated against it.
+    """
+
+    def __init__(self, root: str = DOCUMENT_BLOB_DIR, collection=collection_uploaded_documents,
+                 refs_collection=collection_document_blobs):
+        self.root = root
+        self.collection = collection
+        self.refs_collection = refs_collection
+        self.temp_dir = os.path.join(root, "tmp")
+        # Since process start
+        self.stats_since_start = {"stored": 0, "deduplicated": 0, "bytes_saved": 0}
+
+    def path_for(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    async def prepare(self) -> str:
+        """Creates the temp directory (on the store's filesystem, so puts are atomic renames) and returns it."""
+        await aiofiles.os.makedirs(self.temp_dir, exist_ok=True)
+        return self.temp_dir
+
+    async def _acquire(self, sha256: str, size: int) -> None:
+        """Takes a reference on a blob, waiting while a release() is deleting it."""
+        while True:
+            try:
+                await self.refs_collection.update_one(
+                    {"_id": sha256, "deleting": {"$exists": False}},
+                    {"$inc": {"refs": 1}, "$setOnInsert": {"size": size}},
+                    upsert=True
+                )
+                return
+            except DuplicateKeyError:
+                await asyncio.sleep(BLOB_DELETE_RETRY_SECONDS)
+
+    async def put(self, temp_path: str, sha256: str, size: int) -> Tuple[str, bool]:
+        """
+        Takes a reference on the content and moves a fully written temp file into
+        the store, or drops it if the same content is already stored. Pair every
+        successful put() with a release() once the reference is gone.
+
+        Returns:
+            tuple: (blob path, True if the content was already stored)
+        """
+        await self._acquire(sha256, size)
+        path = self.path_for(sha256)
+        if await aiofiles.os.path.exists(path):
+            try:
+                await aiofiles.os.remove(temp_path)
+            except OSError:
+                pass
+            self.stats_since_start["deduplicated"] += 1
+            self.stats_since_start["bytes_saved"] += size
+            return path, True
+        try:
+            await aiofiles.os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Atomic: concurrent uploads of the same content just replace identical bytes
+            await aiofiles.os.replace(temp_path, path)
+        except Exception:
+            await self.release(sha256)
+            raise
+        self.stats_since_start["stored"] += 1
+        return path, False
+
+    async def references(self, sha256: str) -> int:
+        counter = await self.refs_collection.find_one({"_id": sha256}, {"refs": 1})
+        return int(counter["refs"]) if counter else 0
+
+    async def release(self, sha256: str) -> bool:
+        """
+        Drops one reference and deletes the blob when it was the last one.
+        Call after removing a record or when its insert failed; returns True if
+        the file was deleted. Blobs stored before reference counting (no count
+        document) are never deleted.
+        """
+        counter = await self.refs_collection.find_one_and_update(
+            {"_id": sha256, "deleting": {"$exists": False}},
+            {"$inc": {"refs": -1}},
+            return_document=ReturnDocument.AFTER
+        )
+        if counter is None or counter["refs"] > 0:
+            return False
+        # Claim the deletion; fails if a put() took a reference in the meantime
+        token = uuid4().hex
+        claimed = await self.refs_collection.find_one_and_update(
+            {"_id": sha256, "refs": {"$lte": 0}, "deleting": {"$exists": False}},
+            {"$set": {"deleting": token}}
+        )
+        if claimed is None:
+            return False
+        try:
+            await aiofiles.os.remove(self.path_for(sha256))
+            return True
+        except FileNotFoundError:
+            return False
+        finally:
+            await self.refs_collection.delete_one({"_id": sha256, "deleting": token})
+
+    async def rebuild_references(self) -> None:
+        """Recomputes every reference count from the uploaded_documents records."""
+        await self.collection.aggregate([
+            {"$match": {"sha256": {"$type": "string"}}},
+            {"$group": {"_id": "$sha256", "refs": {"$sum": 1}, "size": {"$first": "$file_size"}}},
+            {"$merge": {"into": self.refs_collection.name, "whenMatched": "replace", "whenNotMatched": "insert"}}
+        ]).to_list(None)
+
+    async def ensure_references(self) -> None:
+        """Called on startup: backfills the reference counts the first time they are used."""
+        if await self.refs_collection.estimated_document_count() == 0:
+            await self.rebuild_references()
+
+    async def stats(self) -> Dict[str, object]:
+        """
+        Deduplication statistics over every stored document: distinct blobs and
+        their bytes on disk vs. references and the bytes they would take as copies.
+        """
+        pipeline = [
+            {"$match": {"sha256": {"$type": "string"}}},
+            {"$group": {"_id": "$sha256", "size": {"$first": "$file_size"}, "references": {"$sum": 1}}},
+            {"$group": {
+                "_id": None,
+                "blobs": {"$sum": 1},
+                "stored_bytes": {"$sum": "$size"},
+                "references": {"$sum": "$references"},
+                "logical_bytes": {"$sum": {"$multiply": ["$size", "$references"]}}
+            }}
+        ]
+        totals = next(iter(await self.collection.aggregate(pipeline).to_list(1)), {})
+        blobs = totals.get("blobs", 0)
+        stored_bytes = totals.get("stored_bytes", 0)
+        references = totals.get("references", 0)
+        logical_bytes = totals.get("logical_bytes", 0)
+        return {
+            "blobs": blobs,
+            "references": references,
+            "stored_bytes": stored_bytes,
+            "logical_bytes": logical_bytes,
+            "bytes_saved": logical_bytes - stored_bytes,
+            "dedup_ratio": round(logical_bytes / stored_bytes, 3) if stored_bytes else 1.0,
+            "since_start": dict(self.stats_since_start),
+        }
+
+
+document_store = ContentAddressedStore()
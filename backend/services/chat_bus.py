@@ -0,0 +1,162 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, List, NamedTuple, Optional
+
+from bson import ObjectId
+
+import database_config
+from services.chat_cluster import create_relay
+from services.chat_persistence import MessageWriteBehind, CHAT_MESSAGE_DURABILITY
+from services.chat_timestamps import message_timestamp
+from services.conversations import record_messages
+
+logger = logging.getLogger(__name__)
+
+
+def get_chat_collection():
+    """Returns the messages collection from the database."""
+    return database_config.db["messages"]
+
+
+def chat_message(sender_id, receiver_id, content: str, timestamp=None, message_type: str = "text",
+                 **fields) -> dict:
+    """
+    A chat message in the one schema both transports store and deliver:
+    sender_id/receiver_id as strings, content, timestamp (a UTC datetime; a
+    client-sent one is parsed, see services.chat_timestamps) and message_type, plus
+    optional context such as service_id and appointment_id. Read state lives in "read".
+    """
+    message = {
+        "sender_id": str(sender_id) if sender_id is not None else None,
+        "receiver_id": str(receiver_id) if receiver_id is not None else None,
+        "content": content,
+        "timestamp": message_timestamp(timestamp),
+        "message_type": message_type,
+    }
+    message.update((key, value) for key, value in fields.items() if value is not None)
+    return message
+
+
+def legacy_message(message: dict) -> dict:
+    """The message as /ws/{client_id} clients expect it (message_text, is_read)."""
+    return {**message, "message_text": message.get("content"), "is_read": bool(message.get("read", False))}
+
+
+class BusMessage(NamedTuple):
+    """
+    A stored chat message on its way to the transports.
+
+    origin names the transport it came from ("socketio" or "ws"); room and
+    skip_sid are the Socket.IO room it was sent to and the sending socket.
+    """
+    message: dict
+    origin: str
+    room: Optional[str] = None
+    skip_sid: Optional[str] = None
+
+
+class MessageNotSaved(Exception):
+    """Raised by publish() in durable mode when the message could not be stored."""
+
+
+class ChatMessageBus:
+    """
+    The single path every chat message takes, whichever transport it arrives on.
+
+    publish() queues the message on the write-behind queue, records it on its
+    conversation (last message, receiver's unread count), then hands it to
+    every subscribed transport concurrently. A failing or slow subscriber does
+    not hold up the others. The conversation is updated before delivery, so a
+    receiver's mark_read can never run ahead of the unread increment.
+
+    With several workers, a relay (services.chat_cluster) carries each message
+    to the other workers, where only the every_node subscribers run: transports
+    whose connections live in one process (the /ws endpoint). Socket.IO
+    delivery runs once, on the publishing worker, since its emits already go
+    through the shared client manager.
+    """
+
+    def __init__(self, writer: MessageWriteBehind, durability: str = CHAT_MESSAGE_DURABILITY, relay=None):
+        self.writer = writer
+        self.durable = durability == "durable"
+        self.relay = relay
+        self._subscribers: List[Callable[[BusMessage], Awaitable[None]]] = []
+        self._node_subscribers: List[Callable[[BusMessage], Awaitable[None]]] = []
+
+    def subscribe(self, handler: Callable[[BusMessage], Awaitable[None]], every_node: bool = False) -> None:
+        """Adds a transport; every_node ones also receive messages published on other workers."""
+        if handler not in self._subscribers:
+            self._subscribers.append(handler)
+        if every_node and handler not in self._node_subscribers:
+            self._node_subscribers.append(handler)
+
+    def unsubscribe(self, handler: Callable[[BusMessage], Awaitable[None]]) -> None:
+        if handler in self._subscribers:
+            self._subscribers.remove(handler)
+        if handler in self._node_subscribers:
+            self._node_subscribers.remove(handler)
+
+    async def start(self) -> None:
+        """Starts receiving messages published on other workers (called from application startup)."""
+        if self.relay is not None:
+            await self.relay.start(self._on_relayed)
+
+    async def stop(self) -> None:
+        """Stops the relay listener (called from application shutdown)."""
+        if self.relay is not None:
+            await self.relay.stop()
+
+    async def _on_relayed(self, payload: dict) -> None:
+        envelope = BusMessage(**payload)
+        await asyncio.gather(*(self._deliver(handler, envelope) for handler in list(self._node_subscribers)))
+
+    async def publish(self, message: dict, origin: str, room: Optional[str] = None,
+                      skip_sid: Optional[str] = None) -> dict:
+        """
+        Stores and delivers a message built with chat_message().
+
+        Returns:
+            dict: the delivered message, with its _id as a string
+
+        Raises:
+            MessageNotSaved: in durable mode, if the write failed (nothing is delivered)
+        """
+        document = dict(message, _id=message.get("_id") or ObjectId())
+        saved = await self.writer.submit(document)
+        # Transports send JSON: ids and dates go out as strings (stored dates are UTC)
+        delivered = {
+            key: value.replace(tzinfo=timezone.utc).isoformat() if isinstance(value, datetime) else value
+            for key, value in document.items()
+        }
+        delivered["_id"] = str(document["_id"])
+        if self.durable:
+            try:
+                await saved
+            except Exception as e:
+                raise MessageNotSaved(str(e)) from e
+        await record_messages([document])
+
+        envelope = BusMessage(delivered, origin, room, skip_sid)
+        await asyncio.gather(*(self._deliver(handler, envelope) for handler in list(self._subscribers)))
+        if self.relay is not None:
+            try:
+                await self.relay.publish(envelope._asdict())
+            except Exception as e:
+                logger.error(f"Failed to relay chat message {delivered['_id']} to other workers: {e}")
+        return delivered
+
+    @staticmethod
+    async def _deliver(handler: Callable[[BusMessage], Awaitable[None]], envelope: BusMessage) -> None:
+        try:
+            await handler(envelope)
+        except Exception as e:
+            logger.error(f"Chat subscriber {getattr(handler, '__name__', handler)} failed for message "
+                         f"{envelope.message.get('_id')}: {e}")
+
+
+# Chat messages are stored in micro-batches off the send path (see services.chat_persistence)
+message_writer = MessageWriteBehind(get_chat_collection)
+
+# Shares messages with the other workers when CHAT_MESSAGE_QUEUE_URL is set
+chat_bus = ChatMessageBus(message_writer, relay=create_relay())
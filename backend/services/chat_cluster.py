@@ -0,0 +1,559 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+logger = logging.getLogger(__name__)
+
+# Message broker shared by all chat workers:
+#   redis://host:6379/0 (or rediss://) - any Redis-protocol server (Redis, Valkey, KeyDB)
+#   local://                           - in-process stand-in, for tests and single-process runs
+#   unset                              - plain single-process Socket.IO server
+CHAT_MESSAGE_QUEUE_URL = os.getenv("CHAT_MESSAGE_QUEUE_URL", "")
+CHAT_CHANNEL = os.getenv("CHAT_CHANNEL", "smartgov_chat")
+# A worker that stops refreshing its presence entries (crash, kill -9) drops out after this long
+CHAT_PRESENCE_TTL_SECONDS = float(os.getenv("CHAT_PRESENCE_TTL_SECONDS", "60"))
+# Sockets with no events (heartbeat, message, typing, ...) for this long are checked by the sweeper;
+# their presence is dropped only if the transport is gone (live sockets are never disconnected)
+CHAT_IDLE_TIMEOUT_SECONDS = float(os.getenv("CHAT_IDLE_TIMEOUT_SECONDS", "300"))
+CHAT_SWEEP_INTERVAL_SECONDS = float(os.getenv("CHAT_SWEEP_INTERVAL_SECONDS", "30"))
+
+# Identifies this worker in shared presence entries
+NODE_ID = uuid.uuid4().hex
+
+
+# --- Client managers (cross-process fan-out of emits and room operations) ---
+
+class LocalBroker:
+    """In-process stand-in for a pub/sub channel: every subscriber receives every published message."""
+
+    def __init__(self):
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+
+    def subscribe(self, channel: str) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        self._subscribers.setdefault(channel, []).append(queue)
+        return queue
+
+    def unsubscribe(self, channel: str, queue: asyncio.Queue) -> None:
+        if queue in self._subscribers.get(channel, []):
+            self._subscribers[channel].remove(queue)
+
+    async def publish(self, channel: str, message: str) -> None:
+        for queue in self._subscribers.get(channel, []):
+            queue.put_nowait(message)
+
+
+local_broker = LocalBroker()
+
+
+class LocalPubSubManager(AsyncPubSubManager):
+    """
+    Socket.IO client manager that fans out through a LocalBroker.
+
+    Behaves like AsyncRedisManager (messages are JSON-encoded on publish), so
+    several AsyncServer instances in one process exercise the same code paths
+    as workers sharing a Redis channel.
+    """
+
+    name = "localpubsub"
+
+    def __init__(self, channel: str = CHAT_CHANNEL, write_only: bool = False, logger=None,
+                 broker: Optional[LocalBroker] = None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.broker = broker or local_broker
+        # Subscribe up front so nothing published before the listener task starts is lost
+        self._queue = None if write_only else self.broker.subscribe(channel)
+
+    async def _publish(self, data):
+        await self.broker.publish(self.channel, self.json.dumps(data))
+
+    async def _listen(self):
+        while True:
+            yield await self._queue.get()
+
+
+def create_client_manager(url: str = CHAT_MESSAGE_QUEUE_URL) -> Optional[socketio.AsyncManager]:
+    """
+    Returns the Socket.IO client manager for the configured broker, or None for
+    the default in-process manager.
+
+    Raises:
+        ValueError: if the URL scheme is not supported
+    """
+    if not url:
+        return None
+    if url.startswith("local://"):
+        return LocalPubSubManager(channel=CHAT_CHANNEL)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return socketio.AsyncRedisManager(url, channel=CHAT_CHANNEL)
+    raise ValueError(f"Unsupported CHAT_MESSAGE_QUEUE_URL: {url}")
+
+
+# --- Relay (cross-process fan-out of chat bus messages for transports outside Socket.IO) ---
+
+class LocalRelay:
+    """
+    Publishes JSON payloads to every worker and hands those from other workers
+    to a callback. This stand-in runs over a LocalBroker; RedisRelay uses a
+    Redis channel.
+    """
+
+    def __init__(self, channel: str = f"{CHAT_CHANNEL}:bus", broker: Optional[LocalBroker] = None):
+        self.channel = channel
+        self.broker = broker or local_broker
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._on_message: Optional[Callable[[dict], Awaitable[None]]] = None
+
+    async def publish(self, payload: dict) -> None:
+        await self._send(json.dumps({"node_id": NODE_ID, "payload": payload}, default=str))
+
+    async def _send(self, data: str) -> None:
+        await self.broker.publish(self.channel, data)
+
+    async def _listen(self):
+        while True:
+            yield await self._queue.get()
+
+    async def _subscribe(self) -> None:
+        self._queue = self.broker.subscribe(self.channel)
+
+    async def _unsubscribe(self) -> None:
+        self.broker.unsubscribe(self.channel, self._queue)
+
+    async def _run(self) -> None:
+        async for data in self._listen():
+            try:
+                message = json.loads(data)
+                if message.get("node_id") == NODE_ID:
+                    continue
+                await self._on_message(message["payload"])
+            except Exception as e:
+                logger.error(f"Failed to handle a message relayed on {self.channel}: {e}")
+
+    async def start(self, on_message: Callable[[dict], Awaitable[None]]) -> None:
+        """Subscribes and starts handing other workers' payloads to on_message (called from application startup)."""
+        if self._task is not None and not self._task.done():
+            return
+        self._on_message = on_message
+        await self._subscribe()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stops listening (called from application shutdown)."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self._unsubscribe()
+
+
+class RedisRelay(LocalRelay):
+    """LocalRelay over a Redis pub/sub channel, shared by every worker using the same server."""
+
+    def __init__(self, url: str, channel: str = f"{CHAT_CHANNEL}:bus"):
+        super().__init__(channel)
+        try:
+            import redis.asyncio as aioredis
+        except ImportError as e:
+            raise RuntimeError("CHAT_MESSAGE_QUEUE_URL points at Redis but the redis package is not installed") from e
+        self._redis = aioredis.from_url(url, decode_responses=True)
+        self._pubsub = None
+
+    async def _send(self, data: str) -> None:
+        await self._redis.publish(self.channel, data)
+
+    async def _subscribe(self) -> None:
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(self.channel)
+
+    async def _unsubscribe(self) -> None:
+        await self._pubsub.unsubscribe(self.channel)
+        await self._pubsub.aclose()
+
+    async def _listen(self):
+        while True:
+            try:
+                async for message in self._pubsub.listen():
+                    if message.get("type") == "message":
+                        yield message["data"]
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Chat relay connection lost, resubscribing: {e}")
+                await asyncio.sleep(1)
+                await self._subscribe()
+
+
+def create_relay(url: str = CHAT_MESSAGE_QUEUE_URL, channel: str = f"{CHAT_CHANNEL}:bus"):
+    """
+    Returns a relay over the configured broker, or None when there is a single process.
+    The chat bus uses the default channel; other cross-worker signals pass their own.
+    """
+    if not url:
+        return None
+    if url.startswith("local://"):
+        return LocalRelay(channel)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisRelay(url, channel)
+    raise ValueError(f"Unsupported CHAT_MESSAGE_QUEUE_URL: {url}")
+
+
+# --- Presence (who is connected, on which worker, in which rooms) ---
+
+class PresenceRecord:
+    """
+    One connected socket. Slotted to stay small with thousands of connections;
+    last_seen is a time.monotonic() reading so idle checks are immune to clock changes.
+    """
+
+    __slots__ = ("sid", "user_type", "user_agent", "ip_address", "rooms", "connected_at", "last_seen", "node_id")
+
+    def __init__(self, sid: str, user_agent: str = "Unknown", ip_address: str = "Unknown",
+                 user_type: str = "unknown", node_id: str = NODE_ID):
+        self.sid = sid
+        self.user_type = user_type
+        self.user_agent = user_agent
+        self.ip_address = ip_address
+        self.rooms: Set[str] = set()
+        self.connected_at = time.time()
+        self.last_seen = time.monotonic()
+        self.node_id = node_id
+
+    def idle_seconds(self, now: Optional[float] = None) -> float:
+        return (now if now is not None else time.monotonic()) - self.last_seen
+
+    def to_dict(self) -> dict:
+        """The JSON form used by the API and by other workers."""
+        idle = self.idle_seconds()
+        return {
+            "sid": self.sid,
+            "user_type": self.user_type,
+            "rooms": sorted(self.rooms),
+            "user_agent": self.user_agent,
+            "ip_address": self.ip_address,
+            "connected_at": datetime.fromtimestamp(self.connected_at, timezone.utc).isoformat(),
+            "last_activity": datetime.fromtimestamp(time.time() - idle, timezone.utc).isoformat(),
+            "idle_seconds": round(idle, 1),
+            "node_id": self.node_id,
+        }
+
+
+class LocalPresenceStore:
+    """
+    Presence kept in this process; correct whenever all sockets live in one process.
+
+    Records are indexed by sid and by room, so room membership is a set lookup
+    rather than a scan. Empty rooms are dropped and removed sockets leave no
+    trace, so memory follows the number of live connections.
+    """
+
+    def __init__(self):
+        self._records: Dict[str, PresenceRecord] = {}
+        self._rooms: Dict[str, Set[str]] = {}
+
+    async def add(self, sid: str, user_agent: str = "Unknown", ip_address: str = "Unknown") -> PresenceRecord:
+        record = PresenceRecord(sid, user_agent=user_agent, ip_address=ip_address)
+        self._records[sid] = record
+        return record
+
+    async def touch(self, sid: str) -> bool:
+        """Records activity on a socket; returns False if sid is not connected to this worker."""
+        record = self._records.get(sid)
+        if record is None:
+            return False
+        record.last_seen = time.monotonic()
+        return True
+
+    async def join(self, sid: str, room: str, user_type: Optional[str] = None) -> bool:
+        record = self._records.get(sid)
+        if record is None:
+            return False
+        record.rooms.add(room)
+        if user_type:
+            record.user_type = user_type
+        record.last_seen = time.monotonic()
+        self._rooms.setdefault(room, set()).add(sid)
+        return True
+
+    async def leave(self, sid: str, room: str) -> bool:
+        record = self._records.get(sid)
+        if record is None or room not in record.rooms:
+            return False
+        record.rooms.discard(room)
+        record.last_seen = time.monotonic()
+        self._discard_member(room, sid)
+        return True
+
+    def _discard_member(self, room: str, sid: str) -> None:
+        members = self._rooms.get(room)
+        if members is not None:
+            members.discard(sid)
+            if not members:
+                del self._rooms[room]
+
+    async def remove(self, sid: str) -> Optional[PresenceRecord]:
+        """Forgets a socket; returns its record (None if it was not connected to this worker)."""
+        record = self._records.pop(sid, None)
+        if record is not None:
+            for room in record.rooms:
+                self._discard_member(room, sid)
+        return record
+
+    async def get(self, sid: str) -> Optional[dict]:
+        record = self._records.get(sid)
+        return record.to_dict() if record is not None else None
+
+    async def all(self) -> Dict[str, dict]:
+        return {sid: record.to_dict() for sid, record in self._records.items()}
+
+    async def count(self) -> int:
+        return len(self._records)
+
+    async def room_members(self, room: str) -> List[dict]:
+        return [self._records[sid].to_dict() for sid in self._rooms.get(room, ())]
+
+    def idle_sids(self, idle_timeout: float) -> List[str]:
+        """This worker's sockets with no activity for idle_timeout seconds."""
+        now = time.monotonic()
+        return [sid for sid, record in self._records.items() if record.idle_seconds(now) >= idle_timeout]
+
+    def start_keepalive(self) -> None:
+        pass
+
+    async def stop_keepalive(self) -> None:
+        pass
+
+
+class RedisPresenceStore(LocalPresenceStore):
+    """
+    Presence shared by all workers through a Redis-protocol server.
+
+    Each worker indexes its own sockets locally (see LocalPresenceStore) and
+    mirrors them into one hash per worker (<prefix>:node:<NODE_ID>) and one hash
+    per worker and room (<prefix>:room:<NODE_ID>:<room>). A keepalive keeps
+    rewriting those hashes and refreshing their TTL, so the entries of a worker
+    that dies expire on their own. Reads merge the hashes of every live worker.
+    """
+
+    def __init__(self, url: str, prefix: str = f"{CHAT_CHANNEL}:presence",
+                 ttl_seconds: float = CHAT_PRESENCE_TTL_SECONDS):
+        super().__init__()
+        try:
+            import redis.asyncio as aioredis
+        except ImportError as e:
+            raise RuntimeError("CHAT_MESSAGE_QUEUE_URL points at Redis but the redis package is not installed") from e
+        self._redis = aioredis.from_url(url, decode_responses=True)
+        self._prefix = prefix
+        self._key = f"{prefix}:node:{NODE_ID}"
+        self.ttl_seconds = ttl_seconds
+        self._keepalive_task: Optional[asyncio.Task] = None
+
+    def _room_key(self, room: str, node_id: str = NODE_ID) -> str:
+        return f"{self._prefix}:room:{node_id}:{room}"
+
+    async def _write(self, record: PresenceRecord, left_room: Optional[str] = None) -> None:
+        entry = json.dumps(record.to_dict())
+        ttl = int(self.ttl_seconds)
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                pipe.hset(self._key, record.sid, entry)
+                pipe.expire(self._key, ttl)
+                for room in record.rooms:
+                    pipe.hset(self._room_key(room), record.sid, entry)
+                    pipe.expire(self._room_key(room), ttl)
+                if left_room is not None:
+                    pipe.hdel(self._room_key(left_room), record.sid)
+                await pipe.execute()
+        except Exception as e:
+            # The keepalive rewrites every local entry, so a missed write heals itself
+            logger.error(f"Failed to publish presence for {record.sid}: {e}")
+
+    async def add(self, sid: str, user_agent: str = "Unknown", ip_address: str = "Unknown") -> PresenceRecord:
+        record = await super().add(sid, user_agent=user_agent, ip_address=ip_address)
+        await self._write(record)
+        return record
+
+    # touch() stays local: the keepalive publishes last_activity with everything else
+
+    async def join(self, sid: str, room: str, user_type: Optional[str] = None) -> bool:
+        if not await super().join(sid, room, user_type):
+            return False
+        await self._write(self._records[sid])
+        return True
+
+    async def leave(self, sid: str, room: str) -> bool:
+        if not await super().leave(sid, room):
+            return False
+        await self._write(self._records[sid], left_room=room)
+        return True
+
+    async def remove(self, sid: str) -> Optional[PresenceRecord]:
+        record = await super().remove(sid)
+        if record is not None:
+            try:
+                async with self._redis.pipeline(transaction=False) as pipe:
+                    pipe.hdel(self._key, sid)
+                    for room in record.rooms:
+                        pipe.hdel(self._room_key(room), sid)
+                    await pipe.execute()
+            except Exception as e:
+                logger.error(f"Failed to remove presence for {sid}: {e}")
+        return record
+
+    async def get(self, sid: str) -> Optional[dict]:
+        if sid in self._records:
+            return self._records[sid].to_dict()
+        async for key in self._redis.scan_iter(match=f"{self._prefix}:node:*"):
+            raw = await self._redis.hget(key, sid)
+            if raw is not None:
+                return json.loads(raw)
+        return None
+
+    async def all(self) -> Dict[str, dict]:
+        connections = {}
+        async for key in self._redis.scan_iter(match=f"{self._prefix}:node:*"):
+            if key != self._key:
+                for sid, raw in (await self._redis.hgetall(key)).items():
+                    connections[sid] = json.loads(raw)
+        connections.update(await super().all())
+        return connections
+
+    async def count(self) -> int:
+        total = len(self._records)
+        async for key in self._redis.scan_iter(match=f"{self._prefix}:node:*"):
+            if key != self._key:
+                total += await self._redis.hlen(key)
+        return total
+
+    async def room_members(self, room: str) -> List[dict]:
+        members = await super().room_members(room)
+        room_prefix = f"{self._prefix}:room:"
+        async for key in self._redis.scan_iter(match=f"{room_prefix}*:{_glob_escape(room)}"):
+            node_id, _, key_room = key[len(room_prefix):].partition(":")
+            if node_id != NODE_ID and key_room == room:
+                members.extend(json.loads(raw) for raw in (await self._redis.hgetall(key)).values())
+        return members
+
+    async def _refresh_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.ttl_seconds / 3)
+            if not self._records:
+                continue
+            ttl = int(self.ttl_seconds)
+            try:
+                entries = {sid: json.dumps(record.to_dict()) for sid, record in self._records.items()}
+                async with self._redis.pipeline(transaction=False) as pipe:
+                    pipe.hset(self._key, mapping=entries)
+                    pipe.expire(self._key, ttl)
+                    for room, sids in self._rooms.items():
+                        pipe.hset(self._room_key(room), mapping={sid: entries[sid] for sid in sids})
+                        pipe.expire(self._room_key(room), ttl)
+                    await pipe.execute()
+            except Exception as e:
+                logger.error(f"Presence keepalive failed: {e}")
+
+    def start_keepalive(self) -> None:
+        """Starts refreshing this worker's presence hashes (called from application startup)."""
+        if self._keepalive_task is None or self._keepalive_task.done():
+            self._keepalive_task = asyncio.create_task(self._refresh_periodically())
+
+    async def stop_keepalive(self) -> None:
+        """Stops the refresh task and withdraws this worker's entries (called from application shutdown)."""
+        if self._keepalive_task is not None:
+            self._keepalive_task.cancel()
+            try:
+                await self._keepalive_task
+            except asyncio.CancelledError:
+                pass
+            self._keepalive_task = None
+        try:
+            await self._redis.delete(self._key, *(self._room_key(room) for room in self._rooms))
+        except Exception as e:
+            logger.error(f"Failed to withdraw presence for node {NODE_ID}: {e}")
+
+
+def _glob_escape(value: str) -> str:
+    """Escapes Redis SCAN MATCH metacharacters."""
+    return "".join(f"\\{char}" if char in "*?[]\\" else char for char in value)
+
+
+class PresenceSweeper:
+    """
+    Periodically reaps presence records left behind by sockets that are gone.
+
+    Sockets idle for idle_timeout seconds are checked with is_connected (the
+    Socket.IO manager's view, which Engine.IO's ping/pong keeps current). A
+    reader who is merely quiet still answers pings and is left alone; only
+    records whose connection no longer exists (a missed disconnect) are
+    removed and handed to on_evicted, which announces them.
+    """
+
+    def __init__(self, store: LocalPresenceStore,
+                 on_evicted: Callable[[List[PresenceRecord]], Awaitable[None]],
+                 is_connected: Callable[[str], bool],
+                 idle_timeout: float = CHAT_IDLE_TIMEOUT_SECONDS,
+                 interval: float = CHAT_SWEEP_INTERVAL_SECONDS):
+        self.store = store
+        self._on_evicted = on_evicted
+        self._is_connected = is_connected
+        self.idle_timeout = idle_timeout
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def sweep(self) -> List[PresenceRecord]:
+        evicted = []
+        for sid in self.store.idle_sids(self.idle_timeout):
+            if self._is_connected(sid):
+                continue
+            record = await self.store.remove(sid)
+            if record is not None:
+                evicted.append(record)
+        if evicted:
+            try:
+                await self._on_evicted(evicted)
+            except Exception as e:
+                logger.error(f"Failed to announce {len(evicted)} evicted sockets: {e}")
+        return evicted
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Presence sweep failed: {e}")
+
+    def start(self) -> None:
+        """Starts the sweeper task (called from application startup)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stops the sweeper task (called from application shutdown)."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def create_presence_store(url: str = CHAT_MESSAGE_QUEUE_URL):
+    """Returns the presence store matching the configured broker."""
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisPresenceStore(url)
+    return LocalPresenceStore()
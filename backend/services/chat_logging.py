@@ -0,0 +1,129 @@
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+# Level of the chat event log and of python-socketio / python-engineio's own loggers
+CHAT_LOG_LEVEL = os.getenv("CHAT_LOG_LEVEL", "INFO")
+SOCKETIO_LOG_LEVEL = os.getenv("SOCKETIO_LOG_LEVEL", "WARNING")
+# Share of high-volume events (every message, typing, heartbeat) that are logged; all are counted
+CHAT_LOG_SAMPLE_RATE = float(os.getenv("CHAT_LOG_SAMPLE_RATE", "0.01"))
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, event and the event's fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        return json.dumps(entry, default=str)
+
+
+class ChatEventLog:
+    """
+    Structured, level-gated logging for the chat subsystem.
+
+    Every event() is counted in memory. It is only formatted and written when its
+    level is enabled and, for sampled events, when it wins the sample draw. Records
+    leave the event loop through a QueueHandler; a QueueListener thread formats and
+    writes them, so handlers never block on stdout.
+
+    The Socket.IO and Engine.IO loggers are children of the chat logger and go
+    through the same queue.
+    """
+
+    def __init__(self, name: str = "smartgov.chat", level: str = CHAT_LOG_LEVEL,
+                 socketio_level: str = SOCKETIO_LOG_LEVEL, sample_rate: float = CHAT_LOG_SAMPLE_RATE):
+        self.logger = logging.getLogger(name)
+        self.socketio_logger = logging.getLogger(f"{name}.socketio")
+        self.engineio_logger = logging.getLogger(f"{name}.engineio")
+        self.counters: Counter = Counter()
+        self.sample_rate = sample_rate
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._queue_handler = logging.handlers.QueueHandler(self._queue)
+        self._listener: Optional[logging.handlers.QueueListener] = None
+        self.configure(level=level, socketio_level=socketio_level)
+
+    def configure(self, level: Optional[str] = None, socketio_level: Optional[str] = None,
+                  sample_rate: Optional[float] = None) -> dict:
+        """
+        Changes levels and the sample rate at runtime.
+
+        Raises:
+            ValueError: for an unknown level name or a sample rate outside [0, 1]
+        """
+        if level is not None:
+            self.logger.setLevel(self._level(level))
+        if socketio_level is not None:
+            self.socketio_logger.setLevel(self._level(socketio_level))
+            self.engineio_logger.setLevel(self._level(socketio_level))
+        if sample_rate is not None:
+            if not 0 <= sample_rate <= 1:
+                raise ValueError("sample_rate must be between 0 and 1")
+            self.sample_rate = sample_rate
+        return self.settings()
+
+    @staticmethod
+    def _level(name: str) -> int:
+        level = logging.getLevelName(str(name).upper())
+        if not isinstance(level, int):
+            raise ValueError(f"Unknown log level: {name}")
+        return level
+
+    def settings(self) -> dict:
+        return {
+            "level": logging.getLevelName(self.logger.getEffectiveLevel()),
+            "socketio_level": logging.getLevelName(self.socketio_logger.getEffectiveLevel()),
+            "sample_rate": self.sample_rate,
+        }
+
+    def event(self, name: str, level: int = logging.INFO, sampled: bool = False, **fields) -> None:
+        """Counts an event and logs it if its level is enabled (and, when sampled, if it is drawn)."""
+        self.counters[name] += 1
+        if not self.logger.isEnabledFor(level):
+            return
+        if sampled and random.random() >= self.sample_rate:
+            return
+        self.logger.log(level, name, extra={"fields": fields})
+
+    def error(self, name: str, error: BaseException, **fields) -> None:
+        """Counts and logs a failed operation with its exception."""
+        self.event(name, logging.ERROR, error=f"{type(error).__name__}: {error}", **fields)
+
+    def snapshot(self) -> Dict[str, object]:
+        """Event counters since startup plus the current settings."""
+        return {"events": dict(self.counters), **self.settings()}
+
+    def start(self) -> None:
+        """Routes chat records through the queue to a JSON stdout handler (called from application startup)."""
+        if self._listener is not None:
+            return
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(JsonFormatter())
+        self._listener = logging.handlers.QueueListener(self._queue, handler, respect_handler_level=True)
+        self._listener.start()
+        self.logger.addHandler(self._queue_handler)
+        self.logger.propagate = False
+
+    def stop(self) -> None:
+        """Writes out queued records and stops the listener thread (called from application shutdown)."""
+        if self._listener is None:
+            return
+        self.logger.removeHandler(self._queue_handler)
+        self.logger.propagate = True
+        self._listener.stop()
+        self._listener = None
+
+
+chat_log = ChatEventLog()
@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+# A batch is written once it holds this many messages or its oldest message is this old
+CHAT_WRITE_BATCH_SIZE = int(os.getenv("CHAT_WRITE_BATCH_SIZE", "200"))
+CHAT_WRITE_FLUSH_INTERVAL_SECONDS = float(os.getenv("CHAT_WRITE_FLUSH_INTERVAL_MS", "20")) / 1000
+# Senders wait (backpressure) once this many messages are queued but not yet written
+CHAT_WRITE_MAX_PENDING = int(os.getenv("CHAT_WRITE_MAX_PENDING", "10000"))
+CHAT_WRITE_MAX_RETRIES = int(os.getenv("CHAT_WRITE_MAX_RETRIES", "5"))
+# "buffered": ack and broadcast before the write; "durable": only after the batch is committed
+CHAT_MESSAGE_DURABILITY = os.getenv("CHAT_MESSAGE_DURABILITY", "buffered")
+
+DUPLICATE_KEY_ERROR = 11000
+
+_STOP = object()
+
+
+class MessageWriteBehind:
+    """
+    Write-behind queue for chat messages.
+
+    submit() gives each message a client-side ObjectId and returns at once
+    with a future; a single writer task stores queued messages with
+    insert_many in micro-batches bounded by size and time. Failed batches are
+    retried with exponential backoff. Retries are idempotent: a duplicate _id
+    means an earlier attempt already stored that message.
+
+    on_batch_written, if given, is awaited with the stored messages of each
+    batch before their futures resolve. drained() lets a caller wait until
+    everything submitted so far is stored, e.g. before updating those messages.
+    """
+
+    def __init__(self, get_collection: Callable,
+                 on_batch_written: Optional[Callable[[List[dict]], Awaitable[None]]] = None,
+                 batch_size: int = CHAT_WRITE_BATCH_SIZE,
+                 flush_interval: float = CHAT_WRITE_FLUSH_INTERVAL_SECONDS,
+                 max_pending: int = CHAT_WRITE_MAX_PENDING,
+                 max_retries: int = CHAT_WRITE_MAX_RETRIES,
+                 retry_backoff: float = 0.05):
+        self._get_collection = get_collection
+        self._on_batch_written = on_batch_written
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._last_submitted: Optional[asyncio.Future] = None
+        self.stats = {"written": 0, "batches": 0, "retries": 0, "failed": 0}
+
+    def start(self) -> None:
+        """Starts the writer task (called from application startup; submit() also starts it on demand)."""
+        if self._writer_task is None or self._writer_task.done():
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._writer_task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Writes everything still queued, then stops the writer task (called from application shutdown)."""
+        if self._writer_task is None or self._writer_task.done():
+            return
+        await self._queue.put(_STOP)
+        await self._writer_task
+        self._writer_task = None
+
+    async def submit(self, document: dict) -> asyncio.Future:
+        """
+        Queues a message for writing and returns a future that resolves to its _id
+        once the message is stored (or raises if it could not be stored).
+
+        Waits only when max_pending messages are already queued.
+        """
+        document.setdefault("_id", ObjectId())
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((document, future))
+        self._last_submitted = future
+        return future
+
+    async def drained(self) -> None:
+        """
+        Waits until every message submitted before this call has been written
+        (or given up on). Batches are written in submission order, so the most
+        recently submitted message resolving means all earlier ones did.
+        """
+        future = self._last_submitted
+        if future is not None and not future.done():
+            await asyncio.wait([future])
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Tuple[dict, asyncio.Future]]) -> None:
+        documents = [document for document, _ in batch]
+        attempt = 0
+        while documents:
+            try:
+                await self._get_collection().insert_many(documents, ordered=False)
+                documents = []
+                break
+            except BulkWriteError as e:
+                failed_indexes = {
+                    error["index"] for error in e.details.get("writeErrors", [])
+                    if error.get("code") != DUPLICATE_KEY_ERROR
+                }
+                if not failed_indexes and not e.details.get("writeConcernErrors"):
+                    documents = []
+                    break
+                if failed_indexes:
+                    documents = [documents[index] for index in sorted(failed_indexes)]
+                last_error = e
+            except Exception as e:
+                last_error = e
+
+            attempt += 1
+            if attempt > self.max_retries:
+                break
+            self.stats["retries"] += 1
+            await asyncio.sleep(min(self.retry_backoff * 2 ** (attempt - 1), 5.0))
+
+        failed_ids = {document["_id"] for document in documents}
+        if failed_ids:
+            logger.error(f"Dropping {len(failed_ids)} chat messages after {self.max_retries} retries: {last_error}")
+
+        if self._on_batch_written is not None:
+            written = [document for document in (document for document, _ in batch) if document["_id"] not in failed_ids]
+            if written:
+                try:
+                    await self._on_batch_written(written)
+                except Exception as e:
+                    logger.error(f"on_batch_written failed for {len(written)} chat messages: {e}")
+
+        self.stats["batches"] += 1
+        self.stats["written"] += len(batch) - len(failed_ids)
+        self.stats["failed"] += len(failed_ids)
+        for document, future in batch:
+            if future.done():
+                continue
+            if document["_id"] in failed_ids:
+                future.set_exception(RuntimeError(f"Message {document['_id']} could not be saved: {last_error}"))
+                # Buffered senders never await the future; don't warn about an unretrieved exception
+                future.exception()
+            else:
+                future.set_result(document["_id"])
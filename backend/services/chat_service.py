@@ -1,39 +1,61 @@
+import json
+
 from database_config import db
-from datetime import datetime
+from core.connection_manager import manager
+from services.chat_bus import chat_bus, chat_message, legacy_message, message_writer
+from services.conversations import mark_conversation_read
 
 messages_collection = db.messages
 
 
 async def save_message(sender_id: str, receiver_id: str,service_id:str,appointment_id: str, message_text: str):
-    """Saves a chat message to the database."""
-    message = {
-        "sender_id": sender_id,
-        "receiver_id": receiver_id,
-        "service_id":service_id,
-        "appointment_id": appointment_id,
-        "message_text": message_text,
-        "timestamp": datetime.now(),
-        "is_read": False
-    }
-    
-    await messages_collection.insert_one(message)
-    return message
+    """
+    Saves a chat message and delivers it on every chat transport.
+    The message takes the shared chat bus path (see services.chat_bus), so
+    Socket.IO clients see it too.
+    """
+    message = chat_message(
+        sender_id,
+        receiver_id,
+        message_text,
+        service_id=service_id,
+        appointment_id=appointment_id
+    )
+    return legacy_message(await chat_bus.publish(message, origin="ws"))
+
+
+async def deliver_to_websockets(envelope):
+    """Chat bus subscriber for /ws/{client_id} clients: every socket of the receiver gets the message."""
+    receiver_id = envelope.message.get("receiver_id")
+    if receiver_id and manager.is_connected(receiver_id):
+        await manager.send_personal_message(json.dumps(legacy_message(envelope.message)), receiver_id)
+
+
+# /ws connections live in one process: deliver messages published on any worker
+chat_bus.subscribe(deliver_to_websockets, every_node=True)
 
 
 async def mark_messages_as_read(reader_id: str, sender_id: str):
     """
     Marks all unread messages from a specific sender to the reader as read.
+    The conversation's unread counter is reset first; when it was already zero
+    there is nothing to flag and the messages collection is not touched.
     """
+    if not await mark_conversation_read(reader_id, sender_id):
+        return 0
+    # Messages counted as unread may still be in the write-behind queue
+    await message_writer.drained()
+
     # Find all messages sent BY the 'sender_id' TO the 'reader_id'
-    # that are currently unread.
+    # that are currently unread (older messages carry is_read, current ones read).
     query = {
         "sender_id": sender_id,
         "receiver_id": reader_id,
-        "is_read": False
+        "$nor": [{"read": True}, {"is_read": True}]
     }
 
-    # Set the 'is_read' field to true for all matching documents.
-    update = {"$set": {"is_read": True}}
+    # Mark them read under both field names.
+    update = {"$set": {"read": True, "is_read": True}}
 
     # Use update_many to modify all matching messages in one operation.
     result = await messages_collection.update_many(query, update)
@@ -0,0 +1,77 @@
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from database_config import collection_messages
+
+logger = logging.getLogger(__name__)
+
+# Messages rewritten per bulk write by the startup backfill
+TIMESTAMP_BACKFILL_BATCH = 1000
+
+
+def parse_message_timestamp(value) -> Optional[datetime]:
+    """
+    A message time as the naive UTC datetime MongoDB stores, or None if value is not one.
+
+    Accepts datetimes (aware ones are converted to UTC, naive ones are taken as
+    UTC), ISO 8601 strings and epoch seconds or milliseconds, as clients send them.
+    """
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.strip())
+        except ValueError:
+            return None
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        try:
+            value = datetime.fromtimestamp(value / 1000 if value > 1e11 else value, timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def message_timestamp(value=None) -> datetime:
+    """
+    The timestamp stored on a chat message: value normalised to UTC, or the
+    current UTC time when it is missing or cannot be parsed. History pages
+    order on (timestamp, _id), so every message must carry the same BSON type.
+    """
+    return parse_message_timestamp(value) or datetime.utcnow()
+
+
+async def ensure_message_timestamps() -> int:
+    """
+    Called on startup: rewrites timestamps stored before they were normalised
+    (client ISO strings, or none at all) as UTC datetimes. A message whose
+    timestamp cannot be parsed gets its _id's creation time. Once every message
+    has a date this is a single query that matches nothing.
+
+    Returns:
+        int: how many messages were rewritten
+    """
+    updates, rewritten = [], 0
+    async for message in collection_messages.find({"timestamp": {"$not": {"$type": "date"}}}, {"timestamp": 1}):
+        timestamp = parse_message_timestamp(message.get("timestamp"))
+        if timestamp is None:
+            message_id = message["_id"]
+            if not isinstance(message_id, ObjectId):
+                continue
+            timestamp = message_id.generation_time.replace(tzinfo=None)
+        updates.append(UpdateOne({"_id": message["_id"]}, {"$set": {"timestamp": timestamp}}))
+        if len(updates) >= TIMESTAMP_BACKFILL_BATCH:
+            await collection_messages.bulk_write(updates, ordered=False)
+            rewritten += len(updates)
+            updates = []
+    if updates:
+        await collection_messages.bulk_write(updates, ordered=False)
+        rewritten += len(updates)
+    if rewritten:
+        logger.info(f"Normalised the timestamps of {rewritten} chat messages to UTC dates")
+    return rewritten
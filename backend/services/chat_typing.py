@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Typing events for the same (room, user) within this window are merged into one broadcast
+CHAT_TYPING_WINDOW_SECONDS = float(os.getenv("CHAT_TYPING_WINDOW_MS", "300")) / 1000
+# A user shown as typing who sends nothing for this long is broadcast as stopped
+CHAT_TYPING_TIMEOUT_SECONDS = float(os.getenv("CHAT_TYPING_TIMEOUT_SECONDS", "6"))
+# Per-socket token bucket: sustained typing events per second and burst size
+CHAT_TYPING_RATE_PER_SECOND = float(os.getenv("CHAT_TYPING_RATE_PER_SECOND", "5"))
+CHAT_TYPING_BURST = int(os.getenv("CHAT_TYPING_BURST", "10"))
+
+
+class _TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst: int):
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self, rate: float, burst: int) -> bool:
+        now = time.monotonic()
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class _TypingState:
+    __slots__ = ("published", "pending", "sid", "last_typing", "flush_task", "expiry_task")
+
+    def __init__(self, sid: str):
+        self.published = False
+        self.pending = False
+        self.sid = sid
+        self.last_typing = 0.0
+        self.flush_task: Optional[asyncio.Task] = None
+        self.expiry_task: Optional[asyncio.Task] = None
+
+
+class TypingCoalescer:
+    """
+    Debounces typing indicators per (room, user).
+
+    Incoming events only update the pending state; at most one broadcast per
+    window is made, and only when the state actually changes (started/stopped
+    typing). A user left "typing" without further events is stopped after
+    timeout seconds. Each socket is rate limited by a token bucket; events over
+    the limit are dropped. stats counts what was received, emitted and suppressed.
+
+    emit(room, user_id, is_typing, skip_sid) performs the broadcast.
+    """
+
+    def __init__(self, emit: Callable[[str, str, bool, Optional[str]], Awaitable[None]],
+                 window: float = CHAT_TYPING_WINDOW_SECONDS,
+                 timeout: float = CHAT_TYPING_TIMEOUT_SECONDS,
+                 rate_per_second: float = CHAT_TYPING_RATE_PER_SECOND,
+                 burst: int = CHAT_TYPING_BURST):
+        self._emit = emit
+        self.window = window
+        self.timeout = timeout
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self._states: Dict[Tuple[str, str], _TypingState] = {}
+        self._buckets: Dict[str, _TokenBucket] = {}
+        self.stats = {"received": 0, "emitted": 0, "unchanged": 0, "coalesced": 0, "rate_limited": 0, "expired": 0}
+
+    def submit(self, sid: str, room: str, user_id: str, is_typing: bool) -> bool:
+        """
+        Records a typing event. Returns False if it was dropped by the rate limit.
+        Never waits: broadcasts happen in the background once the window closes.
+        """
+        self.stats["received"] += 1
+        bucket = self._buckets.get(sid)
+        if bucket is None:
+            bucket = self._buckets[sid] = _TokenBucket(self.burst)
+        if not bucket.take(self.rate_per_second, self.burst):
+            self.stats["rate_limited"] += 1
+            return False
+
+        key = (room, str(user_id))
+        state = self._states.get(key)
+        if state is None:
+            if not is_typing:
+                # Nobody was shown as typing; stopping changes nothing
+                self.stats["unchanged"] += 1
+                return True
+            state = self._states[key] = _TypingState(sid)
+        state.sid = sid
+        state.pending = bool(is_typing)
+        if is_typing:
+            state.last_typing = time.monotonic()
+
+        if state.flush_task is not None:
+            self.stats["coalesced"] += 1
+        elif state.pending == state.published:
+            self.stats["unchanged"] += 1
+        else:
+            state.flush_task = asyncio.create_task(self._flush_later(key, state))
+        return True
+
+    def socket_gone(self, sid: str) -> None:
+        """Forgets a disconnected socket and stops every typing indicator it left on."""
+        self._buckets.pop(sid, None)
+        for key, state in list(self._states.items()):
+            if state.sid == sid and (state.published or state.pending):
+                state.pending = False
+                if state.flush_task is None:
+                    state.flush_task = asyncio.create_task(self._flush_later(key, state, delay=0))
+
+    async def _flush_later(self, key: Tuple[str, str], state: _TypingState, delay: Optional[float] = None) -> None:
+        await asyncio.sleep(self.window if delay is None else delay)
+        state.flush_task = None
+        await self._publish(key, state)
+
+    async def _expire_later(self, key: Tuple[str, str], state: _TypingState) -> None:
+        while state.published:
+            remaining = state.last_typing + self.timeout - time.monotonic()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(remaining)
+        state.expiry_task = None
+        if state.published and state.flush_task is None:
+            self.stats["expired"] += 1
+            state.pending = False
+            await self._publish(key, state)
+
+    async def _publish(self, key: Tuple[str, str], state: _TypingState) -> None:
+        if state.pending != state.published:
+            state.published = state.pending
+            room, user_id = key
+            try:
+                await self._emit(room, user_id, state.published, state.sid)
+                self.stats["emitted"] += 1
+            except Exception as e:
+                logger.error(f"Failed to broadcast typing state for {user_id} in {room}: {e}")
+        if state.published:
+            if state.expiry_task is None:
+                state.expiry_task = asyncio.create_task(self._expire_later(key, state))
+        elif state.flush_task is None and self._states.get(key) is state:
+            # Idle again: keep nothing around for this (room, user)
+            del self._states[key]
+
+    async def stop(self) -> None:
+        """Cancels pending broadcasts and expiries (called from application shutdown)."""
+        tasks = [task for state in self._states.values() for task in (state.flush_task, state.expiry_task) if task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._states.clear()
+        self._buckets.clear()
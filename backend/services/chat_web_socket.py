@@ -1,14 +1,24 @@
+import base64
+import logging
 import socketio
 from pymongo.mongo_client import MongoClient
-from bson import ObjectId
+from bson import ObjectId, json_util
 # Corrected: Use absolute imports and import the module
 import database_config
 from models import user
+from services.chat_cluster import create_client_manager, create_presence_store, PresenceSweeper
+from services.chat_bus import chat_bus, chat_message, message_writer, get_chat_collection, MessageNotSaved
+from services.conversations import mark_conversation_read, get_unread_conversations, peer_of
+from services.chat_logging import chat_log
+from services.chat_timestamps import message_timestamp
+from services.chat_typing import TypingCoalescer
 
 # --- WebSocket Setup ---
 # Create the Socket.IO server instance here with proper CORS configuration
+# With CHAT_MESSAGE_QUEUE_URL set, emits and room operations fan out to every worker through the broker
 sio = socketio.AsyncServer(
     async_mode="asgi",
+    client_manager=create_client_manager(),
     cors_allowed_origins=[
         "http://localhost:5173",
         "http://127.0.0.1:5173",
@@ -17,33 +27,96 @@ sio = socketio.AsyncServer(
         "https://127.0.0.1:5173",
         "https://localhost:3000",
     ],
-    logger=True,
-    engineio_logger=True
+    # Socket.IO/Engine.IO internals log through the chat event log's queue (SOCKETIO_LOG_LEVEL)
+    logger=chat_log.socketio_logger,
+    engineio_logger=chat_log.engineio_logger
 )
 # When mounting the Socket.IO app under "/socket.io" in FastAPI, the sub-app should
 # handle requests at its root, so set socketio_path to empty.
 socket_app = socketio.ASGIApp(sio, socketio_path="")
 
-# --- Database Collection Helper ---
-def get_chat_collection():
-    """Returns the messages collection from the database."""
-    return database_config.db["messages"]
+# Messages from every chat transport are stored and fanned out through services.chat_bus
+# (get_chat_collection and message_writer are re-exported from there)
 
 # --- Service Logic for Chat History and Users ---
 
-async def get_chat_history_service(user_id: str, db):
-    """Fetches the chat history for a specific user from the database."""
-    collection = db["messages"]
-    messages = []
-    async for message in collection.find({
-        "$or": [
-            {"sender_id": user_id},
-            {"receiver_id": user_id}
-        ]
-    }).sort("timestamp", 1):
+# Page size bounds for chat history
+DEFAULT_CHAT_HISTORY_LIMIT = 50
+MAX_CHAT_HISTORY_LIMIT = 200
+
+# Fields returned by the history endpoints
+CHAT_HISTORY_PROJECTION = {
+    "sender_id": 1, "receiver_id": 1, "content": 1, "message_text": 1, "timestamp": 1,
+    "message_type": 1, "read": 1, "read_at": 1, "is_read": 1, "service_id": 1, "appointment_id": 1
+}
+
+def encode_history_cursor(message: dict) -> str:
+    """Opaque cursor for a message's (timestamp, _id) position; keeps BSON types (date vs string)."""
+    position = json_util.dumps({"t": message.get("timestamp"), "id": message["_id"]})
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+def decode_history_cursor(cursor: str):
+    """Returns the (timestamp, _id) encoded in a cursor; raises ValueError for a malformed one."""
+    try:
+        position = json_util.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return position["t"], ObjectId(position["id"])
+    except Exception:
+        raise ValueError("Invalid history cursor")
+
+async def get_chat_history_page(collection, query: dict, limit: int = DEFAULT_CHAT_HISTORY_LIMIT,
+                                before: str = None, after: str = None) -> dict:
+    """
+    Keyset-paginated read of the messages matching query, ordered by (timestamp, _id).
+
+    Without a cursor the newest `limit` messages are returned; `before` pages
+    towards older messages and `after` towards newer ones. Each page costs one
+    indexed range scan regardless of how long the conversation is.
+
+    Returns:
+        dict: {"messages": [...] oldest first, "before": cursor for the previous (older) page,
+        "after": cursor for the next (newer) page, "has_more": whether more messages exist in
+        the direction that was read}
+
+    Raises:
+        ValueError: if a cursor is malformed or both cursors are given
+    """
+    if before and after:
+        raise ValueError("Use either before or after, not both")
+    limit = max(1, min(limit, MAX_CHAT_HISTORY_LIMIT))
+
+    if after:
+        timestamp, message_id = decode_history_cursor(after)
+        position = {"$or": [{"timestamp": {"$gt": timestamp}}, {"timestamp": timestamp, "_id": {"$gt": message_id}}]}
+        direction = 1
+    else:
+        position = None
+        if before:
+            timestamp, message_id = decode_history_cursor(before)
+            position = {"$or": [{"timestamp": {"$lt": timestamp}}, {"timestamp": timestamp, "_id": {"$lt": message_id}}]}
+        direction = -1
+
+    filters = {"$and": [query, position]} if position else query
+    messages = await collection.find(filters, CHAT_HISTORY_PROJECTION) \
+        .sort([("timestamp", direction), ("_id", direction)]) \
+        .limit(limit + 1) \
+        .to_list(limit + 1)
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if direction == -1:
+        messages.reverse()
+
+    before_cursor = encode_history_cursor(messages[0]) if messages and (has_more or direction == 1) else None
+    after_cursor = encode_history_cursor(messages[-1]) if messages else after
+    for message in messages:
         message["_id"] = str(message["_id"])
-        messages.append(message)
-    return messages
+
+    return {"messages": messages, "before": before_cursor, "after": after_cursor, "has_more": has_more}
+
+async def get_chat_history_service(user_id: str, db, limit: int = DEFAULT_CHAT_HISTORY_LIMIT,
+                                   before: str = None, after: str = None) -> dict:
+    """Fetches one page of the chat history for a specific user from the database."""
+    query = {"$or": [{"sender_id": user_id}, {"receiver_id": user_id}]}
+    return await get_chat_history_page(db["messages"], query, limit=limit, before=before, after=after)
 
 async def get_chat_users_service(db):
     """Fetches all non-admin users for the admin chat list."""
@@ -62,21 +135,41 @@ async def get_chat_users_service(db):
 
 # --- Real-time WebSocket Event Handlers ---
 
-# Store active connections
-active_connections = {}
+# Active connections, shared between workers when a message broker is configured
+presence = create_presence_store()
+
+def socket_connected(sid) -> bool:
+    """Whether this worker still has the socket (Engine.IO drops it once pings go unanswered)."""
+    return sio.manager.is_connected(sid, "/")
+
+async def announce_evicted(records):
+    """Tells each room which of its sockets are gone without a disconnect event having cleaned them up."""
+    left_by_room = {}
+    for record in records:
+        for room in record.rooms:
+            left_by_room.setdefault(room, []).append(record.sid)
+    timestamp = str(ObjectId())
+    for room, sids in left_by_room.items():
+        await sio.emit("presence_changed", {
+            "room": room,
+            "left": sids,
+            "reason": "stale",
+            "timestamp": timestamp
+        }, room=room)
+    for record in records:
+        chat_log.event("presence_reaped", sid=record.sid, rooms=sorted(record.rooms))
+
+# Reaps presence of sockets that are gone (checked after CHAT_IDLE_TIMEOUT_SECONDS without events;
+# started with the application). Live sockets are never disconnected.
+presence_sweeper = PresenceSweeper(presence, announce_evicted, socket_connected)
 
 @sio.event
 async def connect(sid, environ):
     """Handles a new client connection."""
-    print(f"Socket connected: {sid}")
+    chat_log.event("socket_connected", sid=sid)
     # Store the connection with more detailed info
-    active_connections[sid] = {
-        "connected_at": str(ObjectId()),
-        "rooms": [],
-        "user_agent": environ.get("HTTP_USER_AGENT", "Unknown"),
-        "ip_address": environ.get("REMOTE_ADDR", "Unknown"),
-        "last_activity": str(ObjectId())
-    }
+    await presence.add(sid, user_agent=environ.get("HTTP_USER_AGENT", "Unknown"),
+                       ip_address=environ.get("REMOTE_ADDR", "Unknown"))
     
     # Send connection confirmation
     await sio.emit("connection_confirmed", {
@@ -88,11 +181,13 @@ async def connect(sid, environ):
 @sio.event
 async def disconnect(sid):
     """Handles a client disconnection."""
-    print(f"Socket disconnected: {sid}")
-    # Remove the connection
-    if sid in active_connections:
+    chat_log.event("socket_disconnected", sid=sid)
+    typing_coalescer.socket_gone(sid)
+    # Remove the connection (already gone if the sweeper evicted it)
+    record = await presence.remove(sid)
+    if record:
         # Notify other users in the same rooms that this user left
-        for room in active_connections[sid].get("rooms", []):
+        for room in record.rooms:
             try:
                 await sio.emit("user_disconnected", {
                     "sid": sid,
@@ -100,33 +195,26 @@ async def disconnect(sid):
                     "timestamp": str(ObjectId())
                 }, room=room, skip_sid=sid)
             except Exception as e:
-                print(f"Error notifying room {room} about disconnect: {e}")
-        
-        del active_connections[sid]
+                chat_log.error("disconnect_notify_failed", e, sid=sid, room=room)
 
 @sio.on("join_room")
 async def join_room(sid, data):
     """Allows a client to join a specific chat room."""
     room = data.get("room")
     user_type = data.get("user_type", "user")  # "user" or "admin"
+    user_id = data.get("user_id")
+    
+    if user_id:
+        # Personal room: receives messages addressed to this id from the other chat transports
+        await sio.enter_room(sid, user_room(user_id))
     
     if room:
         await sio.enter_room(sid, room)
         
         # Store room information
-        if sid in active_connections:
-            active_connections[sid]["rooms"].append(room)
-            active_connections[sid]["user_type"] = user_type
+        await presence.join(sid, room, user_type=user_type)
             
-        print(f"{user_type} {sid} joined room: {room}")
-        
-        # Debug: Show all sockets in the room
-        try:
-            # Use the default namespace '/'
-            room_sockets = sio.manager.get_participants('/', room)
-            print(f"All sockets in room {room}: {list(room_sockets)}")
-        except Exception as e:
-            print(f"Could not get room participants: {e}")
+        chat_log.event("room_joined", sid=sid, room=room, user_type=user_type)
         
         # Notify others in the room that someone joined
         await sio.emit("user_joined", {
@@ -144,10 +232,9 @@ async def leave_room(sid, data):
         await sio.leave_room(sid, room)
         
         # Remove room from stored information
-        if sid in active_connections and room in active_connections[sid]["rooms"]:
-            active_connections[sid]["rooms"].remove(room)
+        await presence.leave(sid, room)
             
-        print(f"{sid} left room: {room}")
+        chat_log.event("room_left", sid=sid, room=room)
         
         # Notify others in the room that someone left
         await sio.emit("user_left", {
@@ -155,81 +242,97 @@ async def leave_room(sid, data):
             "timestamp": str(ObjectId())
         }, room=room)
 
+def user_room(user_id) -> str:
+    """Personal room of a user or admin id; joined with join_room's user_id."""
+    return f"user:{user_id}"
+
+def is_admin_id(sender_id) -> bool:
+    # Admin IDs are typically smaller numbers (< 10000), user IDs/NICs are longer
+    return sender_id == "admin" or (str(sender_id).isdigit() and len(str(sender_id)) <= 4)
+
+async def deliver_to_socketio(envelope):
+    """
+    Chat bus subscriber for Socket.IO clients.
+
+    Messages sent over Socket.IO go to the room they were sent in (not echoed to
+    the sender); messages from other transports go to the receiver's personal room.
+    Messages from users also notify the admin dashboard.
+    """
+    message = envelope.message
+    if envelope.origin == "socketio":
+        await sio.emit("receive_message", message, room=envelope.room, skip_sid=envelope.skip_sid)
+    elif message.get("receiver_id"):
+        await sio.emit("receive_message", message, room=user_room(message["receiver_id"]))
+
+    sender_id = message.get("sender_id")
+    if not is_admin_id(sender_id):
+        content = message.get("content") or ""
+        await sio.emit("new_user_message", {
+            "user_id": sender_id,
+            "room": envelope.room or user_room(sender_id),
+            "preview": content[:50] + "..." if len(content) > 50 else content,
+            "timestamp": message.get("timestamp")
+        }, room="admin_dashboard")
+        chat_log.event("admin_notified", logging.DEBUG, sampled=True, sender_id=sender_id, room=envelope.room)
+
+chat_bus.subscribe(deliver_to_socketio)
+
 @sio.on("send_message")
 async def send_message(sid, data):
-    """Handles incoming messages, saves them, and broadcasts them."""
+    """
+    Handles incoming messages, saves them, and broadcasts them.
+
+    The message is published on the chat bus, which queues it for a batched write
+    and delivers it on every transport. In the default "buffered" durability mode
+    it is broadcast and acknowledged straight away; with CHAT_MESSAGE_DURABILITY=durable
+    both wait until the batch is committed.
+    Returns the ack sent to the sender's callback.
+    """
     try:
-        # Use the database instance directly from database_config
-        db = database_config.db
-        collection = db["messages"]
-        
+        await presence.touch(sid)
         room = data.get("room")
-        # Normalize IDs to strings to ensure consistent matching across clients
-        sender_id = data.get("sender_id")
-        receiver_id = data.get("receiver_id")
-        try:
-            sender_id = str(sender_id) if sender_id is not None else None
-            receiver_id = str(receiver_id) if receiver_id is not None else None
-        except Exception:
-            pass
-
-        message_data = {
-            "sender_id": sender_id,
-            "receiver_id": receiver_id,
-            "content": data.get("content"),
-            "timestamp": data.get("timestamp"),
-            "message_type": data.get("message_type", "text")
-        }
-
-        print(f"Processing message from {message_data['sender_id']} to {message_data['receiver_id']} in room {room}")
-
-        # Save message to the database (continue even if this fails)
-        try:
-            result = await collection.insert_one(message_data)
-            message_data["_id"] = str(result.inserted_id)
-            print(f"Message saved to database with ID: {message_data['_id']}")
-        except Exception as db_error:
-            print(f"Failed to save message to database: {db_error}")
-            # Continue processing even if database save fails
-            message_data["_id"] = str(ObjectId())  # Generate a temporary ID
-
-        # Broadcast the message to the room (excluding the sender to prevent echo)
-        print(f"Broadcasting message to room {room} (excluding sender {sid})")
-        await sio.emit("receive_message", message_data, room=room, skip_sid=sid)
-        print(f"Message sent in room {room}: {message_data['content'][:50]}...")
-        
-        # Also emit to all sockets in the room for debugging
-        try:
-            room_sockets = sio.manager.get_participants('/', room)
-            print(f"Sockets in room {room}: {list(room_sockets)}")
-        except Exception as e:
-            print(f"Could not get room participants: {e}")
-        
-        # Emit to admin dashboard for notifications if sender is user (not admin)
-        # Admin IDs are typically smaller numbers (< 10000), user IDs/NICs are longer
-        sender_id = data.get("sender_id")
-        is_admin_sender = (
-            sender_id == "admin" or 
-            (isinstance(sender_id, (int, str)) and str(sender_id).isdigit() and len(str(sender_id)) <= 4)
+        message = chat_message(
+            data.get("sender_id"),
+            data.get("receiver_id"),
+            data.get("content"),
+            timestamp=data.get("timestamp"),
+            message_type=data.get("message_type", "text"),
+            service_id=data.get("service_id"),
+            appointment_id=data.get("appointment_id")
         )
-        
-        if not is_admin_sender:
-            print(f"Sending notification to admin dashboard for user message from {sender_id}")
-            await sio.emit("new_user_message", {
-                "user_id": sender_id,
-                "room": room,
-                "preview": message_data["content"][:50] + "..." if len(message_data["content"]) > 50 else message_data["content"],
-                "timestamp": message_data["timestamp"]
-            }, room="admin_dashboard")
-        else:
-            print(f"Not sending notification - message from admin {sender_id}")
+
+        try:
+            message = await chat_bus.publish(message, origin="socketio", room=room, skip_sid=sid)
+        except MessageNotSaved as db_error:
+            chat_log.error("message_save_failed", db_error, sid=sid)
+            await sio.emit("message_error", {
+                "error": "Failed to save message",
+                "details": str(db_error)
+            }, room=sid)
+            return {"status": "error", "persisted": False}
+
+        chat_log.event("message_sent", logging.DEBUG, sampled=True, sid=sid, room=room,
+                       message_id=message["_id"], sender_id=message["sender_id"],
+                       receiver_id=message["receiver_id"])
+        return {"status": "ok", "_id": message["_id"], "persisted": chat_bus.durable}
             
     except Exception as e:
-        print(f"Error sending message: {e}")
+        chat_log.error("message_send_failed", e, sid=sid)
         await sio.emit("message_error", {
             "error": "Failed to send message",
             "details": str(e)
         }, room=sid)
+        return {"status": "error", "details": str(e)}
+
+async def broadcast_typing(room, user_id, is_typing, skip_sid):
+    await sio.emit("user_typing", {
+        "user_id": user_id,
+        "is_typing": is_typing,
+        "room": room
+    }, room=room, skip_sid=skip_sid)
+
+# Typing events are merged per (room, user) and only state changes are broadcast (see services.chat_typing)
+typing_coalescer = TypingCoalescer(broadcast_typing)
 
 @sio.on("typing")
 async def handle_typing(sid, data):
@@ -238,33 +341,52 @@ async def handle_typing(sid, data):
     user_id = data.get("user_id")
     is_typing = data.get("is_typing", False)
     
+    chat_log.event("typing", logging.DEBUG, sampled=True, sid=sid, room=room)
+    await presence.touch(sid)
     if room and user_id:
-        await sio.emit("user_typing", {
-            "user_id": user_id,
-            "is_typing": is_typing,
-            "room": room
-        }, room=room, skip_sid=sid)
+        typing_coalescer.submit(sid, room, user_id, is_typing)
 
 @sio.on("mark_read")
 async def mark_messages_read(sid, data):
-    """Marks messages as read."""
+    """
+    Marks messages as read.
+
+    With peer_id (the other participant) only that conversation is marked; without it,
+    every conversation in which the reader has unread messages. The unread counter is
+    reset in O(1) on the conversation document, and per-message flags are only touched
+    for conversations that actually had unread messages.
+    """
     try:
+        await presence.touch(sid)
         db = database_config.db
         collection = db["messages"]
         
         room = data.get("room")
         user_id = data.get("user_id")
+        peer_id = data.get("peer_id")
         
-        # Update messages as read
-        await collection.update_many(
-            {
-                "receiver_id": user_id,
-                "read": {"$ne": True}
-            },
-            {
-                "$set": {"read": True, "read_at": data.get("timestamp")}
-            }
-        )
+        if peer_id:
+            peer_ids = [peer_id]
+        else:
+            peer_ids = [peer_of(conversation, user_id) for conversation in await get_unread_conversations(user_id)]
+        
+        for peer in peer_ids:
+            if await mark_conversation_read(user_id, peer):
+                # Messages counted as unread may still be in the write-behind queue
+                await message_writer.drained()
+                # Update messages as read (only this conversation, via the sender/receiver index)
+                await collection.update_many(
+                    {
+                        "sender_id": str(peer),
+                        "receiver_id": user_id,
+                        "read": {"$ne": True}
+                    },
+                    {
+                        "$set": {"read": True, "is_read": True, "read_at": message_timestamp(data.get("timestamp"))}
+                    }
+                )
+        
+        chat_log.event("messages_marked_read", logging.DEBUG, sampled=True, sid=sid, conversations=len(peer_ids))
         
         # Notify the sender that messages were read
         await sio.emit("messages_read", {
@@ -274,13 +396,13 @@ async def mark_messages_read(sid, data):
         }, room=room, skip_sid=sid)
         
     except Exception as e:
-        print(f"Error marking messages as read: {e}")
+        chat_log.error("mark_read_failed", e, sid=sid)
 
 @sio.on("heartbeat")
 async def handle_heartbeat(sid, data):
     """Handles heartbeat to keep connections alive."""
-    if sid in active_connections:
-        active_connections[sid]["last_activity"] = str(ObjectId())
+    chat_log.event("heartbeat", logging.DEBUG, sampled=True, sid=sid)
+    if await presence.touch(sid):
         await sio.emit("heartbeat_ack", {
             "timestamp": str(ObjectId())
         }, room=sid)
@@ -291,19 +413,16 @@ async def get_online_users(sid, data):
     room = data.get("room")
     
     if room:
-        # Get all sockets in the room
-        room_sockets = sio.manager.get_participants(sio.namespace, room)
-        
-        online_users = []
-        for socket_id in room_sockets:
-            if socket_id in active_connections:
-                conn_info = active_connections[socket_id]
-                online_users.append({
-                    "socket_id": socket_id,
-                    "user_type": conn_info.get("user_type", "unknown"),
-                    "connected_at": conn_info.get("connected_at"),
-                    "last_activity": conn_info.get("last_activity")
-                })
+        # Served from the presence store's room index, which covers sockets on other workers
+        online_users = [
+            {
+                "socket_id": member["sid"],
+                "user_type": member.get("user_type", "unknown"),
+                "connected_at": member.get("connected_at"),
+                "last_activity": member.get("last_activity")
+            }
+            for member in await presence.room_members(room)
+        ]
         
         await sio.emit("online_users_list", {
             "room": room,
@@ -314,8 +433,8 @@ async def get_online_users(sid, data):
 @sio.on("get_connection_info")
 async def get_connection_info(sid, data):
     """Returns connection information for the current socket."""
-    if sid in active_connections:
-        conn_info = active_connections[sid].copy()
+    conn_info = await presence.get(sid)
+    if conn_info:
         await sio.emit("connection_info", conn_info, room=sid)
     else:
         await sio.emit("connection_info", {"error": "Connection not found"}, room=sid)
\ No newline at end of file
@@ -0,0 +1,297 @@
+import base64
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from bson import ObjectId, json_util
+from pymongo import ReturnDocument, UpdateOne
+
+from database_config import collection_conversations, collection_messages, collection_users
+from services.chat_timestamps import message_timestamp
+
+logger = logging.getLogger(__name__)
+
+# Characters of the message kept on the conversation for previews
+PREVIEW_LENGTH = 100
+
+# Page size bounds for the inbox
+DEFAULT_INBOX_LIMIT = 30
+MAX_INBOX_LIMIT = 100
+
+# The user fields shown next to an inbox entry (no profile_picture or credentials)
+INBOX_USER_PROJECTION = {"nic": 1, "first_name": 1, "last_name": 1, "email": 1, "phone_number": 1, "user_id": 1}
+
+
+def conversation_id(participant_a, participant_b) -> str:
+    """The same id for both directions of a conversation between two participants."""
+    return "|".join(sorted((str(participant_a), str(participant_b))))
+
+
+def _participant_key(participant) -> str:
+    """Escapes a participant id for use as a field name ('.' and a leading '$' are not allowed)."""
+    return str(participant).replace("%", "%25").replace(".", "%2E").replace("$", "%24")
+
+
+def _participant_key_expression(participant: str) -> dict:
+    """_participant_key() as an aggregation expression ("$" is a $literal, else it would read as a field path)."""
+    expression = participant
+    for character, escaped in (("%", "%25"), (".", "%2E"), ("$", "%24")):
+        expression = {"$replaceAll": {"input": expression, "find": {"$literal": character}, "replacement": escaped}}
+    return expression
+
+
+def _message_time(message: dict) -> datetime:
+    """The message's time as a UTC datetime, normalised the way chat_message() stores it."""
+    return message_timestamp(message.get("timestamp"))
+
+
+def _conversation_update(message: dict) -> UpdateOne:
+    """One atomic upsert that records a message on its conversation and bumps the receiver's unread count."""
+    sender_id, receiver_id = str(message["sender_id"]), str(message["receiver_id"])
+    content = message.get("content") or message.get("message_text") or ""
+    now = datetime.utcnow()
+    sent_at = _message_time(message)
+    unread = {f"unread.{_participant_key(receiver_id)}": 1}
+    if sender_id != receiver_id:
+        # $inc by 0 makes sure the sender has a counter too
+        unread[f"unread.{_participant_key(sender_id)}"] = 0
+    return UpdateOne(
+        {"_id": conversation_id(sender_id, receiver_id)},
+        {
+            "$setOnInsert": {"participants": sorted((sender_id, receiver_id)), "created_at": now},
+            "$set": {
+                "last_message": {
+                    "_id": message.get("_id"),
+                    "sender_id": sender_id,
+                    "preview": content[:PREVIEW_LENGTH],
+                    "message_type": message.get("message_type", "text"),
+                    "timestamp": sent_at
+                },
+                "last_message_at": sent_at,
+                "updated_at": now
+            },
+            "$inc": unread
+        },
+        upsert=True
+    )
+
+
+async def record_messages(messages: Iterable[dict]) -> None:
+    """
+    Applies messages to their conversations in one ordered bulk write (the chat
+    bus calls it as each message is published, before delivery).
+    Failures are logged, never raised, so a counter problem cannot lose a message.
+    """
+    updates = [
+        _conversation_update(message) for message in messages
+        if message.get("sender_id") is not None and message.get("receiver_id") is not None
+    ]
+    if not updates:
+        return
+    try:
+        await collection_conversations.bulk_write(updates, ordered=True)
+    except Exception as e:
+        logger.error(f"Failed to update conversations for {len(updates)} messages: {e}")
+
+
+async def mark_conversation_read(reader_id, peer_id) -> int:
+    """
+    Resets the reader's unread count for one conversation and records the last message they have seen.
+
+    Returns:
+        int: how many messages were unread before this call
+    """
+    reader_key = _participant_key(reader_id)
+    previous = await collection_conversations.find_one_and_update(
+        {"_id": conversation_id(reader_id, peer_id)},
+        [{"$set": {
+            f"unread.{reader_key}": 0,
+            f"last_read.{reader_key}": "$last_message._id",
+            "updated_at": "$$NOW"
+        }}],
+        projection={f"unread.{reader_key}": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    if not previous:
+        return 0
+    return int((previous.get("unread") or {}).get(reader_key, 0))
+
+
+async def get_unread_conversations(participant_id) -> List[dict]:
+    """The conversations in which participant_id has unread messages, from the conversation index."""
+    key = _participant_key(participant_id)
+    return await collection_conversations.find(
+        {"participants": str(participant_id), f"unread.{key}": {"$gt": 0}},
+        {"participants": 1, f"unread.{key}": 1}
+    ).to_list(None)
+
+
+def peer_of(conversation: dict, participant_id) -> Optional[str]:
+    """The other participant of a conversation."""
+    others = [p for p in conversation.get("participants", []) if p != str(participant_id)]
+    return others[0] if others else None
+
+
+async def get_unread_counts(participant_id) -> Dict[str, int]:
+    """Unread badge counts for a participant: {peer_id: unread messages}."""
+    key = _participant_key(participant_id)
+    return {
+        peer_of(conversation, participant_id): conversation["unread"][key]
+        for conversation in await get_unread_conversations(participant_id)
+    }
+
+
+def encode_inbox_cursor(conversation: dict) -> str:
+    """Opaque cursor for a conversation's (last_message_at, _id) position in the inbox."""
+    position = json_util.dumps({"t": conversation.get("last_message_at"), "id": conversation["_id"]})
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_inbox_cursor(cursor: str):
+    """Returns the (last_message_at, _id) encoded in a cursor; raises ValueError for a malformed one."""
+    try:
+        position = json_util.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return position["t"], str(position["id"])
+    except Exception:
+        raise ValueError("Invalid inbox cursor")
+
+
+async def _inbox_users(peer_ids: List[str]) -> Dict[str, dict]:
+    """Minimal user documents for the peers of an inbox page, keyed by the id used in chat (NIC or _id)."""
+    object_ids = [ObjectId(peer) for peer in peer_ids if ObjectId.is_valid(peer)]
+    query = {"nic": {"$in": peer_ids}}
+    if object_ids:
+        query = {"$or": [query, {"_id": {"$in": object_ids}}]}
+    users = {}
+    async for user in collection_users.find(query, INBOX_USER_PROJECTION):
+        user["_id"] = str(user["_id"])
+        for key in (user.get("nic"), user["_id"]):
+            if key in peer_ids:
+                users.setdefault(key, user)
+    return users
+
+
+async def get_inbox_page(participant_ids: Iterable, limit: int = DEFAULT_INBOX_LIMIT, before: str = None) -> dict:
+    """
+    One page of an inbox: the conversations of any of participant_ids (e.g. "admin"
+    and the admin's own id), most recent first, keyset-paginated on (last_message_at, _id).
+
+    Costs one indexed read on conversations plus one $in query on users for the
+    whole page, however many conversations there are.
+
+    Returns:
+        dict: {"conversations": [{"conversation_id", "peer_id", "user", "last_message",
+        "last_message_at", "unread"}], "before": cursor for the next (older) page, "has_more"}
+
+    Raises:
+        ValueError: if the cursor is malformed
+    """
+    own_ids = [str(participant) for participant in participant_ids]
+    limit = max(1, min(limit, MAX_INBOX_LIMIT))
+
+    query = {"participants": {"$in": own_ids}}
+    if before:
+        last_message_at, conversation = decode_inbox_cursor(before)
+        query = {"$and": [query, {"$or": [
+            {"last_message_at": {"$lt": last_message_at}},
+            {"last_message_at": last_message_at, "_id": {"$lt": conversation}}
+        ]}]}
+
+    conversations = await collection_conversations.find(
+        query, {"participants": 1, "last_message": 1, "last_message_at": 1, "unread": 1}
+    ).sort([("last_message_at", -1), ("_id", -1)]).limit(limit + 1).to_list(limit + 1)
+    has_more = len(conversations) > limit
+    conversations = conversations[:limit]
+
+    own_keys = [_participant_key(participant) for participant in own_ids]
+    peers = {}
+    for conversation in conversations:
+        others = [p for p in conversation.get("participants", []) if p not in own_ids]
+        peers[conversation["_id"]] = others[0] if others else conversation["participants"][0]
+    users = await _inbox_users(list(set(peers.values()))) if peers else {}
+
+    entries = []
+    for conversation in conversations:
+        peer_id = peers[conversation["_id"]]
+        last_message = dict(conversation.get("last_message") or {})
+        if last_message.get("_id") is not None:
+            last_message["_id"] = str(last_message["_id"])
+        unread = conversation.get("unread") or {}
+        entries.append({
+            "conversation_id": conversation["_id"],
+            "peer_id": peer_id,
+            "user": users.get(peer_id),
+            "last_message": last_message,
+            "last_message_at": conversation.get("last_message_at"),
+            "unread": sum(unread.get(key, 0) for key in own_keys)
+        })
+
+    return {
+        "conversations": entries,
+        "before": encode_inbox_cursor(conversations[-1]) if conversations and has_more else None,
+        "has_more": has_more
+    }
+
+
+def _rebuild_pipeline() -> List[dict]:
+    """Aggregation that recomputes every conversation from the messages collection."""
+    conversation_key = {"$cond": [
+        {"$lte": ["$sender_id", "$receiver_id"]},
+        {"$concat": ["$sender_id", "|", "$receiver_id"]},
+        {"$concat": ["$receiver_id", "|", "$sender_id"]}
+    ]}
+    return [
+        {"$match": {"sender_id": {"$type": "string"}, "receiver_id": {"$type": "string"}}},
+        {"$sort": {"timestamp": 1, "_id": 1}},
+        {"$group": {
+            "_id": {"conversation": conversation_key, "receiver_id": "$receiver_id"},
+            # Socket.IO messages use "read", REST/WebSocket ones "is_read"
+            "unread": {"$sum": {"$cond": [{"$or": [{"$eq": ["$read", True]}, {"$eq": ["$is_read", True]}]}, 0, 1]}},
+            "last": {"$last": "$$ROOT"}
+        }},
+        {"$sort": {"last.timestamp": 1, "last._id": 1}},
+        {"$group": {
+            "_id": "$_id.conversation",
+            # Keyed like live updates, so the counters they increment are the ones rebuilt here
+            "unread": {"$push": {"k": _participant_key_expression("$_id.receiver_id"), "v": "$unread"}},
+            "last": {"$last": "$last"}
+        }},
+        {"$project": {
+            "participants": {"$split": ["$_id", "|"]},
+            "unread": {"$arrayToObject": "$unread"},
+            "last_message": {
+                "_id": "$last._id",
+                "sender_id": "$last.sender_id",
+                "preview": {"$substrCP": [{"$ifNull": ["$last.content", {"$ifNull": ["$last.message_text", ""]}]}, 0, PREVIEW_LENGTH]},
+                "message_type": {"$ifNull": ["$last.message_type", "text"]},
+                "timestamp": "$last.timestamp"
+            },
+            "last_message_at": {"$cond": [
+                {"$eq": [{"$type": "$last.timestamp"}, "date"]}, "$last.timestamp", {"$toDate": "$last._id"}
+            ]},
+            "created_at": "$$NOW",
+            "updated_at": "$$NOW"
+        }},
+        {"$merge": {
+            "into": collection_conversations.name,
+            "on": "_id",
+            "whenMatched": "replace",
+            "whenNotMatched": "insert"
+        }}
+    ]
+
+
+async def rebuild_conversations() -> None:
+    """
+    Recompute the conversations collection from the messages.
+    Used to backfill on first start and to repair drift after manual data fixes.
+    """
+    await collection_conversations.delete_many({})
+    await collection_messages.aggregate(_rebuild_pipeline(), allowDiskUse=True).to_list(None)
+
+
+async def ensure_conversations() -> None:
+    """Called on startup: backfill the conversations collection the first time it is used."""
+    if await collection_conversations.estimated_document_count() == 0:
+        logger.info("Backfilling conversations from messages")
+        await rebuild_conversations()
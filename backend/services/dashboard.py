@@ -2,6 +2,7 @@ from motor.motor_asyncio import AsyncIOMotorClient
 from bson import ObjectId
 from typing import List, Dict, Any, Optional
 from database_config import collection_main_services, collection_sub_services, collection_required_documents
+from services.service_catalog import service_catalog, CachedPayload
 
 # Get all main services 
 async def get_all_main_services(db: AsyncIOMotorClient) -> List[Dict[str, Any]]:
@@ -67,3 +68,32 @@ async def get_sub_service_details(db: AsyncIOMotorClient, main_service_id: str,
         
         return service
     return None
+
+
+# --- Cached catalog responses ---
+# The dashboard_services endpoints serve these pre-serialised payloads from the
+# in-memory catalog snapshot instead of querying MongoDB on every page load.
+
+async def _get_cached_payload(section: str, key: Optional[str] = None) -> Optional[CachedPayload]:
+    """Looks up a payload in the catalog snapshot, reloading once (rate limited) on a miss."""
+    snapshot = await service_catalog.get_snapshot()
+    if key is None:
+        return getattr(snapshot, section)
+
+    payload = getattr(snapshot, section).get(key)
+    if payload is None:
+        snapshot = await service_catalog.get_snapshot(service_catalog.miss_refresh_seconds)
+        payload = getattr(snapshot, section).get(key)
+    return payload
+
+async def get_main_services_payload() -> CachedPayload:
+    """Serialised list of all main services."""
+    return await _get_cached_payload("main_services")
+
+async def get_sub_services_payload(main_service_id: str) -> Optional[CachedPayload]:
+    """Serialised sub-service list for a main service, or None if the main service does not exist."""
+    return await _get_cached_payload("sub_service_lists", main_service_id)
+
+async def get_sub_service_details_payload(main_service_id: str, sub_service_id: str) -> Optional[CachedPayload]:
+    """Serialised details (required documents, payment amount) for a sub-service, or None if not found."""
+    return await _get_cached_payload("sub_service_details", sub_service_id)
@@ -0,0 +1,159 @@
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from bson import ObjectId
+
+from database_config import db
+
+logger = logging.getLogger(__name__)
+
+
+class IndexSpec(NamedTuple):
+    """
+    One index and the query shape it exists for.
+
+    query/sort are a representative instance of that shape (placeholder
+    values); explain_query_shapes() runs them through explain().
+    """
+    collection: str
+    keys: List[Tuple[str, int]]
+    query: Dict[str, Any]
+    sort: Optional[List[Tuple[str, int]]] = None
+    options: Dict[str, Any] = {}
+
+
+_SAMPLE_ID = ObjectId()
+_SAMPLE_DAY = datetime(2000, 1, 1)
+
+# Every index the services rely on. Names are left to MongoDB (e.g. "user_id_1_is_fully_completed_1")
+# so indexes that already exist under the default name are recognised instead of duplicated.
+INDEX_REGISTRY: List[IndexSpec] = [
+    # users: sign-in / profile lookups and appointment user resolution (services.user_identity)
+    IndexSpec("users", [("email", 1)], {"email": "user@example.com"}, options={"unique": True}),
+    IndexSpec("users", [("nic", 1)], {"nic": "000000000V"}, options={"unique": True}),
+    IndexSpec("users", [("user_id", 1)], {"user_id": 1}, options={"sparse": True}),
+    IndexSpec("admins", [("email", 1)], {"email": "admin@example.com"}, options={"unique": True}),
+    IndexSpec("admins", [("admin_id", 1)], {"admin_id": "admin"}, options={"unique": True}),
+
+    # AppoinmentNew: per-day service views and insights, per-user appointment lists
+    IndexSpec("AppoinmentNew", [("sub_service_id", 1), ("appointment_date", 1)],
+              {"sub_service_id": _SAMPLE_ID, "appointment_date": {"$gte": _SAMPLE_DAY, "$lte": _SAMPLE_DAY}}),
+    IndexSpec("AppoinmentNew", [("user_id", 1), ("is_fully_completed", 1)],
+              {"user_id": "user", "is_fully_completed": True}),
+    IndexSpec("AppoinmentNew", [("user_id", 1), ("appointment_confirmed", 1)],
+              {"user_id": "user", "appointment_confirmed": True}),
+    # Admin appointments-by-sub-service list, paginated on _id
+    IndexSpec("AppoinmentNew", [("sub_service_id", 1), ("appointment_confirmed", 1), ("_id", 1)],
+              {"sub_service_id": _SAMPLE_ID, "appointment_confirmed": True, "_id": {"$gt": _SAMPLE_ID}},
+              sort=[("_id", 1)]),
+
+    # uploaded_documents: looked up by booking_id (admin dashboard) and appointment_id (admin portal)
+    IndexSpec("uploaded_documents", [("booking_id", 1)], {"booking_id": "booking"}),
+    IndexSpec("uploaded_documents", [("appointment_id", 1)], {"appointment_id": _SAMPLE_ID}),
+    # ...and by content hash: blob reference counts and dedup stats (services.blob_store)
+    IndexSpec("uploaded_documents", [("sha256", 1)], {"sha256": "0" * 64}),
+
+    # messages: chat history pages are keyset reads on (timestamp, _id). "both" is an $or over
+    # the two directions (one index per branch, merged in order); inbound/outbound match both ids
+    IndexSpec("messages", [("sender_id", 1), ("timestamp", 1), ("_id", 1)],
+              {"$or": [{"sender_id": "user"}, {"receiver_id": "user"}]}, sort=[("timestamp", -1), ("_id", -1)]),
+    IndexSpec("messages", [("receiver_id", 1), ("timestamp", 1), ("_id", 1)],
+              {"receiver_id": "user", "timestamp": {"$lt": _SAMPLE_DAY}}, sort=[("timestamp", -1), ("_id", -1)]),
+    IndexSpec("messages", [("sender_id", 1), ("receiver_id", 1), ("timestamp", 1), ("_id", 1)],
+              {"sender_id": "user", "receiver_id": {"$in": ["admin", "1"]}}, sort=[("timestamp", -1), ("_id", -1)]),
+
+    # conversations: a participant's conversations, most recent first (inbox, unread badges)
+    IndexSpec("conversations", [("participants", 1), ("last_message_at", -1), ("_id", -1)],
+              {"participants": {"$in": ["admin", "1"]}}, sort=[("last_message_at", -1), ("_id", -1)]),
+
+    # document_jobs: scoring queue claimed oldest-available first; finished jobs expire after a week
+    IndexSpec("document_jobs", [("status", 1), ("available_at", 1)],
+              {"status": {"$in": ["queued", "running"]}, "available_at": {"$lte": _SAMPLE_DAY}},
+              sort=[("available_at", 1)]),
+    IndexSpec("document_jobs", [("finished_at", 1)], {"finished_at": {"$lt": _SAMPLE_DAY}},
+              options={"expireAfterSeconds": 7 * 24 * 3600}),
+
+    # ratings: one rating per appointment
+    IndexSpec("ratings", [("appointment_id", 1)], {"appointment_id": "appointment"}),
+
+    # insights: direct insight lookups by service and date range
+    IndexSpec("insights", [("sub_service_id", 1), ("date", 1)],
+              {"sub_service_id": "sub_service", "date": {"$gte": _SAMPLE_DAY, "$lte": _SAMPLE_DAY}}),
+    IndexSpec("insights", [("main_service_id", 1), ("date", 1)],
+              {"main_service_id": "main_service", "date": {"$gte": _SAMPLE_DAY, "$lte": _SAMPLE_DAY}}),
+]
+
+
+async def ensure_indexes(registry: List[IndexSpec] = INDEX_REGISTRY) -> List[str]:
+    """
+    Creates every registered index. Safe to run on each startup: create_index is a
+    no-op for an index that already exists. A failing index is logged and skipped.
+
+    Returns:
+        list: names of the indexes that are in place
+    """
+    names = []
+    for spec in registry:
+        try:
+            names.append(await db[spec.collection].create_index(spec.keys, **spec.options))
+        except Exception as e:
+            logger.warning(f"Could not create index {spec.keys} on {spec.collection}: {e}")
+    return names
+
+
+def _plan_nodes(plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Flattens a winningPlan tree (inputStage, inputStages, queryPlan) into a list of its nodes."""
+    nodes = [plan]
+    children = list(plan.get("inputStages", [])) + [plan[key] for key in ("inputStage", "queryPlan") if key in plan]
+    for child in children:
+        nodes.extend(_plan_nodes(child))
+    return nodes
+
+
+async def explain_query_shapes(registry: List[IndexSpec] = INDEX_REGISTRY) -> List[Dict[str, Any]]:
+    """
+    Runs explain() for the query shape behind each registered index.
+
+    Returns:
+        list: one entry per shape with the winning plan's stages, the indexes it
+        used and collection_scan=True when any part of the plan is a COLLSCAN
+    """
+    report = []
+    for spec in registry:
+        entry = {
+            "collection": spec.collection,
+            "index": [list(key) for key in spec.keys],
+            "query": {key: str(value) for key, value in spec.query.items()},
+        }
+        try:
+            cursor = db[spec.collection].find(spec.query)
+            if spec.sort:
+                cursor = cursor.sort(spec.sort)
+            plan = await cursor.explain()
+            nodes = _plan_nodes(plan.get("queryPlanner", {}).get("winningPlan", {}))
+            stages = [node["stage"] for node in nodes if "stage" in node]
+            entry["stages"] = stages
+            entry["indexes_used"] = sorted({node["indexName"] for node in nodes if "indexName" in node})
+            entry["collection_scan"] = "COLLSCAN" in stages
+        except Exception as e:
+            entry["error"] = str(e)
+            entry["collection_scan"] = None
+        report.append(entry)
+    return report
+
+
+if __name__ == "__main__":
+    # python -m services.db_indexes [--create]: print the explain() report from the command line
+    import asyncio
+    import sys
+
+    async def _main():
+        if "--create" in sys.argv:
+            print(f"Indexes in place: {await ensure_indexes()}")
+        for entry in await explain_query_shapes():
+            flag = "COLLSCAN" if entry["collection_scan"] else ("ERROR" if "error" in entry else "ok")
+            detail = entry.get("error") or ", ".join(entry["indexes_used"]) or " > ".join(entry["stages"])
+            print(f"[{flag:8}] {entry['collection']:20} {entry['index']}  {detail}")
+
+    asyncio.run(_main())
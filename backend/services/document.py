@@ -1,10 +1,100 @@
 from datetime import datetime
 from uuid import uuid4
+import hashlib
 import os
+from typing import Optional, Tuple
+import logging
 import aiofiles
+import aiofiles.os
+from bson import ObjectId
 from fastapi import HTTPException, status, UploadFile
 from schemas.document import DocumentUpload, UploadDocumentRequest
-from database_config import collection_uploaded_documents
+from database_config import collection_apointment, collection_uploaded_documents
+from models import UserInDB
+from services.blob_store import document_store
+from services.document_scoring import document_scoring
+from services.document_previews import preview_url
+from services.user_identity import resolve_user
+
+logger = logging.getLogger(__name__)
+
+MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+# Uploads are read, hashed and written this many bytes at a time; bounds memory per upload
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+async def _remove_quietly(path: str) -> None:
+    try:
+        await aiofiles.os.remove(path)
+    except OSError:
+        pass
+
+
+async def get_uploaded_document(document_id: str) -> Optional[dict]:
+    """An uploaded_documents record by id, or None for an unknown or malformed id."""
+    if not ObjectId.is_valid(document_id):
+        return None
+    return await collection_uploaded_documents.find_one({"_id": ObjectId(document_id)})
+
+
+def download_url(document_id) -> str:
+    """Link to an uploaded document's file (see routes.document_files)."""
+    return f"/api/v1/documents/{document_id}/file"
+
+
+async def user_owns_document(document: dict, user: UserInDB) -> bool:
+    """
+    Whether the document belongs to one of the user's appointments.
+
+    Uploads reference their appointment by booking_id (the appointment _id as a
+    string) or appointment_id; the appointment's user_id is resolved the same
+    way the admin views resolve it (services.user_identity).
+    """
+    appointment_id = document.get("appointment_id") or document.get("booking_id")
+    if not appointment_id or not ObjectId.is_valid(str(appointment_id)):
+        return False
+    appointment = await collection_apointment.find_one({"_id": ObjectId(str(appointment_id))}, {"user_id": 1})
+    if appointment is None:
+        return False
+    owner = await resolve_user(appointment.get("user_id"))
+    return owner is not None and user.id is not None and str(owner["_id"]) == str(user.id)
+
+
+async def stream_upload_to_temp(file: UploadFile, directory: str, max_size: int = MAX_FILE_SIZE) -> Tuple[str, int, str]:
+    """
+    Copies an upload into a temporary file in directory, one chunk at a time,
+    enforcing max_size and computing the SHA-256 on the way.
+
+    The temp file lives next to its final location so it can be moved into
+    place with an atomic rename; the caller owns it and must rename or remove it.
+
+    Returns:
+        tuple: (temp_path, size in bytes, sha256 hex digest)
+
+    Raises:
+        HTTPException: 413 once the upload exceeds max_size (the temp file is removed)
+    """
+    temp_path = os.path.join(directory, f".{uuid4().hex}.part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(temp_path, "wb") as f:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"File size too large. Maximum size is {max_size // (1024 * 1024)}MB"
+                    )
+                digest.update(chunk)
+                await f.write(chunk)
+    except BaseException:
+        await _remove_quietly(temp_path)
+        raise
+    return temp_path, size, digest.hexdigest()
 
 
 async def uploaded_document(request: UploadDocumentRequest, file: UploadFile ) -> DocumentUpload:
@@ -22,35 +112,17 @@ async def uploaded_document(request: UploadDocumentRequest, file: UploadFile ) -
                 detail="No file provided"
             )
 
-        # Check file size (optional - e.g., max 10MB)
-        MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
-        file_content = await file.read()
-        if len(file_content) > MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                detail="File size too large. Maximum size is 10MB"
-            )
-
-        # Reset file pointer after reading
-        await file.seek(0)
-
         # Generate unique doc_id
         doc_id = str(uuid4().int)[:8]
 
-        # Create upload directory
-        upload_dir = "uploads"
-        os.makedirs(upload_dir, exist_ok=True)
-        
-        # Generate unique filename to prevent conflicts
-        file_extension = os.path.splitext(file.filename)[1]
-        unique_filename = f"{request.booking_id}_{doc_id}_{file.filename}"
-        file_path = os.path.join(upload_dir, unique_filename)
-
-        # Save file to disk
+        # Stream the upload to a temp file (size limit enforced and hash computed as it arrives),
+        # then hand it to the content-addressed store: new content is renamed into place,
+        # content that is already stored (the same scan uploaded again) is not written twice
+        temp_path, file_size, sha256 = await stream_upload_to_temp(file, await document_store.prepare())
         try:
-            async with aiofiles.open(file_path, 'wb') as f:
-                await f.write(file_content)
+            file_path, deduplicated = await document_store.put(temp_path, sha256, file_size)
         except Exception as e:
+            await _remove_quietly(temp_path)
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Failed to save file: {str(e)}"
@@ -63,32 +135,43 @@ async def uploaded_document(request: UploadDocumentRequest, file: UploadFile ) -
             "required_doc_id": request.required_doc_id,
             "file_name": file.filename,
             "original_filename": file.filename,
-            "stored_filename": unique_filename,
+            "stored_filename": os.path.relpath(file_path, document_store.root),
             "file_path": file_path,
-            "file_size": len(file_content),
+            "file_size": file_size,
+            "sha256": sha256,
             "content_type": file.content_type,
             "accuracy": None,
             "doc_status": "pending",
             "uploaded_at": datetime.now()
         }
 
-        # Insert into MongoDB
-        result = await collection_uploaded_documents.insert_one(document_data)
+        # Insert into MongoDB; the record is the blob's reference
+        try:
+            result = await collection_uploaded_documents.insert_one(document_data)
+        except Exception:
+            result = None
 
-        if not result.inserted_id:
-            # If DB insert fails, clean up the saved file
-            try:
-                os.remove(file_path)
-            except:
-                pass
+        if not result or not result.inserted_id:
+            # If DB insert fails, drop the blob unless other documents still reference it
+            await document_store.release(sha256)
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to insert document into MongoDB"
             )
 
+        # Accuracy is computed in the background (services.document_scoring); the upload returns now
+        try:
+            await document_scoring.enqueue(result.inserted_id, file_path, file.content_type, sha256)
+        except Exception as e:
+            logger.warning(f"Could not queue document {doc_id} for scoring: {e}")
+
         return DocumentUpload(
             document_id=doc_id,
-            file_path=file_path,
+            # The blob path stays internal; the client gets the authorized download route
+            file_path=download_url(result.inserted_id),
+            download_url=download_url(result.inserted_id),
+            thumbnail_url=preview_url(result.inserted_id, "thumb"),
+            preview_url=preview_url(result.inserted_id, "preview"),
             status="uploaded",
             timestamp=datetime.now()
         )
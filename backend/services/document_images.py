@@ -0,0 +1,147 @@
+# CPU-bound image work on uploaded documents. Runs in worker processes, so this
+# module only imports the imaging libraries (no database or web framework).
+import os
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+
+# Blur (variance of the Laplacian) and contrast are measured on a copy whose longer side is this long,
+# so scores do not depend on the scan resolution
+ANALYSIS_MAX_SIDE = 1600
+# Reference values that earn a full sub-score
+SHARP_LAPLACIAN_VARIANCE = 300.0
+GOOD_SHORT_SIDE_PIXELS = 1000
+GOOD_CONTRAST_STDDEV = 60.0
+# Weights of the sub-scores in accuracy (sum to 1)
+SCORE_WEIGHTS = {"sharpness": 0.5, "resolution": 0.25, "contrast": 0.25}
+
+
+class UnsupportedDocument(Exception):
+    """The file cannot be decoded into an image (e.g. a PDF without a PDF renderer installed)."""
+
+
+def _render_pdf_page(file_path: str, max_side: Optional[int], grayscale: bool = True) -> np.ndarray:
+    """First page of a PDF as a grayscale or BGR image (rendered with pypdfium2)."""
+    try:
+        import pypdfium2 as pdfium
+    except ImportError as e:
+        raise UnsupportedDocument("PDF rendering needs the pypdfium2 package") from e
+    try:
+        pdf = pdfium.PdfDocument(file_path)
+    except pdfium.PdfiumError as e:
+        raise UnsupportedDocument(f"Cannot open {os.path.basename(file_path)} as a PDF: {e}") from e
+    try:
+        page = pdf[0]
+        width, height = page.get_size()
+        # Render at 150 dpi, or smaller when a max_side is requested
+        scale = 150 / 72
+        if max_side:
+            scale = min(scale, max_side / max(width, height))
+        image = page.render(scale=scale, grayscale=grayscale).to_numpy()
+    finally:
+        pdf.close()
+    # Grayscale renders come back as (h, w, 1), colour ones as BGR or BGRx
+    if image.ndim == 3 and image.shape[2] == 1:
+        image = image[:, :, 0]
+    elif image.ndim == 3 and image.shape[2] == 4:
+        image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+    if grayscale and image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return np.ascontiguousarray(image)
+
+
+def is_pdf(file_path: str, content_type: Optional[str] = None) -> bool:
+    if content_type == "application/pdf" or file_path.lower().endswith(".pdf"):
+        return True
+    with open(file_path, "rb") as f:
+        return f.read(5) == b"%PDF-"
+
+
+def load_document_image(file_path: str, content_type: Optional[str] = None, max_side: Optional[int] = None,
+                        grayscale: bool = True) -> np.ndarray:
+    """
+    Decodes an uploaded image, or the first page of an uploaded PDF.
+
+    Raises:
+        UnsupportedDocument: if the file cannot be decoded
+    """
+    if is_pdf(file_path, content_type):
+        return _render_pdf_page(file_path, max_side, grayscale)
+    image = cv2.imread(file_path, cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR)
+    if image is None:
+        raise UnsupportedDocument(f"Cannot decode {os.path.basename(file_path)} as an image")
+    return image
+
+
+def _fit(image: np.ndarray, max_side: int) -> np.ndarray:
+    height, width = image.shape[:2]
+    scale = max_side / max(height, width)
+    if scale >= 1:
+        return image
+    return cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+
+
+def score_document(file_path: str, content_type: Optional[str] = None) -> Dict[str, float]:
+    """
+    Image-quality and legibility metrics of a scanned document.
+
+    Returns:
+        dict: blur_variance, width, height, contrast, the 0..1 sub-scores and
+        accuracy (0..100, the weighted sub-scores)
+
+    Raises:
+        UnsupportedDocument: if the file cannot be decoded
+    """
+    image = load_document_image(file_path, content_type)
+    height, width = image.shape[:2]
+    analysed = _fit(image, ANALYSIS_MAX_SIDE)
+
+    blur_variance = float(cv2.Laplacian(analysed, cv2.CV_64F).var())
+    contrast = float(analysed.std())
+
+    scores = {
+        "sharpness": min(1.0, blur_variance / SHARP_LAPLACIAN_VARIANCE),
+        "resolution": min(1.0, min(width, height) / GOOD_SHORT_SIDE_PIXELS),
+        "contrast": min(1.0, contrast / GOOD_CONTRAST_STDDEV),
+    }
+    accuracy = 100 * sum(SCORE_WEIGHTS[name] * value for name, value in scores.items())
+    return {
+        "blur_variance": round(blur_variance, 2),
+        "width": int(width),
+        "height": int(height),
+        "contrast": round(contrast, 2),
+        **{f"{name}_score": round(value, 3) for name, value in scores.items()},
+        "accuracy": round(accuracy, 1),
+    }
+
+
+# Encoders for preview derivatives: (cv2 extension, encoder params, media type)
+PREVIEW_ENCODINGS = {
+    "webp": (".webp", [cv2.IMWRITE_WEBP_QUALITY, 80], "image/webp"),
+    "jpeg": (".jpg", [cv2.IMWRITE_JPEG_QUALITY, 82], "image/jpeg"),
+}
+
+
+def render_preview(file_path: str, content_type: Optional[str], max_side: int, dest_path: str,
+                   image_format: str = "webp") -> int:
+    """
+    Writes a downscaled image (the first page for PDFs) whose longer side is at
+    most max_side to dest_path, atomically (temp file + rename).
+
+    Returns:
+        int: size of the written file in bytes
+
+    Raises:
+        UnsupportedDocument: if the file cannot be decoded
+    """
+    extension, params, _ = PREVIEW_ENCODINGS[image_format]
+    image = _fit(load_document_image(file_path, content_type, max_side=max_side, grayscale=False), max_side)
+    ok, encoded = cv2.imencode(extension, image, params)
+    if not ok:
+        raise UnsupportedDocument(f"Cannot encode a {image_format} preview")
+    temp_path = f"{dest_path}.{os.getpid()}.part"
+    with open(temp_path, "wb") as f:
+        f.write(encoded.tobytes())
+    os.replace(temp_path, dest_path)
+    return len(encoded)
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from services.document_images import PREVIEW_ENCODINGS, render_preview
+
+logger = logging.getLogger(__name__)
+
+# Derivatives live here, keyed by the source's content hash; evicted least recently used past the size cap.
+# App workers share the directory but each tracks and caps what it has rendered or served itself, so
+# with N workers the directory can grow to about N x PREVIEW_CACHE_MAX_MB
+PREVIEW_CACHE_DIR = os.getenv("PREVIEW_CACHE_DIR", os.path.join("uploads", "previews"))
+PREVIEW_CACHE_MAX_BYTES = int(os.getenv("PREVIEW_CACHE_MAX_MB", "512")) * 1024 * 1024
+PREVIEW_FORMAT = os.getenv("PREVIEW_FORMAT", "webp")
+# Render processes per app worker process (each app worker starts its own pool)
+PREVIEW_WORKERS = int(os.getenv("PREVIEW_WORKERS", "2"))
+
+# Longer side in pixels of each derivative
+PREVIEW_SIZES = {"thumb": 256, "preview": 1280}
+
+
+def preview_url(document_id, size: str = "thumb") -> str:
+    """Link to a document's derivative (see routes.document_files)."""
+    return f"/api/v1/documents/{document_id}/preview?size={size}"
+
+
+class PreviewCache:
+    """
+    Thumbnails and first-page previews of uploaded documents, generated on first
+    request in a small process pool and kept on disk.
+
+    A derivative is named after the source's sha256, so identical uploads share
+    it and it never goes stale. Files are tracked in LRU order (restored from
+    mtimes on start); once their total size passes max_bytes the least recently
+    used are deleted. Concurrent requests for the same derivative share one render.
+
+    The index and the cap are per app worker. A file another worker rendered is
+    a hit and joins this worker's index; one another worker evicted is rendered again.
+    """
+
+    def __init__(self, root: str = PREVIEW_CACHE_DIR, max_bytes: int = PREVIEW_CACHE_MAX_BYTES,
+                 image_format: str = PREVIEW_FORMAT, workers: int = PREVIEW_WORKERS):
+        if image_format not in PREVIEW_ENCODINGS:
+            raise ValueError(f"Unsupported PREVIEW_FORMAT: {image_format}")
+        self.root = root
+        self.max_bytes = max_bytes
+        self.image_format = image_format
+        self.media_type = PREVIEW_ENCODINGS[image_format][2]
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lru: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._loaded = False
+        self._rendering: Dict[str, asyncio.Future] = {}
+        self.stats = {"hits": 0, "misses": 0, "evicted": 0, "failed": 0}
+
+    def path_for(self, sha256: str, size: str) -> str:
+        extension = PREVIEW_ENCODINGS[self.image_format][0]
+        return os.path.join(self.root, sha256[:2], f"{sha256}_{size}{extension}")
+
+    def _load_index(self) -> None:
+        """Rebuilds the LRU order from the files on disk (oldest mtime first)."""
+        entries = []
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(".part"):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, path, stat.st_size))
+        self._lru = OrderedDict((path, size) for _, path, size in sorted(entries))
+        self._total_bytes = sum(self._lru.values())
+        self._loaded = True
+
+    def start(self) -> None:
+        """Loads the cache index and starts the render pool (called from application startup)."""
+        if not self._loaded:
+            os.makedirs(self.root, exist_ok=True)
+            self._load_index()
+            self._evict()
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    async def stop(self) -> None:
+        """Shuts the render pool down (called from application shutdown)."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def get(self, document: dict, size: str = "thumb") -> Tuple[str, str]:
+        """
+        Returns (path, media type) of a document's derivative, rendering it if needed.
+
+        Raises:
+            ValueError: for an unknown size or a document without a stored hash
+            services.document_images.UnsupportedDocument: if the source cannot be decoded
+        """
+        if size not in PREVIEW_SIZES:
+            raise ValueError(f"Unknown preview size: {size} (use one of {', '.join(PREVIEW_SIZES)})")
+        sha256 = document.get("sha256")
+        if not sha256:
+            raise ValueError("Document has no content hash; previews need a re-upload")
+        self.start()
+        path = self.path_for(sha256, size)
+
+        try:
+            # Persist recency for the next restart (and check that the file is still there)
+            os.utime(path)
+            on_disk = os.path.getsize(path)
+        except OSError:
+            on_disk = None
+        if on_disk is not None:
+            self.stats["hits"] += 1
+            # Adopt files rendered by another worker (or since start) into this worker's index
+            self._total_bytes += on_disk - self._lru.pop(path, 0)
+            self._lru[path] = on_disk
+            self._evict(keep=path)
+            return path, self.media_type
+        if path in self._lru:
+            # Evicted by another worker
+            self._total_bytes -= self._lru.pop(path)
+
+        rendering = self._rendering.get(path)
+        if rendering is None:
+            self.stats["misses"] += 1
+            rendering = asyncio.ensure_future(self._render(document, size, path))
+            self._rendering[path] = rendering
+            rendering.add_done_callback(lambda _: self._rendering.pop(path, None))
+        await asyncio.shield(rendering)
+        return path, self.media_type
+
+    async def _render(self, document: dict, size: str, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        loop = asyncio.get_running_loop()
+        try:
+            written = await loop.run_in_executor(
+                self._executor, render_preview, document["file_path"], document.get("content_type"),
+                PREVIEW_SIZES[size], path, self.image_format
+            )
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+        self._total_bytes += written - self._lru.pop(path, 0)
+        self._lru[path] = written
+        self._evict(keep=path)
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        while self._total_bytes > self.max_bytes and self._lru:
+            path, size = next(iter(self._lru.items()))
+            if path == keep:
+                break
+            del self._lru[path]
+            self._total_bytes -= size
+            self.stats["evicted"] += 1
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Already evicted by another worker
+                pass
+            except OSError as e:
+                logger.warning(f"Could not evict preview {path}: {e}")
+
+    def usage(self) -> dict:
+        return {"files": len(self._lru), "bytes": self._total_bytes, "max_bytes": self.max_bytes, **self.stats}
+
+
+document_previews = PreviewCache()
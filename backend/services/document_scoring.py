@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from database_config import collection_document_jobs, collection_uploaded_documents
+from services.document_images import UnsupportedDocument, score_document
+
+logger = logging.getLogger(__name__)
+
+# Scoring processes started by each app worker process (0 = one per CPU core). Every app worker
+# (uvicorn/gunicorn --workers) starts its own pool, so the total is workers x this; keep it small
+DOCUMENT_SCORING_WORKERS = int(os.getenv("DOCUMENT_SCORING_WORKERS", "2")) or os.cpu_count() or 1
+# Idle workers look for jobs queued by other app instances this often
+DOCUMENT_SCORING_POLL_SECONDS = float(os.getenv("DOCUMENT_SCORING_POLL_SECONDS", "5"))
+# A running job whose instance died is picked up again after this long
+DOCUMENT_SCORING_LEASE_SECONDS = float(os.getenv("DOCUMENT_SCORING_LEASE_SECONDS", "300"))
+DOCUMENT_SCORING_MAX_ATTEMPTS = int(os.getenv("DOCUMENT_SCORING_MAX_ATTEMPTS", "3"))
+
+
+class DocumentScoringWorker:
+    """
+    Fills in uploaded_documents.accuracy off the request path.
+
+    Uploads enqueue a job in the document_jobs collection and return. This worker
+    claims jobs with an atomic find_one_and_update (a lease, so several app
+    instances can share the queue and a crashed claim is retried), computes the
+    image metrics in a ProcessPoolExecutor and writes accuracy and the metrics
+    back. Content that was already scored (same sha256) reuses that score.
+    """
+
+    def __init__(self, workers: int = DOCUMENT_SCORING_WORKERS,
+                 poll_interval: float = DOCUMENT_SCORING_POLL_SECONDS,
+                 lease_seconds: float = DOCUMENT_SCORING_LEASE_SECONDS,
+                 max_attempts: int = DOCUMENT_SCORING_MAX_ATTEMPTS):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._tasks = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self.stats = {"scored": 0, "reused": 0, "unsupported": 0, "retried": 0, "failed": 0}
+
+    async def enqueue(self, document_id: ObjectId, file_path: str, content_type: Optional[str] = None,
+                      sha256: Optional[str] = None) -> ObjectId:
+        """Queues an uploaded document for scoring and returns the job id."""
+        now = datetime.utcnow()
+        result = await collection_document_jobs.insert_one({
+            "document_id": document_id,
+            "file_path": file_path,
+            "content_type": content_type,
+            "sha256": sha256,
+            "status": "queued",
+            "attempts": 0,
+            "created_at": now,
+            "available_at": now,
+        })
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return result.inserted_id
+
+    def start(self) -> None:
+        """Starts the process pool and one claim loop per process (called from application startup)."""
+        if self._tasks:
+            return
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Stops claiming jobs and shuts the pool down (called from application shutdown).
+        Jobs that were running are picked up again once their lease expires."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _claim(self) -> Optional[dict]:
+        now = datetime.utcnow()
+        return await collection_document_jobs.find_one_and_update(
+            {"status": {"$in": ["queued", "running"]}, "available_at": {"$lte": now}},
+            {
+                "$set": {"status": "running", "available_at": now + timedelta(seconds=self.lease_seconds),
+                         "started_at": now},
+                "$inc": {"attempts": 1}
+            },
+            sort=[("available_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                job = await self._claim()
+            except Exception as e:
+                logger.error(f"Failed to claim a document scoring job: {e}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self.process(job)
+            except Exception as e:
+                # Recording the outcome failed (e.g. Mongo unavailable); the job's lease runs out
+                # and it is claimed again, so keep the loop alive
+                logger.error(f"Document scoring job {job.get('_id')} could not be recorded: {e}")
+
+    async def _reusable_score(self, job: dict) -> Optional[dict]:
+        if not job.get("sha256"):
+            return None
+        return await collection_uploaded_documents.find_one(
+            {"sha256": job["sha256"], "accuracy": {"$ne": None}, "quality": {"$exists": True}},
+            {"accuracy": 1, "quality": 1}
+        )
+
+    async def process(self, job: dict) -> None:
+        """Scores one claimed job and records the outcome on the document and the job."""
+        try:
+            scored = await self._reusable_score(job)
+            if scored is not None:
+                accuracy, quality = scored["accuracy"], scored["quality"]
+                self.stats["reused"] += 1
+            else:
+                loop = asyncio.get_running_loop()
+                quality = await loop.run_in_executor(self._executor, score_document,
+                                                     job["file_path"], job.get("content_type"))
+                accuracy = quality["accuracy"]
+                self.stats["scored"] += 1
+        except UnsupportedDocument as e:
+            self.stats["unsupported"] += 1
+            await self._finish(job, "unsupported", error=str(e))
+            return
+        except Exception as e:
+            if job.get("attempts", 1) < self.max_attempts:
+                self.stats["retried"] += 1
+                await collection_document_jobs.update_one({"_id": job["_id"]}, {"$set": {
+                    "status": "queued",
+                    "error": str(e),
+                    # Back off: 10 s, 20 s, 40 s, ...
+                    "available_at": datetime.utcnow() + timedelta(seconds=10 * 2 ** (job.get("attempts", 1) - 1))
+                }})
+            else:
+                self.stats["failed"] += 1
+                logger.error(f"Scoring document {job.get('document_id')} failed: {e}")
+                await self._finish(job, "failed", error=str(e))
+            return
+
+        await collection_uploaded_documents.update_one(
+            {"_id": job["document_id"]},
+            {"$set": {"accuracy": accuracy, "quality": quality, "scored_at": datetime.utcnow()}}
+        )
+        await self._finish(job, "done")
+
+    @staticmethod
+    async def _finish(job: dict, status: str, error: Optional[str] = None) -> None:
+        update = {"status": status, "finished_at": datetime.utcnow()}
+        if error is not None:
+            update["error"] = error
+        await collection_document_jobs.update_one({"_id": job["_id"]}, {"$set": update})
+
+    async def queue_stats(self) -> dict:
+        """Jobs per status plus this instance's counters."""
+        counts = {
+            entry["_id"]: entry["count"]
+            async for entry in collection_document_jobs.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}])
+        }
+        return {"jobs": counts, "workers": self.workers, **self.stats}
+
+
+document_scoring = DocumentScoringWorker()
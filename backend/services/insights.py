@@ -1,13 +1,104 @@
-from database_config import collection_apointment, collection_sub_services, collection_main_services
+from database_config import collection_apointment
+from services.appointment_rollups import rollups_ready, get_daily_rollups
+from services.service_catalog import service_catalog
 from schemas.insights import (
     InsightQuery, MainServiceQuery, WeeklyInsightQuery, WeeklyMainServiceQuery, 
     WeeklyCountQuery, WeeklyMainServiceCountQuery, WeeklyCountResponse, DayCount, InsightDetail
 )
 from datetime import date, datetime, timedelta
 from typing import List
+from pydantic import TypeAdapter
 import asyncio
+import numpy as np
 from bson import ObjectId
 
+DAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# Compiled once; validates a whole batch of rows in a single call instead of one model per row
+_INSIGHT_ROWS_ADAPTER = TypeAdapter(List[InsightDetail])
+
+def _parse_extended_datetime(value):
+    """
+    Convert a MongoDB extended JSON {"$date": "..."} value to a datetime; other values pass through
+    """
+    if isinstance(value, dict) and "$date" in value:
+        return datetime.fromisoformat(value["$date"].replace("Z", "+00:00"))
+    return value
+
+def _to_date(value):
+    """
+    Normalise an appointment_date (datetime, date or extended JSON) to a date, or None
+    """
+    value = _parse_extended_datetime(value)
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return None
+
+def _build_insight_rows(appointments: list, sub_service_id: str, query_date: date) -> List[InsightDetail]:
+    """
+    Convert raw appointment documents into InsightDetail rows ordered Monday..Sunday.
+
+    Dates are normalised once into a datetime64 array, so weekday bucketing and the
+    "YYYY-MM-DD" strings are computed for the whole batch at once. Days without
+    appointments get a "no_appointments" placeholder row. All rows are validated
+    together through a precompiled TypeAdapter.
+    """
+    days = np.array([_to_date(a.get("appointment_date")) or query_date for a in appointments], dtype="datetime64[D]")
+    # 1970-01-01 was a Thursday, so shifting by 3 gives Python's weekday() numbering (0=Monday)
+    weekdays = (days.astype(np.int64) + 3) % 7
+    actual_dates = np.datetime_as_string(days, unit="D")
+
+    # Stable sort keeps the database order within each day
+    order = np.argsort(weekdays, kind="stable")
+    bounds = np.searchsorted(weekdays[order], np.arange(8))
+
+    query_date_str = query_date.strftime("%Y-%m-%d")
+    rows = []
+    for day_index, day_name in enumerate(DAY_NAMES):
+        day_positions = order[bounds[day_index]:bounds[day_index + 1]]
+
+        if len(day_positions) == 0:
+            # Add empty appointment for days with no data
+            rows.append({
+                "appointment_id": "",
+                "user_id": "",
+                "sub_service_id": sub_service_id,
+                "sub_service_steps": [],
+                "created_at": None,
+                "is_fully_completed": False,
+                "appointment_date": query_date,
+                "day_of_week": day_name,
+                "actual_date": query_date_str,
+                "appoinment_time": None,
+                "predicted_duration": None,
+                "payment_status": False,
+                "status": "no_appointments"
+            })
+            continue
+
+        for position in day_positions:
+            appointment = appointments[position]
+            appointment_sub_service_id = appointment.get("sub_service_id", "")
+            rows.append({
+                "appointment_id": appointment.get("appointment_id", ""),
+                "user_id": appointment.get("user_id", ""),
+                "sub_service_id": str(appointment_sub_service_id) if isinstance(appointment_sub_service_id, ObjectId) else appointment_sub_service_id,
+                "sub_service_steps": appointment.get("sub_service_steps", []),
+                "created_at": _parse_extended_datetime(appointment.get("created_at")),
+                "is_fully_completed": appointment.get("is_fully_completed", False),
+                "appointment_date": days[position].item(),
+                "day_of_week": day_name,
+                "actual_date": str(actual_dates[position]),
+                "appoinment_time": _parse_extended_datetime(appointment.get("appoinment_time")),
+                "predicted_duration": _parse_extended_datetime(appointment.get("predicted_duration")),
+                "payment_status": appointment.get("payment_status", False),
+                "status": "completed"  # Default status
+            })
+
+    return _INSIGHT_ROWS_ADAPTER.validate_python(rows)
+
 async def get_insights_by_date_sub_service(query: InsightQuery) -> List[InsightDetail]:
     """
     Get appointment details for a specific sub_service and date
@@ -51,90 +142,15 @@ async def get_insights_by_date_sub_service(query: InsightQuery) -> List[InsightD
             }
         ]
         
-        cursor = collection_apointment.aggregate(pipeline)
-        appointments = await cursor.to_list(length=None)
-        
-        # Convert to InsightDetail objects and group by day
-        day_names = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-        appointments_by_day = {day: [] for day in day_names}
-        
-        for appointment in appointments:
-            # Convert MongoDB date to Python date
-            appointment_date = appointment.get("appointment_date")
-            if isinstance(appointment_date, datetime):
-                appointment_date = appointment_date.date()
-            elif isinstance(appointment_date, dict) and "$date" in appointment_date:
-                # Handle MongoDB extended JSON format
-                appointment_date = datetime.fromisoformat(appointment_date["$date"].replace("Z", "+00:00")).date()
-            
-            # Calculate day of week
-            day_of_week = day_names[appointment_date.weekday()] if appointment_date else "Unknown"
-            
-            # Convert ObjectId to string if needed
-            sub_service_id = appointment.get("sub_service_id", "")
-            if isinstance(sub_service_id, ObjectId):
-                sub_service_id = str(sub_service_id)
-            
-            # Convert _id to string if needed
-            appointment_id_str = str(appointment.get("_id", "")) if appointment.get("_id") else None
-            
-            # Handle datetime fields
-            created_at = appointment.get("created_at")
-            if isinstance(created_at, dict) and "$date" in created_at:
-                created_at = datetime.fromisoformat(created_at["$date"].replace("Z", "+00:00"))
-            
-            appoinment_time = appointment.get("appoinment_time")
-            if isinstance(appoinment_time, dict) and "$date" in appoinment_time:
-                appoinment_time = datetime.fromisoformat(appoinment_time["$date"].replace("Z", "+00:00"))
-            
-            predicted_duration = appointment.get("predicted_duration")
-            if isinstance(predicted_duration, dict) and "$date" in predicted_duration:
-                predicted_duration = datetime.fromisoformat(predicted_duration["$date"].replace("Z", "+00:00"))
-            
-            insight_detail = InsightDetail(
-                _id=appointment_id_str,
-                appointment_id=appointment.get("appointment_id", ""),
-                user_id=appointment.get("user_id", ""),
-                sub_service_id=sub_service_id,
-                sub_service_steps=appointment.get("sub_service_steps", []),
-                created_at=created_at,
-                is_fully_completed=appointment.get("is_fully_completed", False),
-                appointment_date=appointment_date or query.date,
-                day_of_week=day_of_week,
-                actual_date=appointment_date.strftime("%Y-%m-%d") if appointment_date else query.date.strftime("%Y-%m-%d"),
-                appoinment_time=appoinment_time,
-                predicted_duration=predicted_duration,
-                payment_status=appointment.get("payment_status", False),
-                status="completed"  # Default status
-            )
-            appointments_by_day[day_of_week].append(insight_detail)
-        
-        # Create final list with all days, including empty ones
-        insight_details = []
-        for day in day_names:
-            if appointments_by_day[day]:
-                insight_details.extend(appointments_by_day[day])
-            else:
-                # Add empty appointment for days with no data
-                empty_appointment = InsightDetail(
-                    _id=None,
-                    appointment_id="",
-                    user_id="",
-                    sub_service_id=query.sub_service_id,
-                    sub_service_steps=[],
-                    created_at=None,
-                    is_fully_completed=False,
-                    appointment_date=query.date,
-                    day_of_week=day,
-                    actual_date=query.date.strftime("%Y-%m-%d"),
-                    appoinment_time=None,
-                    predicted_duration=None,
-                    payment_status=False,
-                    status="no_appointments"
-                )
-                insight_details.append(empty_appointment)
-        
-        return insight_details
+        # The daily rollup tells us up front whether there is anything to scan
+        if await _has_appointments(sub_service_object_id, query.date, query.date):
+            cursor = collection_apointment.aggregate(pipeline)
+            appointments = await cursor.to_list(length=None)
+        else:
+            appointments = []
+        
+        # Convert to InsightDetail rows grouped Monday..Sunday, with placeholders for empty days
+        return _build_insight_rows(appointments, query.sub_service_id, query.date)
         
     except Exception as e:
         raise Exception(f"Error getting insights by sub_service and date: {str(e)}")
@@ -150,25 +166,14 @@ async def get_insights_by_date_main_service(query: MainServiceQuery) -> List[Ins
         except Exception:
             raise ValueError(f"Invalid sub_service_id format: {query.sub_service_id}")
         
-        # First, get the sub_service from sub_services collection using _id
-        sub_service = await collection_sub_services.find_one({"_id": sub_service_object_id})
-        if not sub_service:
-            raise ValueError(f"Sub-service with ID {query.sub_service_id} not found")
-        
-        # Get the main service to verify the relationship
+        # Validate main_service_id format
         try:
             main_service_object_id = ObjectId(query.main_service_id)
         except Exception:
             raise ValueError(f"Invalid main_service_id format: {query.main_service_id}")
         
-        main_service = await collection_main_services.find_one({"_id": main_service_object_id})
-        if not main_service:
-            raise ValueError(f"Main-service with ID {query.main_service_id} not found")
-        
-        # Verify that the sub_service belongs to the specified main_service
-        # Check if the sub_service_id exists in the main_service's sub_services array
-        if sub_service_object_id not in [ObjectId(sub_id) for sub_id in main_service.get("sub_services", [])]:
-            raise ValueError(f"Sub-service {query.sub_service_id} does not belong to main-service {query.main_service_id}")
+        # Verify that the sub_service exists and belongs to the main_service (cached catalog lookup)
+        await service_catalog.verify_sub_service_membership(sub_service_object_id, main_service_object_id)
         
         # Convert date to datetime for MongoDB query
         start_date = datetime.combine(query.date, datetime.min.time())
@@ -202,90 +207,15 @@ async def get_insights_by_date_main_service(query: MainServiceQuery) -> List[Ins
             }
         ]
         
-        cursor = collection_apointment.aggregate(pipeline)
-        appointments = await cursor.to_list(length=None)
-        
-        # Convert to InsightDetail objects and group by day
-        day_names = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-        appointments_by_day = {day: [] for day in day_names}
-        
-        for appointment in appointments:
-            # Convert MongoDB date to Python date
-            appointment_date = appointment.get("appointment_date")
-            if isinstance(appointment_date, datetime):
-                appointment_date = appointment_date.date()
-            elif isinstance(appointment_date, dict) and "$date" in appointment_date:
-                # Handle MongoDB extended JSON format
-                appointment_date = datetime.fromisoformat(appointment_date["$date"].replace("Z", "+00:00")).date()
-            
-            # Calculate day of week
-            day_of_week = day_names[appointment_date.weekday()] if appointment_date else "Unknown"
-            
-            # Convert ObjectId to string if needed
-            sub_service_id = appointment.get("sub_service_id", "")
-            if isinstance(sub_service_id, ObjectId):
-                sub_service_id = str(sub_service_id)
-            
-            # Convert _id to string if needed
-            appointment_id_str = str(appointment.get("_id", "")) if appointment.get("_id") else None
-            
-            # Handle datetime fields
-            created_at = appointment.get("created_at")
-            if isinstance(created_at, dict) and "$date" in created_at:
-                created_at = datetime.fromisoformat(created_at["$date"].replace("Z", "+00:00"))
-            
-            appoinment_time = appointment.get("appoinment_time")
-            if isinstance(appoinment_time, dict) and "$date" in appoinment_time:
-                appoinment_time = datetime.fromisoformat(appoinment_time["$date"].replace("Z", "+00:00"))
-            
-            predicted_duration = appointment.get("predicted_duration")
-            if isinstance(predicted_duration, dict) and "$date" in predicted_duration:
-                predicted_duration = datetime.fromisoformat(predicted_duration["$date"].replace("Z", "+00:00"))
-            
-            insight_detail = InsightDetail(
-                _id=appointment_id_str,
-                appointment_id=appointment.get("appointment_id", ""),
-                user_id=appointment.get("user_id", ""),
-                sub_service_id=sub_service_id,
-                sub_service_steps=appointment.get("sub_service_steps", []),
-                created_at=created_at,
-                is_fully_completed=appointment.get("is_fully_completed", False),
-                appointment_date=appointment_date or query.date,
-                day_of_week=day_of_week,
-                actual_date=appointment_date.strftime("%Y-%m-%d") if appointment_date else query.date.strftime("%Y-%m-%d"),
-                appoinment_time=appoinment_time,
-                predicted_duration=predicted_duration,
-                payment_status=appointment.get("payment_status", False),
-                status="completed"  # Default status
-            )
-            appointments_by_day[day_of_week].append(insight_detail)
-        
-        # Create final list with all days, including empty ones
-        insight_details = []
-        for day in day_names:
-            if appointments_by_day[day]:
-                insight_details.extend(appointments_by_day[day])
-            else:
-                # Add empty appointment for days with no data
-                empty_appointment = InsightDetail(
-                    _id=None,
-                    appointment_id="",
-                    user_id="",
-                    sub_service_id=query.sub_service_id,
-                    sub_service_steps=[],
-                    created_at=None,
-                    is_fully_completed=False,
-                    appointment_date=query.date,
-                    day_of_week=day,
-                    actual_date=query.date.strftime("%Y-%m-%d"),
-                    appoinment_time=None,
-                    predicted_duration=None,
-                    payment_status=False,
-                    status="no_appointments"
-                )
-                insight_details.append(empty_appointment)
-        
-        return insight_details
+        # The daily rollup tells us up front whether there is anything to scan
+        if await _has_appointments(sub_service_object_id, query.date, query.date):
+            cursor = collection_apointment.aggregate(pipeline)
+            appointments = await cursor.to_list(length=None)
+        else:
+            appointments = []
+        
+        # Convert to InsightDetail rows grouped Monday..Sunday, with placeholders for empty days
+        return _build_insight_rows(appointments, query.sub_service_id, query.date)
         
     except Exception as e:
         raise Exception(f"Error getting insights by main_service and date: {str(e)}")
@@ -342,90 +272,15 @@ async def get_weekly_insights_by_sub_service(query: WeeklyInsightQuery) -> List[
             }
         ]
         
-        cursor = collection_apointment.aggregate(pipeline)
-        appointments = await cursor.to_list(length=None)
-        
-        # Convert to InsightDetail objects and group by day
-        day_names = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-        appointments_by_day = {day: [] for day in day_names}
-        
-        for appointment in appointments:
-            # Convert MongoDB date to Python date
-            appointment_date = appointment.get("appointment_date")
-            if isinstance(appointment_date, datetime):
-                appointment_date = appointment_date.date()
-            elif isinstance(appointment_date, dict) and "$date" in appointment_date:
-                # Handle MongoDB extended JSON format
-                appointment_date = datetime.fromisoformat(appointment_date["$date"].replace("Z", "+00:00")).date()
-            
-            # Calculate day of week
-            day_of_week = day_names[appointment_date.weekday()] if appointment_date else "Unknown"
-            
-            # Convert ObjectId to string if needed
-            sub_service_id = appointment.get("sub_service_id", "")
-            if isinstance(sub_service_id, ObjectId):
-                sub_service_id = str(sub_service_id)
-            
-            # Convert _id to string if needed
-            appointment_id_str = str(appointment.get("_id", "")) if appointment.get("_id") else None
-            
-            # Handle datetime fields
-            created_at = appointment.get("created_at")
-            if isinstance(created_at, dict) and "$date" in created_at:
-                created_at = datetime.fromisoformat(created_at["$date"].replace("Z", "+00:00"))
-            
-            appoinment_time = appointment.get("appoinment_time")
-            if isinstance(appoinment_time, dict) and "$date" in appoinment_time:
-                appoinment_time = datetime.fromisoformat(appoinment_time["$date"].replace("Z", "+00:00"))
-            
-            predicted_duration = appointment.get("predicted_duration")
-            if isinstance(predicted_duration, dict) and "$date" in predicted_duration:
-                predicted_duration = datetime.fromisoformat(predicted_duration["$date"].replace("Z", "+00:00"))
-            
-            insight_detail = InsightDetail(
-                _id=appointment_id_str,
-                appointment_id=appointment.get("appointment_id", ""),
-                user_id=appointment.get("user_id", ""),
-                sub_service_id=sub_service_id,
-                sub_service_steps=appointment.get("sub_service_steps", []),
-                created_at=created_at,
-                is_fully_completed=appointment.get("is_fully_completed", False),
-                appointment_date=appointment_date or query.date,
-                day_of_week=day_of_week,
-                actual_date=appointment_date.strftime("%Y-%m-%d") if appointment_date else query.date.strftime("%Y-%m-%d"),
-                appoinment_time=appoinment_time,
-                predicted_duration=predicted_duration,
-                payment_status=appointment.get("payment_status", False),
-                status="completed"  # Default status
-            )
-            appointments_by_day[day_of_week].append(insight_detail)
-        
-        # Create final list with all days, including empty ones
-        insight_details = []
-        for day in day_names:
-            if appointments_by_day[day]:
-                insight_details.extend(appointments_by_day[day])
-            else:
-                # Add empty appointment for days with no data
-                empty_appointment = InsightDetail(
-                    _id=None,
-                    appointment_id="",
-                    user_id="",
-                    sub_service_id=query.sub_service_id,
-                    sub_service_steps=[],
-                    created_at=None,
-                    is_fully_completed=False,
-                    appointment_date=query.date,
-                    day_of_week=day,
-                    actual_date=query.date.strftime("%Y-%m-%d"),
-                    appoinment_time=None,
-                    predicted_duration=None,
-                    payment_status=False,
-                    status="no_appointments"
-                )
-                insight_details.append(empty_appointment)
-        
-        return insight_details
+        # The daily rollup tells us up front whether there is anything to scan
+        if await _has_appointments(sub_service_object_id, monday, sunday):
+            cursor = collection_apointment.aggregate(pipeline)
+            appointments = await cursor.to_list(length=None)
+        else:
+            appointments = []
+        
+        # Convert to InsightDetail rows grouped Monday..Sunday, with placeholders for empty days
+        return _build_insight_rows(appointments, query.sub_service_id, query.date)
         
     except Exception as e:
         raise Exception(f"Error getting weekly insights by sub_service: {str(e)}")
@@ -454,25 +309,14 @@ async def get_weekly_insights_by_main_service(query: WeeklyMainServiceQuery) ->
         except Exception:
             raise ValueError(f"Invalid sub_service_id format: {query.sub_service_id}")
         
-        # First, get the sub_service from sub_services collection using _id
-        sub_service = await collection_sub_services.find_one({"_id": sub_service_object_id})
-        if not sub_service:
-            raise ValueError(f"Sub-service with ID {query.sub_service_id} not found")
-        
-        # Get the main service to verify the relationship
+        # Validate main_service_id format
         try:
             main_service_object_id = ObjectId(query.main_service_id)
         except Exception:
             raise ValueError(f"Invalid main_service_id format: {query.main_service_id}")
         
-        main_service = await collection_main_services.find_one({"_id": main_service_object_id})
-        if not main_service:
-            raise ValueError(f"Main-service with ID {query.main_service_id} not found")
-        
-        # Verify that the sub_service belongs to the specified main_service
-        # Check if the sub_service_id exists in the main_service's sub_services array
-        if sub_service_object_id not in [ObjectId(sub_id) for sub_id in main_service.get("sub_services", [])]:
-            raise ValueError(f"Sub-service {query.sub_service_id} does not belong to main-service {query.main_service_id}")
+        # Verify that the sub_service exists and belongs to the main_service (cached catalog lookup)
+        await service_catalog.verify_sub_service_membership(sub_service_object_id, main_service_object_id)
         
         # Query appointments for the specific sub_service and week
         pipeline = [
@@ -502,90 +346,15 @@ async def get_weekly_insights_by_main_service(query: WeeklyMainServiceQuery) ->
             }
         ]
         
-        cursor = collection_apointment.aggregate(pipeline)
-        appointments = await cursor.to_list(length=None)
-        
-        # Convert to InsightDetail objects and group by day
-        day_names = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-        appointments_by_day = {day: [] for day in day_names}
-        
-        for appointment in appointments:
-            # Convert MongoDB date to Python date
-            appointment_date = appointment.get("appointment_date")
-            if isinstance(appointment_date, datetime):
-                appointment_date = appointment_date.date()
-            elif isinstance(appointment_date, dict) and "$date" in appointment_date:
-                # Handle MongoDB extended JSON format
-                appointment_date = datetime.fromisoformat(appointment_date["$date"].replace("Z", "+00:00")).date()
-            
-            # Calculate day of week
-            day_of_week = day_names[appointment_date.weekday()] if appointment_date else "Unknown"
-            
-            # Convert ObjectId to string if needed
-            sub_service_id = appointment.get("sub_service_id", "")
-            if isinstance(sub_service_id, ObjectId):
-                sub_service_id = str(sub_service_id)
-            
-            # Convert _id to string if needed
-            appointment_id_str = str(appointment.get("_id", "")) if appointment.get("_id") else None
-            
-            # Handle datetime fields
-            created_at = appointment.get("created_at")
-            if isinstance(created_at, dict) and "$date" in created_at:
-                created_at = datetime.fromisoformat(created_at["$date"].replace("Z", "+00:00"))
-            
-            appoinment_time = appointment.get("appoinment_time")
-            if isinstance(appoinment_time, dict) and "$date" in appoinment_time:
-                appoinment_time = datetime.fromisoformat(appoinment_time["$date"].replace("Z", "+00:00"))
-            
-            predicted_duration = appointment.get("predicted_duration")
-            if isinstance(predicted_duration, dict) and "$date" in predicted_duration:
-                predicted_duration = datetime.fromisoformat(predicted_duration["$date"].replace("Z", "+00:00"))
-            
-            insight_detail = InsightDetail(
-                _id=appointment_id_str,
-                appointment_id=appointment.get("appointment_id", ""),
-                user_id=appointment.get("user_id", ""),
-                sub_service_id=sub_service_id,
-                sub_service_steps=appointment.get("sub_service_steps", []),
-                created_at=created_at,
-                is_fully_completed=appointment.get("is_fully_completed", False),
-                appointment_date=appointment_date or query.date,
-                day_of_week=day_of_week,
-                actual_date=appointment_date.strftime("%Y-%m-%d") if appointment_date else query.date.strftime("%Y-%m-%d"),
-                appoinment_time=appoinment_time,
-                predicted_duration=predicted_duration,
-                payment_status=appointment.get("payment_status", False),
-                status="completed"  # Default status
-            )
-            appointments_by_day[day_of_week].append(insight_detail)
-        
-        # Create final list with all days, including empty ones
-        insight_details = []
-        for day in day_names:
-            if appointments_by_day[day]:
-                insight_details.extend(appointments_by_day[day])
-            else:
-                # Add empty appointment for days with no data
-                empty_appointment = InsightDetail(
-                    _id=None,
-                    appointment_id="",
-                    user_id="",
-                    sub_service_id=query.sub_service_id,
-                    sub_service_steps=[],
-                    created_at=None,
-                    is_fully_completed=False,
-                    appointment_date=query.date,
-                    day_of_week=day,
-                    actual_date=query.date.strftime("%Y-%m-%d"),
-                    appoinment_time=None,
-                    predicted_duration=None,
-                    payment_status=False,
-                    status="no_appointments"
-                )
-                insight_details.append(empty_appointment)
-        
-        return insight_details
+        # The daily rollup tells us up front whether there is anything to scan
+        if await _has_appointments(sub_service_object_id, monday, sunday):
+            cursor = collection_apointment.aggregate(pipeline)
+            appointments = await cursor.to_list(length=None)
+        else:
+            appointments = []
+        
+        # Convert to InsightDetail rows grouped Monday..Sunday, with placeholders for empty days
+        return _build_insight_rows(appointments, query.sub_service_id, query.date)
         
     except Exception as e:
         raise Exception(f"Error getting weekly insights by main_service: {str(e)}")
@@ -603,6 +372,93 @@ def get_insights_by_date_main_service_sync(query: MainServiceQuery):
     """
     return asyncio.run(get_insights_by_date_main_service(query))
 
+def _weekly_day_count_pipeline(sub_service_object_id: ObjectId, start_date: datetime, end_date: datetime) -> list:
+    """
+    Build the aggregation that counts a sub_service's appointments per weekday.
+    MongoDB's $dayOfWeek is 1=Sunday .. 7=Saturday, so the group key is shifted
+    to Python's weekday() numbering (0=Monday, 6=Sunday) inside the pipeline.
+    """
+    return [
+        {
+            "$match": {
+                "sub_service_id": sub_service_object_id,
+                "appointment_date": {
+                    "$gte": start_date,
+                    "$lte": end_date
+                }
+            }
+        },
+        {
+            "$group": {
+                "_id": {"$mod": [{"$add": [{"$dayOfWeek": "$appointment_date"}, 5]}, 7]},
+                "count": {"$sum": 1}
+            }
+        }
+    ]
+
+async def _aggregate_weekly_day_counts(sub_service_object_id: ObjectId, start_date: datetime, end_date: datetime) -> dict:
+    """
+    Run the weekday count aggregation and return {weekday_index: count} for all seven days
+    """
+    day_count_map = {i: 0 for i in range(7)}  # 0=Monday, 6=Sunday
+
+    cursor = collection_apointment.aggregate(_weekly_day_count_pipeline(sub_service_object_id, start_date, end_date))
+    async for row in cursor:
+        day_count_map[int(row["_id"])] = row["count"]
+
+    return day_count_map
+
+async def _get_weekly_day_counts(sub_service_object_id: ObjectId, monday: date, start_date: datetime, end_date: datetime) -> dict:
+    """
+    Weekday counts for the week starting on monday. Reads at most seven rollup documents
+    once the rollups are ready, otherwise aggregates AppoinmentNew directly.
+    """
+    if not rollups_ready():
+        return await _aggregate_weekly_day_counts(sub_service_object_id, start_date, end_date)
+
+    rollups = await get_daily_rollups(sub_service_object_id, monday, monday + timedelta(days=6))
+    return {
+        i: rollups.get(monday + timedelta(days=i), {}).get("appointment_count", 0)
+        for i in range(7)
+    }
+
+async def _has_appointments(sub_service_object_id: ObjectId, start_day: date, end_day: date) -> bool:
+    """
+    Check the daily rollups for any appointment between two dates (inclusive).
+    Assumes there may be appointments when the rollups are not ready yet.
+    """
+    if not rollups_ready():
+        return True
+
+    rollups = await get_daily_rollups(sub_service_object_id, start_day, end_day)
+    return any(rollup.get("appointment_count", 0) > 0 for rollup in rollups.values())
+
+def _build_weekly_count_response(sub_service_id: str, monday: date, sunday: date, day_count_map: dict) -> WeeklyCountResponse:
+    """
+    Turn a {weekday_index: count} map into the WeeklyCountResponse returned by the count endpoints
+    """
+    day_counts = []
+
+    for i, day_name in enumerate(DAY_NAMES):
+        count = day_count_map.get(i, 0)
+        # Calculate the actual date for this day of the week
+        day_date = monday + timedelta(days=i)
+
+        day_counts.append(DayCount(
+            day_of_week=day_name,
+            date_number=day_date.strftime("%Y-%m-%d"),
+            appointment_count=count,
+            status="active" if count > 0 else "no_appointments"
+        ))
+
+    return WeeklyCountResponse(
+        sub_service_id=sub_service_id,
+        week_start=monday,
+        week_end=sunday,
+        day_counts=day_counts,
+        total_appointments=sum(day_count_map.values())
+    )
+
 async def get_weekly_appointment_counts(query: WeeklyCountQuery) -> WeeklyCountResponse:
     """
     Get appointment counts for each day of the week for a specific sub_service
@@ -623,68 +479,10 @@ async def get_weekly_appointment_counts(query: WeeklyCountQuery) -> WeeklyCountR
         except Exception:
             raise ValueError(f"Invalid sub_service_id format: {query.sub_service_id}")
         
-        # Query appointments for the specific sub_service and week
-        pipeline = [
-            {
-                "$match": {
-                    "sub_service_id": sub_service_object_id,
-                    "appointment_date": {
-                        "$gte": start_date,
-                        "$lte": end_date
-                    }
-                }
-            },
-            {
-                "$project": {
-                    "appointment_date": 1
-                }
-            }
-        ]
-        
-        cursor = collection_apointment.aggregate(pipeline)
-        appointments = await cursor.to_list(length=None)
-        
-        # Create day count mapping using Python's weekday
-        day_names = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-        day_counts = []
-        total_appointments = 0
-        
-        # Initialize count for each day
-        day_count_map = {i: 0 for i in range(7)}  # 0=Monday, 6=Sunday
-        
-        for appointment in appointments:
-            appointment_date = appointment.get("appointment_date")
-            if isinstance(appointment_date, datetime):
-                day_index = appointment_date.weekday()  # 0=Monday, 6=Sunday
-                day_count_map[day_index] += 1
-                total_appointments += 1
-            elif isinstance(appointment_date, dict) and "$date" in appointment_date:
-                # Handle MongoDB extended JSON format
-                date_obj = datetime.fromisoformat(appointment_date["$date"].replace("Z", "+00:00"))
-                day_index = date_obj.weekday()  # 0=Monday, 6=Sunday
-                day_count_map[day_index] += 1
-                total_appointments += 1
-        
-        for i, day_name in enumerate(day_names):
-            count = day_count_map[i]
-            # Calculate the actual date for this day of the week
-            day_date = monday + timedelta(days=i)
-            
-            day_count = DayCount(
-                day_of_week=day_name,
-                date_number=day_date.strftime("%Y-%m-%d"),
-                appointment_count=count,
-                status="active" if count > 0 else "no_appointments"
-            )
-            day_counts.append(day_count)
-        
-        return WeeklyCountResponse(
-            sub_service_id=query.sub_service_id,
-            week_start=monday,
-            week_end=sunday,
-            day_counts=day_counts,
-            total_appointments=total_appointments
-        )
+        # Count appointments per weekday from the daily rollups (or the server-side pipeline)
+        day_count_map = await _get_weekly_day_counts(sub_service_object_id, monday, start_date, end_date)
+
+        return _build_weekly_count_response(query.sub_service_id, monday, sunday, day_count_map)
         
     except Exception as e:
         raise Exception(f"Error getting weekly appointment counts: {str(e)}")
@@ -709,88 +507,19 @@ async def get_weekly_appointment_counts_main_service(query: WeeklyMainServiceCou
         except Exception:
             raise ValueError(f"Invalid sub_service_id format: {query.sub_service_id}")
         
-        # First, get the sub_service from sub_services collection using _id
-        sub_service = await collection_sub_services.find_one({"_id": sub_service_object_id})
-        if not sub_service:
-            raise ValueError(f"Sub-service with ID {query.sub_service_id} not found")
-        
-        # Get the main service to verify the relationship
+        # Validate main_service_id format
         try:
             main_service_object_id = ObjectId(query.main_service_id)
         except Exception:
             raise ValueError(f"Invalid main_service_id format: {query.main_service_id}")
         
-        main_service = await collection_main_services.find_one({"_id": main_service_object_id})
-        if not main_service:
-            raise ValueError(f"Main-service with ID {query.main_service_id} not found")
-        
-        # Verify that the sub_service belongs to the specified main_service
-        # Check if the sub_service_id exists in the main_service's sub_services array
-        if sub_service_object_id not in [ObjectId(sub_id) for sub_id in main_service.get("sub_services", [])]:
-            raise ValueError(f"Sub-service {query.sub_service_id} does not belong to main-service {query.main_service_id}")
-        
-        # Query appointments for the specific sub_service and week
-        pipeline = [
-            {
-                "$match": {
-                    "sub_service_id": sub_service_object_id,
-                    "appointment_date": {
-                        "$gte": start_date,
-                        "$lte": end_date
-                    }
-                }
-            },
-            {
-                "$project": {
-                    "appointment_date": 1
-                }
-            }
-        ]
+        # Verify that the sub_service exists and belongs to the main_service (cached catalog lookup)
+        await service_catalog.verify_sub_service_membership(sub_service_object_id, main_service_object_id)
         
-        cursor = collection_apointment.aggregate(pipeline)
-        appointments = await cursor.to_list(length=None)
-        
-        # Create day count mapping using Python's weekday
-        day_names = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-        day_counts = []
-        total_appointments = 0
-        
-        # Initialize count for each day
-        day_count_map = {i: 0 for i in range(7)}  # 0=Monday, 6=Sunday
-        
-        for appointment in appointments:
-            appointment_date = appointment.get("appointment_date")
-            if isinstance(appointment_date, datetime):
-                day_index = appointment_date.weekday()  # 0=Monday, 6=Sunday
-                day_count_map[day_index] += 1
-                total_appointments += 1
-            elif isinstance(appointment_date, dict) and "$date" in appointment_date:
-                # Handle MongoDB extended JSON format
-                date_obj = datetime.fromisoformat(appointment_date["$date"].replace("Z", "+00:00"))
-                day_index = date_obj.weekday()  # 0=Monday, 6=Sunday
-                day_count_map[day_index] += 1
-                total_appointments += 1
-        
-        for i, day_name in enumerate(day_names):
-            count = day_count_map[i]
-            # Calculate the actual date for this day of the week
-            day_date = monday + timedelta(days=i)
-            
-            day_count = DayCount(
-                day_of_week=day_name,
-                date_number=day_date.strftime("%Y-%m-%d"),
-                appointment_count=count,
-                status="active" if count > 0 else "no_appointments"
-            )
-            day_counts.append(day_count)
-        
-        return WeeklyCountResponse(
-            sub_service_id=query.sub_service_id,
-            week_start=monday,
-            week_end=sunday,
-            day_counts=day_counts,
-            total_appointments=total_appointments
-        )
+        # Count appointments per weekday from the daily rollups (or the server-side pipeline)
+        day_count_map = await _get_weekly_day_counts(sub_service_object_id, monday, start_date, end_date)
+
+        return _build_weekly_count_response(query.sub_service_id, monday, sunday, day_count_map)
         
     except Exception as e:
         raise Exception(f"Error getting weekly appointment counts for main service: {str(e)}")
@@ -0,0 +1,136 @@
+import asyncio
+import contextvars
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional
+
+from database_config import collection_users, collection_sub_services, collection_required_documents
+
+# Fields the user loaders never return: the base64 profile picture is large and credentials are not needed
+USER_EXCLUDED_FIELDS = {"profile_picture": 0, "hashed_password": 0}
+# Enough to build a display name
+USER_NAME_FIELDS = {"first_name": 1, "last_name": 1}
+
+
+class BatchLoader:
+    """
+    Coalesces load(key) calls made in the same event-loop tick into one batch
+    query and memoises the results for the lifetime of the loader.
+
+    batch_fn receives the distinct keys of a batch and returns {key: document};
+    keys it leaves out resolve to None. Documents are shared between callers,
+    so treat them as read-only.
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]]):
+        self._batch_fn = batch_fn
+        self._cache: Dict[Hashable, asyncio.Future] = {}
+        self._pending: List[Hashable] = []
+
+    def load(self, key: Hashable) -> "asyncio.Future":
+        """Returns an awaitable for the document stored under key (None if there is none)."""
+        future = self._cache.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._cache[key] = future
+            if not self._pending:
+                # Runs after every callback already queued for this tick, so sibling
+                # tasks started by the same asyncio.gather join the batch
+                loop.call_soon(self._dispatch)
+            self._pending.append(key)
+        return future
+
+    def prime(self, key: Hashable, value: Any) -> None:
+        """Stores a document fetched some other way, unless key is already loaded or loading."""
+        if key not in self._cache:
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(value)
+            self._cache[key] = future
+
+    async def load_many(self, keys: Iterable[Hashable]) -> List[Optional[Any]]:
+        """Loads several keys in one batch; results follow the order of keys."""
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def _dispatch(self) -> None:
+        keys, self._pending = self._pending, []
+        asyncio.ensure_future(self._run_batch(keys))
+
+    async def _run_batch(self, keys: List[Hashable]) -> None:
+        try:
+            results = await self._batch_fn(keys)
+        except Exception as e:
+            for key in keys:
+                # Forget the failure so a later load in the same request can retry
+                future = self._cache.pop(key)
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key in keys:
+            future = self._cache[key]
+            if not future.done():
+                future.set_result(results.get(key))
+
+
+async def _find_by_field(collection, field: str, keys: List[Hashable],
+                         projection: Optional[dict] = None) -> Dict[Hashable, dict]:
+    """One $in query on field; the first document per value wins."""
+    documents = {}
+    async for doc in collection.find({field: {"$in": keys}}, projection):
+        documents.setdefault(doc.get(field), doc)
+    return documents
+
+
+class RequestLoaders:
+    """
+    The loaders for one request.
+
+    users_by_id, sub_services and required_documents are keyed by ObjectId,
+    users_by_user_id by the legacy numeric (or string) user_id field and
+    users_by_nic by NIC. User documents come without USER_EXCLUDED_FIELDS;
+    user_names (keyed by ObjectId) returns only the name fields, for listings.
+    """
+
+    __slots__ = ("users_by_id", "users_by_user_id", "users_by_nic", "user_names", "sub_services",
+                 "required_documents")
+
+    def __init__(self):
+        self.users_by_id = BatchLoader(lambda keys: _find_by_field(collection_users, "_id", keys, USER_EXCLUDED_FIELDS))
+        self.users_by_user_id = BatchLoader(
+            lambda keys: _find_by_field(collection_users, "user_id", keys, USER_EXCLUDED_FIELDS)
+        )
+        self.users_by_nic = BatchLoader(lambda keys: _find_by_field(collection_users, "nic", keys, USER_EXCLUDED_FIELDS))
+        self.user_names = BatchLoader(lambda keys: _find_by_field(collection_users, "_id", keys, USER_NAME_FIELDS))
+        self.sub_services = BatchLoader(lambda keys: _find_by_field(collection_sub_services, "_id", keys))
+        self.required_documents = BatchLoader(lambda keys: _find_by_field(collection_required_documents, "_id", keys))
+
+
+_request_loaders: contextvars.ContextVar[Optional[RequestLoaders]] = contextvars.ContextVar(
+    "request_loaders", default=None
+)
+
+
+def get_loaders() -> RequestLoaders:
+    """
+    Returns the loaders of the current HTTP request.
+
+    Outside a request (Socket.IO handlers, startup tasks) a fresh set is
+    returned, so lookups still batch but nothing is memoised beyond the caller.
+    """
+    loaders = _request_loaders.get()
+    return loaders if loaders is not None else RequestLoaders()
+
+
+class RequestLoadersMiddleware:
+    """ASGI middleware that gives every HTTP request its own RequestLoaders."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _request_loaders.set(RequestLoaders())
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_loaders.reset(token)
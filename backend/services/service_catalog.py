@@ -0,0 +1,259 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from typing import Dict, FrozenSet, List, NamedTuple, Optional
+
+from bson import ObjectId
+from pydantic import TypeAdapter
+
+from database_config import collection_main_services, collection_sub_services, collection_required_documents
+from schemas.dashboard import main_service_info_response, sub_service_info_response, sub_service_detail_response
+from services.chat_cluster import CHAT_CHANNEL, create_relay
+
+logger = logging.getLogger(__name__)
+
+# The catalog changes roughly weekly; membership checks run thousands of times an hour
+SERVICE_CATALOG_TTL_SECONDS = float(os.getenv("SERVICE_CATALOG_TTL_SECONDS", "300"))
+# A lookup miss forces a reload at most this often, so unknown ids cannot hammer Mongo
+SERVICE_CATALOG_MISS_REFRESH_SECONDS = float(os.getenv("SERVICE_CATALOG_MISS_REFRESH_SECONDS", "10"))
+
+_MAIN_SERVICES_ADAPTER = TypeAdapter(List[main_service_info_response])
+_SUB_SERVICES_ADAPTER = TypeAdapter(List[sub_service_info_response])
+_SUB_SERVICE_DETAIL_ADAPTER = TypeAdapter(sub_service_detail_response)
+
+
+def _to_object_id(value) -> Optional[ObjectId]:
+    """Converts an ObjectId, its string form or an extended JSON {"$oid": ...} value to an ObjectId."""
+    if isinstance(value, ObjectId):
+        return value
+    if isinstance(value, dict) and "$oid" in value:
+        value = value["$oid"]
+    try:
+        return ObjectId(str(value))
+    except Exception:
+        return None
+
+
+class CachedPayload(NamedTuple):
+    """A response body serialised once at snapshot time, with the ETag clients revalidate against."""
+    body: bytes
+    etag: str
+
+
+def _payload(adapter: TypeAdapter, data) -> CachedPayload:
+    """Validates data against a response schema and serialises it the way FastAPI would (by alias)."""
+    body = adapter.dump_json(adapter.validate_python(data), by_alias=True)
+    return CachedPayload(body=body, etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+
+
+class CatalogSnapshot:
+    """
+    Immutable view of main services, sub-services and required documents.
+
+    Holds the membership index used by the insight services and the
+    pre-serialised dashboard_services responses. A new snapshot replaces the
+    old one wholesale; nothing in a snapshot is modified after it is built.
+    """
+
+    __slots__ = (
+        "version", "loaded_at", "main_to_subs", "sub_service_ids",
+        "main_services", "sub_service_lists", "sub_service_details",
+    )
+
+    def __init__(self, version: int, main_to_subs: Dict[ObjectId, FrozenSet[ObjectId]],
+                 sub_service_ids: FrozenSet[ObjectId], main_services: CachedPayload,
+                 sub_service_lists: Dict[str, CachedPayload], sub_service_details: Dict[str, CachedPayload]):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.main_to_subs = main_to_subs
+        self.sub_service_ids = sub_service_ids
+        self.main_services = main_services
+        self.sub_service_lists = sub_service_lists
+        self.sub_service_details = sub_service_details
+
+
+async def _build_snapshot(version: int) -> CatalogSnapshot:
+    """Loads the three catalog collections (one query each) and pre-renders every dashboard response."""
+    main_docs = await collection_main_services.find({}).to_list(None)
+    sub_docs = await collection_sub_services.find({}).to_list(None)
+    required_docs = await collection_required_documents.find({}).to_list(None)
+
+    main_to_subs: Dict[ObjectId, FrozenSet[ObjectId]] = {}
+    for main_doc in main_docs:
+        sub_ids = (_to_object_id(sub_id) for sub_id in main_doc.get("sub_services") or [])
+        main_to_subs[main_doc["_id"]] = frozenset(sub_id for sub_id in sub_ids if sub_id is not None)
+
+    main_services = _payload(_MAIN_SERVICES_ADAPTER, [
+        {"_id": str(doc["_id"]), "service_name": doc.get("service_name"), "icon_name": doc.get("icon_name")}
+        for doc in main_docs
+    ])
+
+    # Same shape and order as the old $lookup: sub-services in collection order, filtered by membership
+    sub_service_lists: Dict[str, CachedPayload] = {}
+    for main_id, sub_ids in main_to_subs.items():
+        try:
+            sub_service_lists[str(main_id)] = _payload(_SUB_SERVICES_ADAPTER, [
+                {"_id": str(doc["_id"]), "service_name": doc.get("service_name")}
+                for doc in sub_docs if doc["_id"] in sub_ids
+            ])
+        except Exception as e:
+            logger.error(f"Skipping sub-service list for main service {main_id}: {e}")
+
+    sub_service_details: Dict[str, CachedPayload] = {}
+    for sub_doc in sub_docs:
+        required_ids = {_to_object_id(doc_id) for doc_id in sub_doc.get("required_docs") or []}
+        try:
+            sub_service_details[str(sub_doc["_id"])] = _payload(_SUB_SERVICE_DETAIL_ADAPTER, {
+                "_id": str(sub_doc["_id"]),
+                "service_name": sub_doc.get("service_name"),
+                "payment_amount": sub_doc.get("payment_amount"),
+                "required_docs": [
+                    {"_id": str(doc["_id"]), "doc_name": doc.get("doc_name"), "description": doc.get("description")}
+                    for doc in required_docs if doc["_id"] in required_ids
+                ]
+            })
+        except Exception as e:
+            logger.error(f"Skipping details for sub-service {sub_doc['_id']}: {e}")
+
+    return CatalogSnapshot(
+        version=version,
+        main_to_subs=main_to_subs,
+        sub_service_ids=frozenset(doc["_id"] for doc in sub_docs),
+        main_services=main_services,
+        sub_service_lists=sub_service_lists,
+        sub_service_details=sub_service_details,
+    )
+
+
+class ServiceCatalogCache:
+    """
+    In-process, versioned snapshot of the service catalog.
+
+    Membership checks are O(1) set lookups and the dashboard_services endpoints
+    are served from pre-serialised bytes. A background task rebuilds the
+    snapshot every TTL; without it (or after invalidate()) the next reader
+    rebuilds it. Lookup misses trigger a rate-limited rebuild so newly added
+    services show up quickly.
+
+    Each worker holds its own snapshot. With a broker configured
+    (CHAT_MESSAGE_QUEUE_URL), invalidate_everywhere() reaches the other workers
+    through a relay; without one there is a single process to invalidate.
+    """
+
+    def __init__(self, ttl_seconds: float = SERVICE_CATALOG_TTL_SECONDS,
+                 miss_refresh_seconds: float = SERVICE_CATALOG_MISS_REFRESH_SECONDS, relay=None):
+        self.ttl_seconds = ttl_seconds
+        self.miss_refresh_seconds = miss_refresh_seconds
+        self.relay = relay
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._version = 0
+        self._stale = True
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def invalidate(self) -> None:
+        """Marks this worker's snapshot stale; the next reader rebuilds it from the database."""
+        self._stale = True
+
+    async def invalidate_everywhere(self) -> None:
+        """
+        Marks the snapshot stale on this worker and on every other one.
+
+        Raises:
+            Exception: from the broker if the other workers could not be told (this one is invalidated)
+        """
+        self.invalidate()
+        if self.relay is not None:
+            await self.relay.publish({"invalidate": True})
+
+    async def _on_relayed(self, payload: dict) -> None:
+        if payload.get("invalidate"):
+            self.invalidate()
+
+    def _age(self) -> float:
+        if self._snapshot is None or self._stale:
+            return float("inf")
+        return time.monotonic() - self._snapshot.loaded_at
+
+    async def refresh(self) -> CatalogSnapshot:
+        """Builds a new snapshot and swaps it in; readers keep the previous one until then."""
+        snapshot = await _build_snapshot(self._version + 1)
+        self._version = snapshot.version
+        self._snapshot = snapshot
+        self._stale = False
+        logger.info(
+            f"Service catalog snapshot v{snapshot.version} loaded: "
+            f"{len(snapshot.main_to_subs)} main services, {len(snapshot.sub_service_ids)} sub-services"
+        )
+        return snapshot
+
+    async def get_snapshot(self, max_age: Optional[float] = None) -> CatalogSnapshot:
+        """Returns the current snapshot, rebuilding it first if it is older than max_age (default: the TTL)."""
+        max_age = self.ttl_seconds if max_age is None else max_age
+        if self._age() > max_age:
+            async with self._lock:
+                # Another request may have refreshed while we waited for the lock
+                if self._age() > max_age:
+                    await self.refresh()
+        return self._snapshot
+
+    async def _refresh_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.ttl_seconds)
+            try:
+                async with self._lock:
+                    await self.refresh()
+            except Exception as e:
+                # Keep serving the previous snapshot; try again next period
+                logger.error(f"Service catalog background refresh failed: {e}")
+
+    def start_background_refresh(self) -> None:
+        """Starts the periodic rebuild task (called from application startup)."""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_periodically())
+
+    async def start_invalidation_listener(self) -> None:
+        """Subscribes to invalidations from other workers, if there is a relay (called from application startup)."""
+        if self.relay is not None:
+            await self.relay.start(self._on_relayed)
+
+    async def stop_background_refresh(self) -> None:
+        """Cancels the periodic rebuild task and stops listening for invalidations (called from application shutdown)."""
+        if self.relay is not None:
+            await self.relay.stop()
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+    async def verify_sub_service_membership(self, sub_service_id: ObjectId, main_service_id: ObjectId) -> None:
+        """
+        Checks that the sub_service exists and belongs to the main_service.
+
+        Raises:
+            ValueError: with the same messages the insight services have always returned
+        """
+        snapshot = await self.get_snapshot()
+
+        if sub_service_id not in snapshot.sub_service_ids or main_service_id not in snapshot.main_to_subs:
+            # The catalog may have changed since the last load; reload before rejecting
+            snapshot = await self.get_snapshot(self.miss_refresh_seconds)
+
+        if sub_service_id not in snapshot.sub_service_ids:
+            raise ValueError(f"Sub-service with ID {sub_service_id} not found")
+
+        sub_services = snapshot.main_to_subs.get(main_service_id)
+        if sub_services is None:
+            raise ValueError(f"Main-service with ID {main_service_id} not found")
+
+        if sub_service_id not in sub_services:
+            raise ValueError(f"Sub-service {sub_service_id} does not belong to main-service {main_service_id}")
+
+
+# Create a single, shared instance of the cache
+service_catalog = ServiceCatalogCache(relay=create_relay(channel=f"{CHAT_CHANNEL}:catalog"))
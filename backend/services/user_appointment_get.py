@@ -3,6 +3,9 @@ from bson import ObjectId
 from typing import Dict, Any, Optional, List
 from datetime import datetime
 
+from services.document import download_url
+from services.document_previews import preview_url
+
 # Collection names
 SUB_SERVICES_COLLECTION = "sub_services"
 APPOINTMENTS_COLLECTION = "AppoinmentNew"
@@ -135,7 +138,6 @@ async def get_appointment_details_by_id(db: AsyncIOMotorClient, appointment_id:
                         "required_doc_id": {"$ifNull": ["$$doc.required_doc_id", None]},
                         "user_id": {"$ifNull": ["$$doc.user_id", None]},
                         "file_name": {"$ifNull": ["$$doc.file_name", None]},
-                        "file_path": {"$ifNull": ["$$doc.file_path", None]},
                         "accuracy": {"$ifNull": ["$$doc.accuracy", None]},
                         "doc_status": {"$ifNull": ["$$doc.doc_status", "Pending"]},
                         "uploaded_at": {"$ifNull": ["$$doc.uploaded_at", None]}
@@ -155,6 +157,13 @@ async def get_appointment_details_by_id(db: AsyncIOMotorClient, appointment_id:
         
     appointment = result[0]
     
+    # The stored path is internal (a content-addressed blob); clients get the download and preview routes
+    for document in appointment.get("uploaded_documents", []):
+        document["file_path"] = download_url(document["uploaded_document_id"])
+        document["download_url"] = document["file_path"]
+        document["thumbnail_url"] = preview_url(document["uploaded_document_id"], "thumb")
+        document["preview_url"] = preview_url(document["uploaded_document_id"], "preview")
+    
     # Process sub_service_steps if requested and available
     if include_steps and appointment.get("sub_service_steps"):
         appointment["sub_service_steps"] = process_sub_service_steps(appointment["sub_service_steps"])
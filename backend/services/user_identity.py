@@ -0,0 +1,128 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Hashable, List, Optional, Tuple
+
+from bson import ObjectId
+
+from database_config import collection_users
+from services.loaders import USER_EXCLUDED_FIELDS, get_loaders
+
+logger = logging.getLogger(__name__)
+
+# Appointment user_id -> users._id mappings kept in memory
+USER_IDENTITY_CACHE_SIZE = int(os.getenv("USER_IDENTITY_CACHE_SIZE", "10000"))
+# Unknown user_ids are remembered this long, so a user registered later is still found
+USER_IDENTITY_NEGATIVE_TTL_SECONDS = float(os.getenv("USER_IDENTITY_NEGATIVE_TTL_SECONDS", "60"))
+
+_NOT_FOUND = object()
+
+
+def _identity_candidates(user_id) -> List[Tuple[str, object]]:
+    """
+    The (field, value) pairs an appointment user_id may refer to, in priority order:
+    the legacy user_id field, the user's _id as a string, and a numeric id zero-padded to an _id.
+    """
+    candidates = [("user_id", user_id)]
+    if isinstance(user_id, str) and len(user_id) == 24 and ObjectId.is_valid(user_id):
+        candidates.append(("_id", ObjectId(user_id)))
+    elif isinstance(user_id, int) and not isinstance(user_id, bool) and 0 <= user_id < 10 ** 24:
+        padded = str(user_id).zfill(24)
+        if ObjectId.is_valid(padded):
+            candidates.append(("_id", ObjectId(padded)))
+    return candidates
+
+
+class UserIdentityCache:
+    """
+    Bounded LRU of appointment user_id -> users._id, including misses.
+
+    Keys carry the type of the user_id because 42 and "42" match different
+    documents. Negative entries expire after negative_ttl_seconds.
+    """
+
+    def __init__(self, max_size: int = USER_IDENTITY_CACHE_SIZE,
+                 negative_ttl_seconds: float = USER_IDENTITY_NEGATIVE_TTL_SECONDS):
+        self.max_size = max_size
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._entries: "OrderedDict[Tuple[str, Hashable], object]" = OrderedDict()
+
+    @staticmethod
+    def _key(user_id) -> Tuple[str, Hashable]:
+        return type(user_id).__name__, user_id
+
+    def get(self, user_id):
+        """Returns the cached _id, _NOT_FOUND for a remembered miss, or None when nothing is cached."""
+        key = self._key(user_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if isinstance(entry, float):
+            # Negative entry: the value is its expiry time
+            if entry < time.monotonic():
+                del self._entries[key]
+                return None
+            entry = _NOT_FOUND
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, user_id, object_id: Optional[ObjectId]) -> None:
+        """Remembers a resolved _id, or a miss when object_id is None."""
+        key = self._key(user_id)
+        self._entries[key] = object_id if object_id is not None else time.monotonic() + self.negative_ttl_seconds
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def discard(self, user_id) -> None:
+        self._entries.pop(self._key(user_id), None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+async def resolve_user(user_id) -> Optional[dict]:
+    """
+    Finds the user an appointment's user_id refers to.
+
+    Identities already resolved cost a memoised _id load (or nothing for a
+    remembered miss); anything else is one $or query over every candidate,
+    with the legacy user_id field taking precedence over _id matches.
+    """
+    if not user_id:
+        return None
+    try:
+        hash(user_id)
+    except TypeError:
+        return None
+
+    loaders = get_loaders()
+    cached = user_identity_cache.get(user_id)
+    if cached is _NOT_FOUND:
+        return None
+    if cached is not None:
+        user_doc = await loaders.users_by_id.load(cached)
+        if user_doc:
+            return user_doc
+        # The user was deleted or re-keyed since it was cached
+        user_identity_cache.discard(user_id)
+
+    candidates = _identity_candidates(user_id)
+    documents = await collection_users.find(
+        {"$or": [{field: value} for field, value in candidates]}, USER_EXCLUDED_FIELDS
+    ).to_list(None)
+
+    for field, value in candidates:
+        for user_doc in documents:
+            if user_doc.get(field) == value:
+                user_identity_cache.put(user_id, user_doc["_id"])
+                loaders.users_by_id.prime(user_doc["_id"], user_doc)
+                return user_doc
+
+    user_identity_cache.put(user_id, None)
+    return None
+
+
+# Create a single, shared instance of the cache
+user_identity_cache = UserIdentityCache()
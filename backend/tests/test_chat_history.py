@@ -0,0 +1,65 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+from services import chat_timestamps
+from services.chat_bus import chat_message
+from services.chat_web_socket import get_chat_history_page
+
+
+async def _apply_one_by_one(collection, requests, ordered=True):
+    """bulk_write for mongomock, which cannot take pymongo 4.9+ UpdateOne requests."""
+    for request in requests:
+        await collection.update_one(request._filter, request._doc)
+
+
+def test_chat_message_normalises_timestamps_to_utc():
+    assert chat_message("a", "b", "hi", timestamp="2026-03-01T10:00:00+02:00")["timestamp"] == datetime(2026, 3, 1, 8)
+    assert chat_message("a", "b", "hi", timestamp="2026-03-01T08:00:00Z")["timestamp"] == datetime(2026, 3, 1, 8)
+    assert chat_message("a", "b", "hi", timestamp=1772352000000)["timestamp"] == datetime(2026, 3, 1, 8)
+    aware = datetime(2026, 3, 1, 8, tzinfo=timezone.utc)
+    assert chat_message("a", "b", "hi", timestamp=aware)["timestamp"] == datetime(2026, 3, 1, 8)
+    before = datetime.utcnow()
+    stamped = chat_message("a", "b", "hi", timestamp="not a date")["timestamp"]
+    assert stamped.tzinfo is None and before <= stamped <= datetime.utcnow()
+
+
+def test_history_pages_mixed_timestamp_history_after_backfill(monkeypatch):
+    collection = mongomock_motor.AsyncMongoMockClient()["test"]["messages"]
+    monkeypatch.setattr(chat_timestamps, "collection_messages", collection)
+    monkeypatch.setattr(collection, "bulk_write", lambda requests, ordered=True: _apply_one_by_one(collection, requests))
+    start = datetime(2026, 3, 1, 8)
+    # Old rows: client ISO strings (with and without offsets), dates, and one without a timestamp
+    stored = [
+        (start + timedelta(minutes=0)),
+        (start + timedelta(minutes=1)).isoformat() + "Z",
+        (start + timedelta(minutes=2)),
+        (start + timedelta(minutes=3, hours=5, seconds=30)).isoformat() + "+05:00",
+        (start + timedelta(minutes=4)).isoformat(),
+        (start + timedelta(minutes=5)),
+    ]
+    messages = [{"_id": ObjectId(), "sender_id": "u1", "receiver_id": "admin", "content": str(i), "timestamp": t}
+                for i, t in enumerate(stored)]
+    untimed = {"_id": ObjectId.from_datetime(start + timedelta(minutes=10)), "sender_id": "admin",
+               "receiver_id": "u1", "content": "6"}
+
+    async def scenario():
+        await collection.insert_many(messages + [untimed])
+        assert await chat_timestamps.ensure_message_timestamps() == 4
+        assert await chat_timestamps.ensure_message_timestamps() == 0
+
+        query = {"$or": [{"sender_id": "u1"}, {"receiver_id": "u1"}]}
+        seen, before = [], None
+        while True:
+            page = await get_chat_history_page(collection, query, limit=2, before=before)
+            seen = [message["content"] for message in page["messages"]] + seen
+            if not page["has_more"]:
+                break
+            before = page["before"]
+        return seen
+
+    assert asyncio.run(scenario()) == ["0", "1", "2", "3", "4", "5", "6"]
@@ -68,7 +68,7 @@ const AdminTaskDetailsPage = () => {
         accuracy: uploadedDoc.accuracy ? `${uploadedDoc.accuracy}%` : 'N/A',
         status: uploadedDoc.doc_status,
         fileName: uploadedDoc.file_name,
-        filePath: uploadedDoc.file_path,
+        filePath: uploadedDoc.download_url || uploadedDoc.file_path,
         uploadedDocId: uploadedDoc._id // Pass the uploaded doc ID
       };
     }
@@ -83,18 +83,30 @@ const AdminTaskDetailsPage = () => {
   };
   
   // Handler for viewing a document
-  const handleViewDocument = (filePath) => {
+  const handleViewDocument = async (filePath) => {
     if (!filePath) {
       console.error("File path is not available.");
       return;
     }
     const baseURL = 'http://127.0.0.1:8000';
-    // Replace backslashes with forward slashes for a valid URL
-    const correctedPath = filePath.replace(/\\/g, '/');
-    const fullUrl = `${baseURL}/${correctedPath}`;
-    
-    console.log('Opening document:', fullUrl);
-    window.open(fullUrl, '_blank', 'noopener,noreferrer');
+    // filePath is the document download route (/api/v1/documents/{id}/file), which needs the bearer token
+    const fullUrl = `${baseURL}${filePath.startsWith('/') ? '' : '/'}${filePath}`;
+
+    try {
+      const response = await fetch(fullUrl, {
+        headers: { Authorization: `Bearer ${localStorage.getItem('token')}` }
+      });
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+      const objectUrl = URL.createObjectURL(await response.blob());
+      window.open(objectUrl, '_blank', 'noopener,noreferrer');
+      // Give the new tab time to load the document before the URL is revoked
+      setTimeout(() => URL.revokeObjectURL(objectUrl), 60000);
+    } catch (err) {
+      console.error('Error opening document:', err);
+      alert('Could not open the document.');
+    }
   };
 
   // Handler for approving a document
@@ -86,11 +86,19 @@ const AdminTasks = () => {
       setIsLoading(true);
       setError(null);
       try {
-        const response = await axios.get(
-          `http://127.0.0.1:8000/api/v1/api/admin/dashboard-full/appointments_by_subservice/${subServiceId}`
-        );
+        // Fetch page by page, following next_cursor until the last page
+        const apiAppointments = [];
+        let after = null;
+        do {
+          const response = await axios.get(
+            `http://127.0.0.1:8000/api/v1/api/admin/dashboard-full/appointments_by_subservice/${subServiceId}`,
+            { params: { limit: 500, ...(after ? { after } : {}) } }
+          );
+          apiAppointments.push(...response.data.appointments);
+          after = response.data.next_cursor;
+        } while (after);
         
-        const formattedAppointments = response.data.appointments.map(apiAppt => ({
+        const formattedAppointments = apiAppointments.map(apiAppt => ({
           id: apiAppt._id,
           name: apiAppt.user_name,
           time: apiAppt.appoinment_time 